@@ -0,0 +1,307 @@
+"""
+Offline export of a saved stim list to video, without running it on the
+stim display. Stims are deterministic given their seeds, so the frames of a
+protocol are split into chunks that are rendered in parallel, each in its own
+process with its own window, and the movies of the chunks are joined at the
+end. Each chunk builds the whole program, then draws only its own frames;
+stims animated on the fly (e.g. noise) are sought to the start of the chunk
+directly (see :py:meth:`pyStim.FrameProgram.fast_forward`).
+
+Without a display, e.g. on an analysis node, windows are made headless
+(pyglet with EGL), which falls back to software rendering without a GPU.
+Pyglet only reads the headless option when first imported, so headless
+chunks are always rendered in fresh processes.
+Alternatively, frames can be drawn with numpy by :doc:`SoftRender`, which
+needs no OpenGL at all.
+
+Run from the root of the repository, e.g.::
+
+    python pyStim/ExportVideo.py pyStim/psychopy/stims/default.txt -w 8
+
+Needs ffmpeg, like capturing.
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import pickle
+import shutil
+import subprocess
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from time import strftime, localtime
+
+from pyStim import (GlobalDefaults, MyWindow, StimInfo, CaptureWriter,
+                    build_program, config)
+
+#: Global defaults overridden when exporting, as there is no display.
+export_defaults = dict(fullscreen=False,
+                       small_win=False,
+                       framepack=False,
+                       position=[0, 0],
+                       capture=False,
+                       log=False,
+                       record_noise=False)
+
+
+def load_stims(path):
+    """Loads a stim list saved from the GUI.
+
+    :param path: saved stim list.
+    :return: list of StimInfo classes.
+    """
+    with open(path, 'rb') as f:
+        saved = pickle.load(f)
+
+    return parse_stims(saved)
+
+
+def parse_stims(saved):
+    """Makes stims to run from saved parameters, as saved from the GUI or
+    logged.
+
+    :param list saved: dicts of parameters, with stim type under 'move_type'.
+    :return: list of StimInfo classes.
+    """
+    class_names = {'StaticStim': 'static',
+                   'MovingStim': 'moving',
+                   'RandomlyMovingStim': 'random',
+                   'TableStim': 'table',
+                   'ImageJumpStim': 'jump'}
+
+    stim_list = []
+
+    for i, params in enumerate(saved):
+        params = dict(params)
+        stim_type = params.pop('move_type')
+        stim_type = class_names.get(stim_type, stim_type)
+
+        # parameter grids are not run
+        params.pop('grid_dict', None)
+        params.pop('control_list', None)
+
+        stim_list.append(StimInfo(stim_type, params, i))
+
+    return stim_list
+
+
+def load_globals(name, path=None):
+    """Loads global defaults saved from the GUI.
+
+    :param name: name they were saved under.
+    :param path: file they were saved to, global_defaults.json in the data
+     folder by default.
+    :return: dict of global defaults, as passed to GlobalDefaults.
+    """
+    if path is None:
+        path = os.path.join(config.get('GUI', 'data_dir'),
+                            'global_defaults.json')
+
+    with open(path, 'r') as f:
+        saved = json.load(f)
+
+    global_defaults = saved[name]
+    # saved as in GUI, not zero based
+    global_defaults['screen_num'] -= 1
+
+    return global_defaults
+
+
+def chunk_range(chunk, num_chunks, num_frames):
+    """Frames rendered by a chunk, so chunks together cover every frame once.
+
+    :param int chunk: chunk number.
+    :param int num_chunks: number of chunks.
+    :param int num_frames: number of frames in program.
+    :return: tuple of first and last (exclusive) frame.
+    """
+    return (chunk * num_frames // num_chunks,
+            (chunk + 1) * num_frames // num_chunks)
+
+
+def render_chunk(stim_list, defaults, chunk, num_chunks, path,
+                 backend=None):
+    """Renders one chunk of frames to a movie. Runs in worker processes.
+
+    :param list stim_list: list of StimInfo classes.
+    :param dict defaults: global defaults, as in GlobalDefaults.
+    :param int chunk: chunk number.
+    :param int num_chunks: number of chunks.
+    :param path: folder to save movies of chunk in.
+    :param backend: renderer, see :py:attr:`pyStim.MyWindow.backend`; None
+     for the one in config.
+    :return: tuple of paths of color and grayscale movies (None if chunk has
+     no frames), and number of frames rendered.
+    """
+    GlobalDefaults.defaults.update(defaults)
+    GlobalDefaults.defaults.update(export_defaults)
+
+    if backend is not None:
+        MyWindow.backend = backend
+
+    MyWindow.make_win(labjack=False)
+    program = None
+
+    try:
+        program = build_program(stim_list)
+
+        start, end = chunk_range(chunk, num_chunks, program.num_frames)
+        if start == end:
+            return None, 0
+
+        program.fast_forward(start)
+
+        capture = CaptureWriter(path, '_part_{:03d}'.format(chunk),
+                                MyWindow.win.size,
+                                GlobalDefaults['frame_rate'])
+
+        for frame in range(start, end):
+            program.draw(frame)
+
+            buffer = capture.next_buffer()
+            MyWindow.read_frame(buffer)
+            capture.push(buffer)
+            MyWindow.win.clearBuffer()
+
+        capture.close()
+
+    finally:
+        if program is not None:
+            for stim in program.stims:
+                if stim.ring is not None:
+                    stim.ring.stop()
+
+        MyWindow.close_win()
+
+    return capture.files, end - start
+
+
+def concat_movies(parts, out):
+    """Joins movies end to end, without encoding again.
+
+    :param list parts: paths of movies, in order.
+    :param out: path of joined movie.
+    :raises: IOError: if ffmpeg cannot be run or fails.
+    """
+    list_file = out + '.txt'
+
+    with open(list_file, 'w') as f:
+        for part in parts:
+            f.write("file '{}'\n".format(os.path.abspath(part)))
+
+    try:
+        subprocess.check_call(['ffmpeg', '-y',
+                               '-f', 'concat',
+                               '-safe', '0',
+                               '-i', list_file,
+                               '-c', 'copy',
+                               out],
+                              stdout=subprocess.DEVNULL,
+                              stderr=subprocess.DEVNULL)
+    except (OSError, subprocess.CalledProcessError) as e:
+        raise IOError('Could not join movies with ffmpeg ({}).'.format(e))
+    finally:
+        os.remove(list_file)
+
+
+def export(stim_list, path, name='', workers=None, num_chunks=None,
+           headless=None, backend=None):
+    """Renders a stim list to video in parallel, as capture would make it.
+    Uses the current global defaults, except those needing a display.
+
+    :param list stim_list: list of StimInfo classes.
+    :param path: folder to save movies in. Made if needed.
+    :param name: name to add to movie file names.
+    :param workers: number of processes to render in; None to use one per
+     cpu, 1 to render in this process unless headless.
+    :param num_chunks: number of chunks to split frames into, one per worker
+     by default.
+    :param headless: whether to make windows without a display; None to do
+     so on linux if there is no display.
+    :param backend: renderer, 'psychopy' or 'numpy'; None for the one in
+     config.
+    :return: list of paths of color and grayscale movies.
+    """
+    if workers is None:
+        workers = os.cpu_count()
+    if num_chunks is None:
+        num_chunks = workers
+    if headless is None:
+        headless = sys.platform.startswith('linux') and \
+            'DISPLAY' not in os.environ
+
+    # read by pyglet when imported in workers; already imported here
+    if headless:
+        os.environ['PYGLET_HEADLESS'] = 'True'
+
+    defaults = dict(GlobalDefaults.defaults)
+    folders = [os.path.join(path, 'part_{:03d}'.format(i))
+               for i in range(num_chunks)]
+    args = ([stim_list] * num_chunks, [defaults] * num_chunks,
+            range(num_chunks), [num_chunks] * num_chunks, folders,
+            [backend] * num_chunks)
+
+    if workers == 1 and not headless:
+        results = list(map(render_chunk, *args))
+    else:
+        # fresh processes, as windows cannot be forked
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=workers,
+                                 mp_context=context) as executor:
+            results = list(executor.map(render_chunk, *args))
+
+    parts = [files for files, num_frames in results if num_frames]
+    outputs = [os.path.join(path, 'capture_video' + name + '.mpg'),
+               os.path.join(path, 'capture_video' + name + '_gray.mpg')]
+
+    for i, out in enumerate(outputs):
+        concat_movies([files[i] for files in parts], out)
+
+    for folder in folders:
+        shutil.rmtree(folder, ignore_errors=True)
+
+    print('\n{} frames exported to: {}'.format(
+        sum(num_frames for _, num_frames in results), path))
+
+    return outputs
+
+
+def main(args=None):
+    """Exports a saved stim list from the command line.
+
+    :param args: command line arguments, sys.argv by default.
+    """
+    parser = argparse.ArgumentParser(
+        description='Exports a saved stim list to video.')
+    parser.add_argument('stims', help='stim list saved from the GUI')
+    parser.add_argument('-g', '--globals', help='name of saved global '
+                        'defaults to use')
+    parser.add_argument('-w', '--workers', type=int, help='number of '
+                        'processes, one per cpu by default')
+    parser.add_argument('-c', '--chunks', type=int, help='number of chunks, '
+                        'one per worker by default')
+    parser.add_argument('-n', '--numpy', action='store_true', help='draw '
+                        'with numpy instead of OpenGL')
+    parser.add_argument('-o', '--out', help='folder to save movies in, in '
+                        'capture folder by default')
+    args = parser.parse_args(args)
+
+    if args.globals is not None:
+        GlobalDefaults(**load_globals(args.globals))
+
+    time_string = strftime('%Y_%m_%d_%H%M%S', localtime())
+    path = args.out
+    if path is None:
+        name = os.path.splitext(os.path.basename(args.stims))[0]
+        path = os.path.join(os.path.abspath(config.get('StimProgram',
+                                                       'capture_dir')),
+                            'export_' + time_string + '_' + name)
+
+    export(load_stims(args.stims), path, '_' + time_string,
+           workers=args.workers, num_chunks=args.chunks,
+           backend='numpy' if args.numpy else None)
+
+
+if __name__ == '__main__':
+    main()
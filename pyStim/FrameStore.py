@@ -0,0 +1,251 @@
+"""
+Chunked on-disk storage of displayed frames, e.g. noise boards, for offline
+analysis such as reverse correlation. Each frame is stored as a row of uint8
+palette indices or pixel values; boards with only 2 levels are bit packed.
+Frames are grouped into chunks, each a separate .npy file that can be memory
+mapped, or optionally a compressed .npz file, so reading any one frame only
+decodes its own chunk.
+
+A store is a folder with::
+
+    meta.json          frame layout, number of frames, palette, etc.
+    index.npy          display frame number of each stored frame
+    frames_00000.npy   first chunk of frames
+    frames_00001.npy   ...
+
+with .npz chunks instead if compressed.
+
+Frames are written by :py:class:`FrameWriter`, which hands full chunks to a
+background thread so the render loop never waits on the disk, and read back
+by :py:class:`FrameReader`.
+"""
+
+import json
+import os
+import queue
+import threading
+
+import numpy
+
+
+class FrameWriter(object):
+    """Appends frames to a store. Frames are copied into preallocated chunk
+    buffers; full chunks are saved in a background thread.
+    """
+    def __init__(self, path, num_values, levels=256, chunk_frames=1024,
+                 num_buffers=4, compress=False, meta=None):
+        """
+        :param path: folder to write store to. Made if needed.
+        :param int num_values: number of values in each frame.
+        :param int levels: number of distinct values. If 2 or less, frames
+         are bit packed.
+        :param int chunk_frames: number of frames in each chunk file.
+        :param int num_buffers: number of chunk buffers. Only waits on the
+         disk if all are waiting to be saved.
+        :param bool compress: whether to save chunks compressed. Lossless,
+         but chunks can no longer be memory mapped.
+        :param dict meta: extra information to save in meta.json.
+        """
+        self.path = path
+        self.num_values = num_values
+        self.levels = levels
+        self.packed = levels <= 2
+        self.chunk_frames = chunk_frames
+        self.compress = compress
+        self.meta = meta if meta is not None else {}
+
+        if not os.path.exists(path):
+            os.makedirs(path)
+
+        self.free = queue.Queue()
+        for _ in range(num_buffers):
+            self.free.put(numpy.empty((chunk_frames, num_values),
+                                      dtype=numpy.uint8))
+        self.to_save = queue.Queue()
+
+        self.buffer = self.free.get()
+        self.position = 0
+        self.num_chunks = 0
+        self.frames = []
+        self.error = None
+
+        self.thread = threading.Thread(target=self.save_chunks)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def write(self, values, frame):
+        """Appends a frame.
+
+        :param values: uint8 values of frame, e.g. palette indices.
+        :param int frame: display frame number on which it was first shown.
+        """
+        self.buffer[self.position] = values
+        self.frames.append(frame)
+        self.position += 1
+
+        if self.position == self.chunk_frames:
+            self.flush()
+
+    def flush(self):
+        """Hands current chunk to background thread, if it has any frames.
+        """
+        if self.position == 0:
+            return
+
+        self.to_save.put((self.num_chunks, self.buffer, self.position))
+        self.num_chunks += 1
+
+        self.buffer = self.free.get()
+        self.position = 0
+
+    def save_chunks(self):
+        """Saves chunks as they come in. Runs in background thread.
+        """
+        while True:
+            item = self.to_save.get()
+            if item is None:
+                return
+
+            chunk, buffer, num_frames = item
+
+            try:
+                frames = buffer[:num_frames]
+                if self.packed:
+                    frames = numpy.packbits(frames, axis=1)
+
+                name = os.path.join(self.path, 'frames_{:05d}'.format(chunk))
+                if self.compress:
+                    numpy.savez_compressed(name + '.npz', frames=frames)
+                else:
+                    numpy.save(name + '.npy', frames)
+
+            except (IOError, OSError) as e:
+                self.error = e
+
+            self.free.put(buffer)
+
+    def close(self):
+        """Saves any remaining frames, frame index, and meta data, then
+        waits for background thread to finish.
+        """
+        self.flush()
+        self.to_save.put(None)
+        self.thread.join()
+
+        numpy.save(os.path.join(self.path, 'index.npy'),
+                   numpy.array(self.frames, dtype=numpy.int64))
+
+        meta = dict(self.meta,
+                    num_values=self.num_values,
+                    levels=self.levels,
+                    packed=self.packed,
+                    compressed=self.compress,
+                    chunk_frames=self.chunk_frames,
+                    num_chunks=self.num_chunks,
+                    num_frames=len(self.frames))
+
+        with open(os.path.join(self.path, 'meta.json'), 'w') as f:
+            json.dump(meta, f, indent=4)
+
+        if self.error is not None:
+            print('Frame store error:', self.error)
+
+
+class FrameReader(object):
+    """Reads frames from a store written by :py:class:`FrameWriter`. Chunks
+    are memory mapped, so only those used are read from disk. Compressed
+    chunks are decoded whole; the last one decoded is kept, so reading frames
+    in order decodes each chunk once.
+    """
+    def __init__(self, path):
+        """
+        :param path: folder of store.
+        """
+        self.path = path
+
+        with open(os.path.join(path, 'meta.json'), 'r') as f:
+            self.meta = json.load(f)
+
+        self.num_values = self.meta['num_values']
+        self.chunk_frames = self.meta['chunk_frames']
+        self.num_chunks = self.meta['num_chunks']
+        self.packed = self.meta['packed']
+        self.compressed = self.meta.get('compressed', False)
+        #: Shape of each frame, if in meta data, e.g. (rows, columns).
+        self.frame_shape = tuple(self.meta.get('frame_shape',
+                                               [self.num_values]))
+
+        self.cached = None
+
+        #: Display frame number of each stored frame.
+        self.index = numpy.load(os.path.join(path, 'index.npy'))
+
+    def __len__(self):
+        return len(self.index)
+
+    def times(self, frame_rate=None):
+        """Time at which each stored frame was first shown.
+
+        :param frame_rate: frame rate of display, if not in meta data.
+        :return: array of times in seconds.
+        """
+        if frame_rate is None:
+            frame_rate = self.meta['frame_rate']
+
+        return self.index / float(frame_rate)
+
+    def chunk(self, i):
+        """Gets frames of one chunk.
+
+        :param int i: chunk number.
+        :return: uint8 array of frames, shaped (frames, values). Memory
+         mapped unless bit packed or compressed.
+        """
+        if self.cached is not None and self.cached[0] == i:
+            return self.cached[1]
+
+        name = os.path.join(self.path, 'frames_{:05d}'.format(i))
+
+        if self.compressed:
+            with numpy.load(name + '.npz') as archive:
+                frames = archive['frames']
+        else:
+            frames = numpy.load(name + '.npy', mmap_mode='r')
+
+        if self.packed:
+            frames = numpy.unpackbits(frames, axis=1, count=self.num_values)
+
+        if self.packed or self.compressed:
+            self.cached = (i, frames)
+
+        return frames
+
+    def chunks(self):
+        """Iterates over chunks in order.
+
+        :return: generator of first frame number and frames of each chunk.
+        """
+        for i in range(self.num_chunks):
+            yield i * self.chunk_frames, self.chunk(i)
+
+    def __getitem__(self, i):
+        """Gets one frame.
+
+        :param int i: stored frame number.
+        :return: uint8 array of values.
+        """
+        if not -len(self) <= i < len(self):
+            raise IndexError('frame {} out of range'.format(i))
+
+        chunk, position = divmod(i % len(self), self.chunk_frames)
+
+        return numpy.array(self.chunk(chunk)[position])
+
+    def image(self, i):
+        """Gets one frame shaped as stored, e.g. a captured frame as
+        (rows, columns, channels), top row first.
+
+        :param int i: stored frame number.
+        :return: uint8 array shaped frame_shape.
+        """
+        return self[i].reshape(self.frame_shape)
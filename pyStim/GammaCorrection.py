@@ -39,6 +39,7 @@ correction.
 
 import os.path
 import pickle
+from concurrent.futures import ThreadPoolExecutor
 
 import configparser
 import matplotlib.pyplot as plt
@@ -67,6 +68,16 @@ class GammaValues(object):
     :param tuple g: Tuple of spline, slope, intercept for green gun
     :param tuple b: Tuple of spline, slope, intercept for blue gun
     """
+    # class attributes, so that instances pickled before lookup tables
+    # existed still unpickle with them
+    #: Lookup table of corrected values for each gun, as 3 x lut_size. None
+    #: if corrections are calculated from the splines.
+    lut = None
+    #: Number of entries per gun in the lookup table.
+    lut_size = None
+    #: Number of values above which lookups are split across threads.
+    lut_thread_min = 2 ** 20
+
     def __init__(self, r, g, b):
         """
         Instantiates class, pulls values out of tuples.
@@ -124,10 +135,119 @@ class GammaValues(object):
         else:
             q.put(b_adj)
 
+    def make_lut(self, size=4096):
+        """
+        Samples the correction of each gun once into a dense lookup table.
+        Once made, calls to the instance use the table instead of evaluating
+        the splines. Use the bit depth of the display (e.g. 256 for 8 bit)
+        for a table that is exact at every displayable level.
+
+        :param int size: Number of entries per gun.
+        :return: Lookup table, as 3 x size.
+        """
+        x = numpy.linspace(-1, 1, size)
+
+        lut = numpy.vstack([self.r_correct(x),
+                            self.g_correct(x),
+                            self.b_correct(x)])
+
+        self.lut = numpy.clip(lut, -1, 1).astype(numpy.float32)
+        self.lut_size = size
+
+        return self.lut
+
+    def apply_lut(self, color, channel=None, out=None, threads=None):
+        """
+        Gamma corrects using the lookup table from make_lut(), as a single
+        vectorized gather. Works on arrays of any shape: if channel is None,
+        the last axis is RGB(A) and alpha is left untouched, otherwise every
+        value is corrected for that channel.
+
+        :param color: Color(s) to correct, scaled from -1 to 1.
+        :param int channel: Color channel, if all values are from one channel.
+        :param out: Array to write corrected values to, can be color to
+         correct in place. Keeps dtype of color (i.e. float32) if None.
+        :param int threads: Number of threads to split large arrays across.
+         Defaults to number of cpus, for arrays bigger than lut_thread_min.
+        :return: Corrected color(s).
+        :raises: ValueError: if channel is None and last axis is not RGB(A).
+        """
+        if self.lut is None:
+            self.make_lut()
+
+        channel = None if channel == 3 else channel
+        color = numpy.asarray(color)
+
+        if out is None:
+            out = numpy.array(color, dtype=numpy.result_type(color,
+                                                             numpy.float32))
+        elif out is not color:
+            numpy.copyto(out, color)
+
+        if channel is None:
+            if out.ndim == 0 or out.shape[-1] not in [3, 4]:
+                raise ValueError('Cannot gamma correct colors shaped {} '
+                                 'without a channel; last axis must be RGB '
+                                 'or RGBA.'.format(out.shape))
+
+            # offset indices into flattened table by gun
+            table = self.lut.ravel()
+            offsets = numpy.arange(3) * self.lut_size
+            values = out[..., :3]
+
+        else:
+            table = self.lut[channel]
+            offsets = 0
+            # view, so single colors are also written to out
+            values = out.reshape(-1) if out.ndim == 0 else out
+
+        table = table.astype(out.dtype, copy=False)
+
+        if threads is None:
+            threads = os.cpu_count() if values.size > self.lut_thread_min else 1
+
+        if values.ndim < 2 or threads <= 1:
+            self._lut_gather(values, table, offsets)
+
+        else:
+            bounds = numpy.linspace(0, values.shape[0], threads + 1).astype(int)
+            chunks = [values[lo:hi] for lo, hi in zip(bounds, bounds[1:])]
+
+            with ThreadPoolExecutor(threads) as executor:
+                # list to raise any errors from threads
+                list(executor.map(lambda chunk: self._lut_gather(chunk, table,
+                                                                 offsets),
+                                  chunks))
+
+        if out.ndim == 0:
+            return out[()]
+
+        return out
+
+    def _lut_gather(self, values, table, offsets):
+        """
+        Replaces values in place with their entries in the table.
+
+        :param values: Array view of values to correct.
+        :param table: Flattened lookup table, same dtype as values.
+        :param offsets: Offsets into table for each index of the last axis.
+        """
+        half = (self.lut_size - 1) / 2.
+
+        # scale from (-1, 1) to (0, lut_size - 1), rounding on conversion
+        idx = values * half
+        idx += half + 0.5
+        numpy.clip(idx, 0, self.lut_size - 1, out=idx)
+        idx = idx.astype(numpy.intp)
+        idx += offsets
+
+        numpy.take(table, idx, out=values, mode='clip')
+
     def __call__(self, color, channel=None):
         """
         Calculates adjusted color value. Allows getting corrected values by
-        making calls to instance.
+        making calls to instance. Uses the lookup table if one was made with
+        make_lut(), otherwise the splines.
 
         :param color: List of RGB values, scaled from -1 to 1, or color
          from a single channel.
@@ -137,6 +257,9 @@ class GammaValues(object):
         """
         channel = None if channel == 3 else channel
 
+        if self.lut is not None:
+            return self.apply_lut(color, channel=channel)
+
         if channel is None:
             # if entire texture
             if len(numpy.shape(color)) == 3:
@@ -264,13 +387,8 @@ class GammaValues(object):
                 adj = self.b_correct(color)
                 # print 'done'
 
-            adj_color = adj
-
-            # add ceiling/floor
-            if adj_color >= 1:
-                adj_color = 1.0
-            elif adj_color <= -1:
-                adj_color = -1.0
+            # add ceiling/floor, works for single colors and arrays
+            adj_color = numpy.clip(adj, -1, 1)
 
         return adj_color
 
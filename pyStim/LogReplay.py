@@ -0,0 +1,169 @@
+"""
+Random access to the frames of a logged run. :py:func:`render_frame` rebuilds
+the image shown on any frame from the log folder written by
+:py:func:`pyStim.log_stats`, without drawing the frames before it:
+
+* trajectories, orientations, timing, and phase are worked out for every
+  frame when stims are built (see :py:class:`pyStim.FrameProgram`), so are
+  looked up.
+* noise is drawn from counter based random streams, jumped straight to the
+  noise frame shown (see :py:class:`pyStim.NoiseEngine`).
+* image jump slices are cut and shuffled straight from their seeds.
+
+Stims are built once per log, drawn with numpy (:doc:`SoftRender`), and kept,
+so fetching many frames in any order only draws each one, e.g.::
+
+    frame = render_frame('logs/2024_01_05/13h02m11s', 1200)
+
+Frames are numbered from the start of a rep; every rep shows the same frames.
+Movies are not supported. Logs from before global defaults were logged are
+rebuilt with the current global defaults.
+"""
+
+import glob
+import json
+import os
+import pickle
+from contextlib import contextmanager
+
+import numpy
+
+from pyStim import GlobalDefaults, MyWindow, build_program
+from ExportVideo import export_defaults, parse_stims
+
+#: :py:class:`Replay` of each log loaded by :py:func:`render_frame`, by path.
+replays = {}
+
+
+def load_log(path):
+    """Loads the stims and global defaults of a run from its log folder.
+
+    :param path: log folder of run, see :py:func:`pyStim.log_path`.
+    :return: tuple of list of StimInfo classes, and dict of global defaults
+     (None if not logged).
+    :raises: IOError: if folder has no stim log.
+    """
+    logs = sorted(glob.glob(os.path.join(path, 'stimlog_*.txt')))
+    if not logs:
+        raise IOError('No stim log in {}.'.format(path))
+
+    with open(logs[0], 'rb') as f:
+        saved = f.read().split(b'#BEGIN PICKLE#\n', 1)[1]
+
+    stim_list = parse_stims(pickle.loads(saved))
+
+    global_defaults = None
+    defaults_files = sorted(glob.glob(os.path.join(path, 'globals_*.json')))
+
+    if defaults_files:
+        with open(defaults_files[0], 'r') as f:
+            global_defaults = json.load(f)
+
+    return stim_list, global_defaults
+
+
+class Replay(object):
+    """Stims of a logged run, built once with their own numpy window, to draw
+    any of its frames.
+
+    :param path: log folder of run.
+    """
+    def __init__(self, path):
+        """
+        Loads log and builds stims.
+        """
+        stim_list, global_defaults = load_log(path)
+
+        self.path = path
+        #: Global defaults run with, set while building and drawing.
+        self.defaults = dict(GlobalDefaults.defaults)
+        if global_defaults is not None:
+            self.defaults.update(global_defaults)
+        self.defaults.update(export_defaults)
+
+        self.win = None
+        self.gamma_mon = None
+        self.gamma_key = None
+        self.program = None
+
+        # numpy window, so no small window; never triggers, so no labjack
+        with self.active():
+            MyWindow.make_win(labjack=False)
+            self.win = MyWindow.win
+            self.gamma_mon = MyWindow.gamma_mon
+            self.gamma_key = MyWindow.gamma_key
+            self.program = build_program(stim_list)
+
+        self.num_frames = self.program.num_frames
+
+    @contextmanager
+    def active(self):
+        """Context in which window, gamma correction, and global defaults are
+        those of the run, and are put back after, along with the labjack.
+        """
+        saved = (dict(GlobalDefaults.defaults), MyWindow.win,
+                 MyWindow.backend, MyWindow.visual, MyWindow.gamma_mon,
+                 MyWindow.gamma_key, MyWindow.d)
+
+        GlobalDefaults.defaults.update(self.defaults)
+        MyWindow.win = self.win
+        MyWindow.backend = 'numpy'
+        MyWindow.gamma_mon = self.gamma_mon
+        MyWindow.gamma_key = self.gamma_key
+        MyWindow.d = None
+
+        try:
+            yield
+        finally:
+            (defaults, MyWindow.win, MyWindow.backend, MyWindow.visual,
+             MyWindow.gamma_mon, MyWindow.gamma_key, MyWindow.d) = saved
+
+            GlobalDefaults.defaults.clear()
+            GlobalDefaults.defaults.update(defaults)
+
+    def render(self, n, out=None):
+        """Draws a frame.
+
+        :param int n: frame number, from start of rep.
+        :param out: uint8 array shaped (height, width, 3) to draw into, new
+         array if None.
+        :return: frame as uint8 rgb, top row first.
+        :raises: IndexError: if frame is not in run.
+        """
+        if not 0 <= n < self.num_frames:
+            raise IndexError('Frame {} not in run of {} frames.'.format(
+                n, self.num_frames))
+
+        width, height = self.win.size
+        if out is None:
+            out = numpy.empty((height, width, 3), dtype=numpy.uint8)
+
+        with self.active():
+            self.win.clearBuffer()
+            self.program.draw_at(n)
+
+            # read back bottom row first
+            self.win.read_frame(out[::-1])
+
+        return out
+
+
+def render_frame(log, n, out=None):
+    """Rebuilds the image shown on a frame of a logged run. The run is
+    loaded on first call and kept in :py:data:`replays`, so later calls with
+    the same log only draw.
+
+    :param log: log folder of run, or a :py:class:`Replay`.
+    :param int n: frame number, from start of rep.
+    :param out: uint8 array shaped (height, width, 3) to draw into, new array
+     if None.
+    :return: frame as uint8 rgb, top row first.
+    """
+    if isinstance(log, Replay):
+        return log.render(n, out)
+
+    path = os.path.abspath(log)
+    if path not in replays:
+        replays[path] = Replay(path)
+
+    return replays[path].render(n, out)
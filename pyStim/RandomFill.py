@@ -0,0 +1,75 @@
+"""
+Seeded random fills that can be rebuilt offline: pixel shuffles of
+ImageJumpStim slices and random checkerboards. Needs only numpy, so analysis
+code can use it without psychopy or a display.
+"""
+
+import numpy
+
+
+def shuffle_pixels(slices, seeds, channel=3, out=None):
+    """Shuffles pixels of each slice with its own seeded permutation, so any
+    shuffled slice can be rebuilt from its seed alone. Done as one gather
+    across all slices.
+
+    :param slices: array of slices, shaped (slices, height, width, channels).
+    :param seeds: one seed per slice.
+    :param int channel: channel to shuffle, or 3 to shuffle pixels with all
+     channels together.
+    :param out: optional contiguous array to put shuffled slices in.
+    :return: shuffled slices.
+    """
+    slices = numpy.asarray(slices)
+    num_slices, height, width, channels = slices.shape
+    num_pixels = height * width
+
+    perms = numpy.empty((num_slices, num_pixels), dtype=numpy.intp)
+    for i, seed in enumerate(seeds):
+        perms[i] = numpy.random.default_rng(seed).permutation(num_pixels)
+
+    if out is None:
+        out = numpy.empty(slices.shape, dtype=slices.dtype)
+
+    flat = slices.reshape(num_slices, num_pixels, channels)
+    out_flat = out.reshape(num_slices, num_pixels, channels)
+    rows = numpy.arange(num_slices)[:, numpy.newaxis]
+
+    if channel != 3:
+        out_flat[...] = flat
+        out_flat[:, :, channel] = flat[rows, perms, channel]
+    else:
+        out_flat[...] = flat[rows, perms]
+
+    return out
+
+
+def random_binary(rand, size):
+    """Draws the same values as calling ``rand.randint(0, 1)`` size times,
+    but in bulk. Leaves rand in the same state the separate calls would.
+
+    :param rand: random.Random instance.
+    :param int size: number of values.
+    :return: array of 0s and 1s.
+    """
+    state = rand.getstate()
+    words = []
+    accepted = 0
+
+    # randint(0, 1) uses top 2 bits of a 32 bit word, redrawing on 2 or 3
+    while accepted < size:
+        num_words = 2 * (size - accepted) + 64
+        new = rand.getrandbits(32 * num_words).to_bytes(4 * num_words,
+                                                        'little')
+        new = numpy.frombuffer(new, dtype='<u4') >> 30
+        words.append(new)
+        accepted += numpy.count_nonzero(new < 2)
+
+    bits = numpy.concatenate(words) if words else numpy.zeros(0, numpy.uint32)
+    used = numpy.flatnonzero(bits < 2)[:size]
+
+    # rewind, then advance by only the words used
+    rand.setstate(state)
+    if size:
+        rand.getrandbits(32 * int(used[-1] + 1))
+
+    return bits[used]
@@ -0,0 +1,343 @@
+"""
+Spike triggered averages of noise boards recorded with the ``record_noise``
+option (see :doc:`FrameStore`). Frames are streamed from disk one chunk at a
+time, so recordings need not fit in memory, and each sweep, i.e. recorded
+rep with its spike times, can be averaged in a separate process.
+
+Spike times are in seconds from the first frame of the rep, e.g. from the
+first trigger of the rep.
+
+Also maps responses to ImageJumpStim jumps, from the image and slice log
+saved in Jumpinglog files.
+"""
+
+import glob
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy
+from numpy.lib.stride_tricks import sliding_window_view
+
+from FrameStore import FrameReader
+from RandomFill import shuffle_pixels
+
+
+def spike_counts(reader, spike_times, latency=0):
+    """Counts spikes during each stored frame.
+
+    :param reader: :py:class:`FrameStore.FrameReader` of sweep.
+    :param spike_times: spike times in seconds.
+    :param float latency: seconds to subtract from spike times.
+    :return: float array of number of spikes during each stored frame.
+    """
+    meta = reader.meta
+    spike_times = numpy.asarray(spike_times, dtype=numpy.float64) - latency
+
+    frames = numpy.floor(spike_times * meta['frame_rate']).astype(numpy.int64)
+    if 'end_frame' in meta:
+        frames = frames[frames < meta['end_frame']]
+
+    # stored frame shown during each spike
+    shown = numpy.searchsorted(reader.index, frames, side='right') - 1
+    shown = shown[shown >= 0]
+
+    return numpy.bincount(shown, minlength=len(reader)).astype(numpy.float32)
+
+
+def sweep_sums(path, spike_times, num_lags=10, latency=0):
+    """Sums frames preceding each spike of a sweep. Runs in worker processes.
+
+    :param path: folder of frame store.
+    :param spike_times: spike times in seconds.
+    :param int num_lags: number of noise frames before each spike to sum,
+     including the one shown during the spike.
+    :param float latency: seconds to subtract from spike times.
+    :return: tuple of sums, shaped (num_lags, num_values), and number of
+     spikes.
+    """
+    reader = FrameReader(path)
+    counts = spike_counts(reader, spike_times, latency)
+
+    # stimulus contrast of each palette index
+    contrast = numpy.linspace(-1, 1, reader.meta['levels'],
+                              dtype=numpy.float32)
+
+    # pad so weights of last frames see no spikes past the end
+    padded = numpy.concatenate([counts,
+                                numpy.zeros(num_lags, dtype=numpy.float32)])
+
+    sums = numpy.zeros((num_lags, reader.num_values), dtype=numpy.float64)
+
+    for i in range(reader.num_chunks):
+        start = i * reader.chunk_frames
+        end = min(start + reader.chunk_frames, len(reader))
+
+        # weights[lag, i] is number of spikes lag frames after frame i
+        weights = sliding_window_view(padded[start:end + num_lags - 1],
+                                      end - start)
+
+        # weights come from spike times alone, so chunks without nearby
+        # spikes are never read from disk
+        if not weights.any():
+            continue
+
+        sums += weights.dot(contrast[reader.chunk(i)])
+
+    return sums, counts.sum()
+
+
+def spike_triggered_average(sweeps, num_lags=10, latency=0, workers=None):
+    """Averages noise frames preceding spikes across sweeps.
+
+    :param sweeps: list of (frame store folder, spike times) tuples.
+    :param int num_lags: number of noise frames before each spike to
+     average, including the one shown during the spike.
+    :param float latency: seconds to subtract from spike times.
+    :param workers: number of processes to spread sweeps over; None to use
+     one per cpu, 1 to run in this process.
+    :return: average contrast, shaped (num_lags, rows, columns), most recent
+     frame first.
+    """
+    paths = [path for path, _ in sweeps]
+    spikes = [times for _, times in sweeps]
+    lags = [num_lags] * len(sweeps)
+    latencies = [latency] * len(sweeps)
+
+    if workers == 1 or len(sweeps) == 1:
+        results = map(sweep_sums, paths, spikes, lags, latencies)
+        results = list(results)
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(sweep_sums, paths, spikes, lags,
+                                        latencies))
+
+    shapes = set(tuple(FrameReader(path).meta['frame_shape'])
+                 for path in paths)
+    if len(shapes) != 1:
+        raise ValueError('Sweeps have different board sizes: {}'.format(
+            sorted(shapes)))
+
+    sums = sum(result[0] for result in results)
+    num_spikes = sum(result[1] for result in results)
+
+    if num_spikes == 0:
+        raise ValueError('No spikes during recorded frames.')
+
+    return (sums / num_spikes).reshape((num_lags,) + shapes.pop())
+
+
+def noise_stores(log_folder, stim=None):
+    """Finds frame stores in a log folder.
+
+    :param log_folder: folder of run, as made by
+     :py:func:`pyStim.log_path`.
+    :param stim: number of stim in run to find stores of, or None for all.
+    :return: list of folders, sorted by stim then rep.
+    """
+    found = []
+
+    for name in os.listdir(log_folder):
+        match = re.match(r'noise_(\d+)_rep_(\d+)$', name)
+        if match is None:
+            continue
+
+        i, rep = int(match.group(1)), int(match.group(2))
+        if stim is None or i == stim:
+            found.append((i, rep, os.path.join(log_folder, name)))
+
+    return [path for _, _, path in sorted(found)]
+
+
+def noise_stims(log_folder):
+    """Finds stims of a run with recorded noise.
+
+    :param log_folder: folder of run.
+    :return: sorted list of stim numbers.
+    """
+    stims = set()
+
+    for name in os.listdir(log_folder):
+        match = re.match(r'noise_(\d+)_rep_\d+$', name)
+        if match is not None:
+            stims.add(int(match.group(1)))
+
+    return sorted(stims)
+
+
+def map_log(log_folder, spike_times, stim=None, **kwargs):
+    """Spike triggered average of one noise stim of a run.
+
+    :param log_folder: folder of run.
+    :param spike_times: list of spike times of each rep.
+    :param stim: number of stim in run, or None if only one stim recorded
+     noise.
+    :param kwargs: passed to :py:func:`spike_triggered_average`.
+    :return: average contrast, shaped (num_lags, rows, columns).
+    :raises: ValueError: if stim is None and run has no noise, or noise of
+     more than one stim.
+    """
+    if stim is None:
+        stims = noise_stims(log_folder)
+
+        if len(stims) != 1:
+            raise ValueError('Give stim number; noise recorded for stims '
+                             '{}.'.format(stims))
+
+        stim = stims[0]
+
+    stores = noise_stores(log_folder, stim)
+
+    if len(stores) != len(spike_times):
+        raise ValueError('{} reps recorded, but spike times given for '
+                         '{}.'.format(len(stores), len(spike_times)))
+
+    return spike_triggered_average(list(zip(stores, spike_times)), **kwargs)
+
+
+def sta_image(sta, scale=8):
+    """Tiles lags of an average side by side as an 8 bit grayscale image,
+    mean contrast at mid gray.
+
+    :param sta: average contrast, shaped (num_lags, rows, columns).
+    :param int scale: pixels per check.
+    :return: uint8 array.
+    """
+    peak = numpy.abs(sta).max()
+    if peak == 0:
+        peak = 1
+
+    tiles = numpy.concatenate(list(sta), axis=1)
+    tiles = numpy.repeat(numpy.repeat(tiles, scale, axis=0), scale, axis=1)
+
+    # boards are drawn bottom row first
+    tiles = tiles[::-1]
+
+    return numpy.round((tiles / peak + 1) * 127.5).astype(numpy.uint8)
+
+
+def read_jump_log(log_file):
+    """Reads a Jumpinglog file and the image saved with it.
+
+    :param log_file: path of Jumpinglog .txt file.
+    :return: dict of logged settings, plus 'image', the memory mapped uint8
+     image in texture orientation (bottom row first), 'slices', an int array
+     of y_low, y_high, x_low, x_high of each jump, and 'seeds', the shuffle
+     seed of each jump or None if not shuffled.
+    """
+    with open(log_file, 'r') as f:
+        lines = f.read().splitlines()
+
+    log = {}
+    rows = []
+
+    for line in lines:
+        if line.startswith('|'):
+            if not line.startswith('|-'):
+                rows.append(line)
+        elif ': ' in line:
+            key, value = line.split(': ', 1)
+            log[key] = value
+
+    headers = rows[0].strip('|').split('|')
+    headers = [header.strip() for header in headers]
+
+    # all rows parsed at once
+    table = numpy.array(' '.join(rows[1:]).replace('|', ' ').split(),
+                        dtype=numpy.int64).reshape(-1, len(headers))
+
+    log['slices'] = table[:, :4]
+    log['seeds'] = table[:, 4] if 'shuffle_seed' in headers else None
+    log['image_channel'] = int(log.get('image_channel', 3))
+
+    # saved flipped, so view back in orientation slices are logged in
+    image = numpy.load(os.path.splitext(log_file)[0] + '.npy', mmap_mode='r')
+    log['image'] = image[::-1]
+
+    return log
+
+
+def jump_logs(log_folders):
+    """Finds Jumpinglog files in log folders.
+
+    :param log_folders: list of log folders of runs.
+    :return: list of paths, in order of folders given.
+    """
+    logs = []
+
+    for folder in log_folders:
+        logs += sorted(glob.glob(os.path.join(folder, 'Jumpinglog_*.txt')))
+
+    return logs
+
+
+def jump_windows(log, jumps):
+    """Gathers image windows shown at jumps in one step, shuffled as they
+    were shown.
+
+    :param log: dict returned by :py:func:`read_jump_log`.
+    :param jumps: jump numbers.
+    :return: uint8 array shaped (jumps, height, width, 3).
+    """
+    slices = log['slices'][jumps]
+    height = slices[0, 1] - slices[0, 0]
+    width = slices[0, 3] - slices[0, 2]
+
+    rows = slices[:, 0, numpy.newaxis] + numpy.arange(height)
+    cols = slices[:, 2, numpy.newaxis] + numpy.arange(width)
+
+    windows = log['image'][rows[:, :, numpy.newaxis],
+                           cols[:, numpy.newaxis, :]]
+
+    if log['seeds'] is not None:
+        windows = shuffle_pixels(windows, log['seeds'][jumps],
+                                 log['image_channel'])
+
+    return windows
+
+
+def map_jumps(log_files, responses, batch_size=64):
+    """Response weighted average of image windows shown at jumps, across
+    logs.
+
+    :param log_files: list of Jumpinglog files.
+    :param responses: list of response to each jump, e.g. spike counts, for
+     each log.
+    :param int batch_size: jumps gathered at a time.
+    :return: average contrast, shaped (height, width, 3), top row first.
+    """
+    total = None
+    weight = 0.
+
+    for log_file, response in zip(log_files, responses):
+        log = read_jump_log(log_file)
+        response = numpy.asarray(response, dtype=numpy.float64)
+
+        if len(response) != len(log['slices']):
+            raise ValueError('{} has {} jumps, but {} responses given.'.format(
+                log_file, len(log['slices']), len(response)))
+
+        for start in range(0, len(response), batch_size):
+            jumps = numpy.arange(start, min(start + batch_size,
+                                            len(response)))
+            windows = jump_windows(log, jumps)
+
+            summed = numpy.tensordot(response[jumps],
+                                     windows.astype(numpy.float64), axes=1)
+
+            if total is None:
+                total = summed
+            elif total.shape != summed.shape:
+                raise ValueError('Jump logs have different window sizes.')
+            else:
+                total += summed
+
+        weight += response.sum()
+
+    if not weight:
+        raise ValueError('No responses to jumps.')
+
+    # uint8 back to -1 to 1 contrast
+    average = total / weight / 127.5 - 1
+
+    return average[::-1]
@@ -0,0 +1,409 @@
+"""
+Software renderer that draws stims with numpy instead of OpenGL, for running
+without a display or GPU, e.g. on analysis nodes and in tests. Provides stand
+ins for the psychopy window and stims used by pyStim, and is picked with
+``render_backend = numpy`` in config.ini (see :py:class:`pyStim.MyWindow`).
+
+Draws the way psychopy does in pix units, so frames match those read back
+from a window up to rounding at edges:
+
+* a pixel is drawn if its center is inside the stim.
+* textures repeat, are sampled nearest neighbour, and are drawn bottom row
+  first.
+* colors are signed (-1 to 1), and texture colors are multiplied by the stim
+  color. Texture alpha is clipped to 0 to 1.
+* stims are alpha blended over the frame in the order they are drawn.
+
+Frames are float32 rgb, bottom row first, like the back buffer. Each draw is
+one vectorized pass over the pixels around the stim. Movies are not
+supported.
+"""
+
+import numpy
+
+
+def val2array(value, length=2):
+    """Makes a float array of a value, repeating scalars.
+
+    :param value: scalar or sequence.
+    :param int length: length of array.
+    :return: float64 array.
+    """
+    value = numpy.asarray(value, dtype=numpy.float64)
+
+    return numpy.array(numpy.broadcast_to(value, (length,)))
+
+
+def cover(win, pos, size, ori=0):
+    """Finds the pixels whose centers are inside a rectangle.
+
+    :param win: :py:class:`Window` to draw to.
+    :param pos: center of rectangle, in pixels from center of window.
+    :param size: width and height of rectangle.
+    :param ori: clockwise rotation in degrees.
+    :return: tuple of row and column slices of the frame around the
+     rectangle, and the position of each pixel within the rectangle, from 0
+     to 1 across its width and height (u, v), both shaped as the slices. None
+     if the rectangle is off the frame.
+    """
+    width, height = win.size
+    pos = val2array(pos)
+    size = val2array(size)
+    cos, sin = numpy.cos(numpy.radians(ori)), numpy.sin(numpy.radians(ori))
+
+    # corners on frame, from bottom left of window
+    corners = numpy.array([[-1, -1], [1, -1], [1, 1], [-1, 1]]) * size / 2.
+    corners = numpy.column_stack((corners[:, 0] * cos + corners[:, 1] * sin,
+                                  corners[:, 1] * cos - corners[:, 0] * sin))
+    corners = (corners + pos) * win.viewScale + win.viewPos
+    corners += (width / 2., height / 2.)
+
+    # pixels with centers between lowest and highest corners
+    low = numpy.maximum(numpy.ceil(corners.min(axis=0) - 0.5), 0)
+    high = numpy.minimum(numpy.ceil(corners.max(axis=0) - 0.5),
+                         (width, height))
+    (col0, row0), (col1, row1) = low.astype(int), high.astype(int)
+
+    if col0 >= col1 or row0 >= row1:
+        return None
+
+    # pixel centers back in stim coordinates
+    x = ((numpy.arange(col0, col1) + 0.5 - width / 2. - win.viewPos[0]) /
+         win.viewScale[0] - pos[0])
+    y = ((numpy.arange(row0, row1) + 0.5 - height / 2. - win.viewPos[1]) /
+         win.viewScale[1] - pos[1])
+    x, y = x[numpy.newaxis, :], y[:, numpy.newaxis]
+
+    u = (x * cos - y * sin) / size[0] + 0.5
+    v = (x * sin + y * cos) / size[1] + 0.5
+
+    return slice(row0, row1), slice(col0, col1), u, v
+
+
+class Window(object):
+    """Frame buffer standing in for a psychopy window.
+    """
+    def __init__(self, size=(800, 600), color=(0, 0, 0), viewPos=None,
+                 viewScale=None, **kwargs):
+        """
+        :param size: width and height of frames.
+        :param color: background color.
+        :param viewPos: offset of everything drawn, in pixels.
+        :param viewScale: scale of everything drawn.
+        :param kwargs: other psychopy window parameters, ignored.
+        """
+        self.size = numpy.array(size, dtype=int)
+        self.color = color
+        self.viewPos = numpy.zeros(2) if viewPos is None else \
+            val2array(viewPos)
+        self.viewScale = numpy.ones(2) if viewScale is None else \
+            val2array(viewScale)
+
+        # read back without a frame buffer object
+        self.useFBO = False
+        self.recordFrameIntervals = False
+        self.frameIntervals = []
+        self.mouseVisible = False
+
+        #: Current frame, float32 rgb shaped (height, width, 3).
+        self.buffer = numpy.empty((self.size[1], self.size[0], 3),
+                                  dtype=numpy.float32)
+        #: Number of flips.
+        self.num_flips = 0
+        self.on_flip = []
+
+        self.clearBuffer()
+
+    def clearBuffer(self):
+        """Fills frame with background color.
+        """
+        self.buffer[...] = numpy.asarray(self.color, dtype=numpy.float32)[:3]
+
+    def callOnFlip(self, function, *args, **kwargs):
+        """Calls a function on the next flip.
+        """
+        self.on_flip.append((function, args, kwargs))
+
+    def flip(self, clearBuffer=True):
+        """Finishes a frame. Nothing is shown.
+
+        :param bool clearBuffer: whether to clear frame after.
+        """
+        for function, args, kwargs in self.on_flip:
+            function(*args, **kwargs)
+        self.on_flip = []
+
+        self.num_flips += 1
+
+        if clearBuffer:
+            self.clearBuffer()
+
+    def read_frame(self, out):
+        """Converts frame to 8 bit, as read back from a window.
+
+        :param out: uint8 array shaped (height, width, 3).
+        :return: out
+        """
+        frame = numpy.clip(self.buffer, -1, 1)
+        frame += 1
+        frame *= 127.5
+        numpy.rint(frame, out=frame)
+        numpy.copyto(out, frame, casting='unsafe')
+
+        return out
+
+    def saveFrameIntervals(self, *args, **kwargs):
+        pass
+
+    def close(self):
+        pass
+
+
+class GratingStim(object):
+    """Textured, optionally circular, rectangle standing in for a psychopy
+    GratingStim.
+    """
+    def __init__(self, win, tex=None, mask=None, size=None, pos=(0, 0),
+                 ori=0, phase=(0, 0), sf=None, color=(1, 1, 1), opacity=1,
+                 **kwargs):
+        """
+        :param win: :py:class:`Window` to draw to.
+        :param tex: texture as numpy array, luminance, rgb, or rgba, from -1
+         to 1. None for a uniform texture.
+        :param mask: 'circle', or None.
+        :param size: width and height, in pixels.
+        :param pos: center, in pixels from center of window.
+        :param ori: clockwise rotation in degrees.
+        :param phase: texture phase, 1 is a whole cycle.
+        :param sf: cycles of texture per pixel, one across the stim if None.
+        :param color: rgb to multiply texture by.
+        :param opacity: alpha of whole stim.
+        :param kwargs: other psychopy stim parameters, ignored.
+        """
+        if mask not in ['circle', None]:
+            raise ValueError('Mask {} cannot be drawn by the software '
+                             'renderer.'.format(mask))
+
+        self.win = win
+        self.mask = mask
+        self.tex = tex
+        self.size = size if size is not None else (1, 1)
+        self.pos = pos
+        self.ori = ori
+        self.phase = phase
+        self.sf = sf if sf is not None else 1. / self.size
+        self.color = color
+        self.opacity = opacity
+
+    @property
+    def tex(self):
+        return self._tex
+
+    @tex.setter
+    def tex(self, tex):
+        """Keeps texture as given, plus an rgba view of it for sampling.
+        """
+        self._tex = tex
+
+        if tex is None:
+            tex = numpy.ones((1, 1), dtype=numpy.float32)
+
+        tex = numpy.asarray(tex, dtype=numpy.float32)
+
+        if tex.ndim == 2:
+            tex = numpy.repeat(tex[:, :, numpy.newaxis], 3, axis=2)
+        if tex.shape[2] == 3:
+            tex = numpy.dstack((tex, numpy.ones(tex.shape[:2],
+                                                dtype=numpy.float32)))
+
+        self.texels = tex
+
+    @property
+    def size(self):
+        return self._size
+
+    @size.setter
+    def size(self, size):
+        self._size = val2array(size)
+
+    @property
+    def pos(self):
+        return self._pos
+
+    @pos.setter
+    def pos(self, pos):
+        self._pos = val2array(pos)
+
+    @property
+    def phase(self):
+        return self._phase
+
+    @phase.setter
+    def phase(self, phase):
+        self._phase = val2array(phase)
+
+    @property
+    def sf(self):
+        return self._sf
+
+    @sf.setter
+    def sf(self, sf):
+        self._sf = val2array(sf)
+
+    @property
+    def color(self):
+        return self._color
+
+    @color.setter
+    def color(self, color):
+        self._color = val2array(numpy.ravel(color)[:3], 3).astype(
+            numpy.float32)
+
+    def setTex(self, tex):
+        self.tex = tex
+
+    def setPos(self, pos):
+        self.pos = pos
+
+    def setColor(self, color, colorSpace=None):
+        self.color = color
+
+    def draw(self, win=None):
+        """Blends stim into frame.
+
+        :param win: :py:class:`Window` to draw to, if not own.
+        """
+        win = win if win is not None else self.win
+
+        covered = cover(win, self.pos, self.size, self.ori)
+        if covered is None:
+            return
+
+        rows, cols, u, v = covered
+
+        alpha = ((u >= 0) & (u < 1) & (v >= 0) & (v < 1)).astype(
+            numpy.float32)
+        if self.mask == 'circle':
+            alpha *= (u - 0.5) ** 2 + (v - 0.5) ** 2 <= 0.25
+
+        # texture coordinates as psychopy lays them out, then repeated
+        cycles = self.sf * self.size
+        s = (u - 0.5) * cycles[0] - self.phase[0] + 0.5
+        t = (v - 0.5) * cycles[1] - self.phase[1] + 0.5
+
+        height, width = self.texels.shape[:2]
+        i = numpy.minimum((t % 1 * height).astype(int), height - 1)
+        j = numpy.minimum((s % 1 * width).astype(int), width - 1)
+
+        texels = self.texels[i, j]
+
+        alpha *= numpy.clip(texels[:, :, 3], 0, 1) * self.opacity
+        blend(win.buffer[rows, cols], texels[:, :, :3] * self.color, alpha)
+
+
+class ElementArrayStim(object):
+    """Grid of solid color squares standing in for a psychopy
+    ElementArrayStim, as used for checkerboards. Elements must be laid out
+    in rows and columns one element apart.
+    """
+    def __init__(self, win, xys=None, colors=(1, 1, 1), nElements=None,
+                 sizes=1, fieldPos=(0, 0), **kwargs):
+        """
+        :param win: :py:class:`Window` to draw to.
+        :param xys: center of each element, relative to field position.
+        :param colors: rgb of each element.
+        :param nElements: number of elements.
+        :param sizes: width and height of elements.
+        :param fieldPos: position of all elements.
+        :param kwargs: other psychopy stim parameters, ignored.
+        """
+        self.win = win
+        self.xys = numpy.asarray(xys, dtype=numpy.float64)
+        self.sizes = val2array(sizes)
+        self.fieldPos = fieldPos
+        self.size = None
+
+        # place of each element in grid, from the bottom left
+        low = self.xys.min(axis=0)
+        cells = numpy.rint((self.xys - low) / self.sizes).astype(int)
+        self.shape = tuple(cells.max(axis=0)[::-1] + 1)
+
+        if not numpy.allclose(cells * self.sizes + low, self.xys):
+            raise ValueError('Elements must be one element apart to be drawn '
+                             'by the software renderer.')
+
+        #: Element in each cell of grid, -1 if empty.
+        self.grid = numpy.full(self.shape, -1, dtype=int)
+        self.grid[cells[:, 1], cells[:, 0]] = numpy.arange(len(self.xys))
+
+        #: Center of grid, relative to field position.
+        self.center = low + (numpy.array(self.shape[::-1]) - 1) * \
+            self.sizes / 2.
+
+        self.setColors(colors)
+
+    @property
+    def fieldPos(self):
+        return self._fieldPos
+
+    @fieldPos.setter
+    def fieldPos(self, pos):
+        self._fieldPos = val2array(pos)
+
+    def setFieldPos(self, pos):
+        self.fieldPos = pos
+
+    def setColors(self, colors, colorSpace=None):
+        """Colors setter.
+
+        :param colors: rgb of each element, or one rgb for all.
+        """
+        colors = numpy.asarray(colors, dtype=numpy.float32)
+        self.colors = numpy.array(numpy.broadcast_to(colors[..., :3],
+                                                     (len(self.xys), 3)))
+
+    def draw(self, win=None):
+        """Blends elements into frame.
+
+        :param win: :py:class:`Window` to draw to, if not own.
+        """
+        win = win if win is not None else self.win
+        rows, columns = self.shape
+
+        covered = cover(win, self.fieldPos + self.center,
+                        self.sizes * (columns, rows))
+        if covered is None:
+            return
+
+        frame_rows, frame_cols, u, v = covered
+
+        # cell under each pixel
+        i = numpy.floor(v * rows).astype(int)
+        j = numpy.floor(u * columns).astype(int)
+        inside = (i >= 0) & (i < rows) & (j >= 0) & (j < columns)
+
+        element = numpy.full(inside.shape, -1, dtype=int)
+        element[inside] = self.grid[numpy.broadcast_to(i, inside.shape)[
+            inside], numpy.broadcast_to(j, inside.shape)[inside]]
+
+        alpha = (element >= 0).astype(numpy.float32)
+        blend(win.buffer[frame_rows, frame_cols], self.colors[element],
+              alpha)
+
+
+class MovieStim(object):
+    """Movies are decoded by psychopy, so cannot be drawn.
+    """
+    def __init__(self, *args, **kwargs):
+        raise ValueError('Movies cannot be drawn by the software renderer.')
+
+
+def blend(out, rgb, alpha):
+    """Alpha blends colors over part of a frame, in place.
+
+    :param out: view of frame, shaped (rows, columns, 3).
+    :param rgb: colors, shaped like out.
+    :param alpha: alpha of each pixel, shaped (rows, columns).
+    """
+    alpha = alpha[:, :, numpy.newaxis]
+    out += alpha * (rgb - out)
@@ -5,12 +5,21 @@ Program for presenting visual stimuli to retinal neurons for eletrophysiology ex
 # Copyright (C) 2018 Alexander Tomlinson
 # Distributed under the terms of the GNU General Public License (GPL).
 
+import bisect
 import copy
+import ctypes
+import hashlib
+import itertools
+import json
 import os
 import pickle
+import queue
 import subprocess
 import sys
+import tempfile
+import threading
 import traceback
+from collections import OrderedDict
 from math import ceil
 from random import Random
 from time import strftime, localtime
@@ -26,10 +35,14 @@ from tqdm import tqdm, trange
 
 from psychopy import visual, core, event
 from psychopy.tools.coordinatetools import pol2cart
-from psychopy.tools.typetools import uint8_float, float_uint8
+from psychopy.tools.typetools import float_uint8
 from psychopy.visual import globalVars, filters
 from psychopy.visual.windowframepack import ProjectorFramePacker
 
+from FrameStore import FrameWriter
+from RandomFill import shuffle_pixels, random_binary
+import SoftRender
+
 GL = pyglet.gl
 
 global has_igor
@@ -139,6 +152,8 @@ class GlobalDefaults(object, metaclass=GlobalDefaultsMeta):
     :param bool log: Whether or not to write to a log file.
     :param list offset: List of microns in xy coordinates of how much to
      offset the center of the window.
+    :param bool record_noise: Whether or not to record each frame of noise
+     boards to the log folder. See :doc:`FrameStore` documentation.
     """
 
     #: Dictionary of default defaults.
@@ -159,7 +174,8 @@ class GlobalDefaults(object, metaclass=GlobalDefaultsMeta):
                     trigger_wait=6,
                     capture=False,
                     small_win=False,
-                    framepack=False)
+                    framepack=False,
+                    record_noise=False)
 
     def __init__(self,
                  frame_rate=None,
@@ -179,7 +195,8 @@ class GlobalDefaults(object, metaclass=GlobalDefaultsMeta):
                  offset=None,
                  capture=None,
                  small_win=None,
-                 framepack=None):
+                 framepack=None,
+                 record_noise=None):
         """
         Populate defaults if passed; units converted as necessary.
         """
@@ -239,6 +256,9 @@ class GlobalDefaults(object, metaclass=GlobalDefaultsMeta):
         if framepack is not None:
             self.defaults['framepack'] = framepack
 
+        if record_noise is not None:
+            self.defaults['record_noise'] = record_noise
+
     def __repr__(self):
         """For pretty printing dictionary of global defaults.
         """
@@ -260,8 +280,15 @@ class MyWindow(object):
     #: Psychopy window instances.
     win = None
     small_win = None
+    #: Renderer, from config: 'psychopy', or 'numpy' to draw without a
+    #: display using :doc:`SoftRender`.
+    backend = config.get('StimProgram', 'render_backend', fallback='psychopy')
+    #: Module stims and windows are made with, depending on backend.
+    visual = visual
     #: Gamma correction instance. See :py:class:`GammaCorrection`.
     gamma_mon = None
+    #: Identifies loaded gamma table for :py:class:`TextureCache` keys.
+    gamma_key = None
     #: Used to break out of animation loop in :py:func:`main`.
     should_break = False
     running = False
@@ -276,14 +303,17 @@ class MyWindow(object):
     mirror_counter = 0
 
     @staticmethod
-    def make_win():
+    def make_win(labjack=True):
         """Static method to create window from global parameters. Checks if
         gamma correction splines are present. Also instantiates labjack if
         present.
+
+        :param bool labjack: whether to open labjack, False for windows that
+         never trigger, e.g. to rebuild logged frames.
         """
         # create labjack instance
         global has_u3
-        if has_u3:
+        if has_u3 and labjack:
             try:
                 MyWindow.d = u3.U3()
             except Exception as e:
@@ -300,8 +330,18 @@ class MyWindow(object):
                 with open(gamma_file, 'rb') as f:
                     MyWindow.gamma_mon = pickle.load(f)[gamma]
 
+                # sample splines into lookup tables, 0 to keep splines
+                lut_size = config.getint('StimProgram', 'gamma_lut_size',
+                                         fallback=0)
+                if lut_size:
+                    MyWindow.gamma_mon.make_lut(lut_size)
+
+                MyWindow.gamma_key = (gamma, os.path.getmtime(gamma_file),
+                                      lut_size)
+
         else:
             MyWindow.gamma_mon = None
+            MyWindow.gamma_key = None
 
         # gamma correction as necessary
         if MyWindow.gamma_mon is not None:
@@ -309,6 +349,16 @@ class MyWindow(object):
         else:
             color = GlobalDefaults['background']
 
+        # no display, so no small window
+        if MyWindow.backend == 'numpy':
+            MyWindow.visual = SoftRender
+            MyWindow.win = SoftRender.Window(size=GlobalDefaults['display_size'],
+                                             color=color,
+                                             viewPos=GlobalDefaults['offset'],
+                                             viewScale=GlobalDefaults['scale'])
+            return
+
+        MyWindow.visual = visual
         MyWindow.win = visual.Window(units='pix',
                                      colorSpace='rgb',
                                      winType='pyglet',
@@ -435,6 +485,30 @@ class MyWindow(object):
                 else:
                     MyWindow.small_win.flip()
 
+    @staticmethod
+    def read_frame(out):
+        """Reads back buffer of window into an array, without conversions.
+
+        :param out: uint8 array shaped (height, width, 3) of window, filled
+         bottom row first.
+        :return: out
+        """
+        if MyWindow.backend == 'numpy':
+            return MyWindow.win.read_frame(out)
+
+        if MyWindow.win.useFBO:
+            GL.glReadBuffer(GL.GL_COLOR_ATTACHMENT0_EXT)
+        else:
+            GL.glReadBuffer(GL.GL_BACK)
+
+        height, width = out.shape[:2]
+
+        GL.glPixelStorei(GL.GL_PACK_ALIGNMENT, 1)
+        GL.glReadPixels(0, 0, width, height, GL.GL_RGB, GL.GL_UNSIGNED_BYTE,
+                        out.ctypes.data_as(ctypes.POINTER(GL.GLubyte)))
+
+        return out
+
     @staticmethod
     def send_trigger():
         """Triggers recording device by sending short voltage spike from LabJack
@@ -455,6 +529,680 @@ class MyWindow(object):
             print('\nTo trigger, need labjackpython library. See documentation')
 
 
+class TextureCache(object):
+    """Class with static methods for a process wide LRU cache of stim
+    textures. Shared between stims, protocol reps, and runs from the GUI, so
+    identical stims only generate their texture once. Cached textures are
+    read only; least recently used textures are evicted once the byte budget
+    is exceeded. Optionally backed by a directory of .npy files that persists
+    between sessions.
+    """
+    # Class attributes
+    #: Byte budget, from config.
+    max_bytes = config.getint('StimProgram', 'texture_cache_mb',
+                              fallback=256) * 2 ** 20
+    textures = OrderedDict()
+    num_bytes = 0
+    #: Directory of on-disk cache, from config. None if disabled.
+    disk_dir = config.get('StimProgram', 'texture_cache_dir', fallback='None')
+    disk_dir = None if disk_dir == 'None' else os.path.abspath(disk_dir)
+    #: Counters for checking cache use. Hits include on-disk hits.
+    hits = 0
+    misses = 0
+    evictions = 0
+    disk_hits = 0
+
+    @staticmethod
+    def get(key):
+        """Static method to look up a texture, in memory and then in the
+        on-disk cache. Textures found on disk are added to memory.
+
+        :param key: hashable texture key.
+        :return: read only texture, or None if not cached.
+        """
+        try:
+            texture = TextureCache.textures.pop(key)
+        except KeyError:
+            texture = TextureCache.load(key)
+
+            if texture is None:
+                TextureCache.misses += 1
+                return None
+
+            TextureCache.put(key, texture)
+            TextureCache.hits += 1
+
+            return texture
+
+        # move to most recently used
+        TextureCache.textures[key] = texture
+        TextureCache.hits += 1
+
+        return texture
+
+    @staticmethod
+    def put(key, texture):
+        """Static method to add a texture, evicting least recently used
+        textures as needed. Textures larger than the budget are not cached.
+
+        :param key: hashable texture key.
+        :param texture: numpy array; made read only.
+        """
+        if texture.nbytes > TextureCache.max_bytes:
+            return
+
+        if key in TextureCache.textures:
+            TextureCache.num_bytes -= TextureCache.textures.pop(key).nbytes
+
+        texture.flags.writeable = False
+        TextureCache.textures[key] = texture
+        TextureCache.num_bytes += texture.nbytes
+
+        while TextureCache.num_bytes > TextureCache.max_bytes:
+            _, evicted = TextureCache.textures.popitem(last=False)
+            TextureCache.num_bytes -= evicted.nbytes
+            TextureCache.evictions += 1
+
+    @staticmethod
+    def disk_path(key):
+        """Static method to get file name of texture in on-disk cache.
+
+        :param key: hashable texture key.
+        :return: path to .npy file.
+        """
+        digest = hashlib.sha1(repr(key).encode()).hexdigest()
+
+        return os.path.join(TextureCache.disk_dir, digest + '.npy')
+
+    @staticmethod
+    def load(key):
+        """Static method to look up a texture in the on-disk cache.
+
+        :param key: hashable texture key.
+        :return: read only memory mapped texture, or None if not on disk.
+        """
+        if TextureCache.disk_dir is None:
+            return None
+
+        path = TextureCache.disk_path(key)
+        if not os.path.exists(path):
+            return None
+
+        try:
+            texture = numpy.load(path, mmap_mode='r')
+        except (IOError, ValueError):
+            return None
+
+        TextureCache.disk_hits += 1
+
+        return texture
+
+    @staticmethod
+    def save(key, texture):
+        """Static method to write a texture to the on-disk cache. Written to
+        a temporary file of its own first, so readers never see partial
+        files, even with several processes writing the same texture.
+
+        :param key: hashable texture key.
+        :param texture: numpy array.
+        """
+        if TextureCache.disk_dir is None:
+            return
+
+        path = TextureCache.disk_path(key)
+        temp_path = None
+
+        try:
+            if not os.path.exists(TextureCache.disk_dir):
+                os.makedirs(TextureCache.disk_dir, exist_ok=True)
+
+            fd, temp_path = tempfile.mkstemp(suffix='.tmp',
+                                             dir=TextureCache.disk_dir)
+            with os.fdopen(fd, 'wb') as f:
+                numpy.save(f, texture)
+            os.replace(temp_path, path)
+
+        except (IOError, OSError) as e:
+            print('Texture cache error:', e)
+
+            if temp_path is not None and os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    @staticmethod
+    def clear():
+        """Static method to empty cache and reset counters. Does not touch
+        on-disk cache.
+        """
+        TextureCache.textures.clear()
+        TextureCache.num_bytes = 0
+        TextureCache.hits = 0
+        TextureCache.misses = 0
+        TextureCache.evictions = 0
+        TextureCache.disk_hits = 0
+
+    @staticmethod
+    def stats():
+        """Static method to get cache counters.
+
+        :return: dictionary of hits, misses, evictions, on-disk hits, number
+         of textures, and bytes used.
+        """
+        return {'hits': TextureCache.hits,
+                'misses': TextureCache.misses,
+                'evictions': TextureCache.evictions,
+                'disk_hits': TextureCache.disk_hits,
+                'textures': len(TextureCache.textures),
+                'bytes': TextureCache.num_bytes}
+
+
+class PrefetchRing(object):
+    """Fixed number of preallocated buffers, filled in order by a background
+    thread a few items ahead of when they are needed. Memory stays constant
+    however many items are produced.
+    """
+    #: Default number of buffers.
+    num_slots = 3
+
+    def __init__(self, fill, count, shape, dtype=numpy.float32,
+                 num_slots=None):
+        """Allocates buffers and starts producer thread.
+
+        :param fill: function taking item index and buffer, which fills the
+         buffer in place. Called in order of index.
+        :param int count: number of items to produce, or None to produce
+         until stopped.
+        :param shape: shape of each buffer.
+        :param dtype: data type of each buffer.
+        :param int num_slots: number of buffers, i.e. how far ahead to fill;
+         num_slots class attribute if None.
+        """
+        if num_slots is None:
+            num_slots = PrefetchRing.num_slots
+
+        self.fill = fill
+        self.count = count
+        self.slots = [numpy.empty(shape, dtype=dtype)
+                      for _ in range(num_slots)]
+
+        # slot numbers move from free to ready and back again
+        self.free = queue.Queue()
+        self.ready = queue.Queue()
+        for slot in range(num_slots):
+            self.free.put(slot)
+
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.produce)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def produce(self):
+        """Fills free buffers in order. Runs in background thread. Errors are
+        passed on to be raised by get().
+        """
+        if self.count is not None:
+            indices = range(self.count)
+        else:
+            indices = itertools.count()
+
+        for index in indices:
+            slot = self.free.get()
+            if self.stopped.is_set():
+                return
+
+            try:
+                self.fill(index, self.slots[slot])
+            except Exception as e:
+                self.ready.put((slot, e))
+                return
+
+            self.ready.put((slot, None))
+
+    def get(self):
+        """Gets next filled buffer, waiting for it if needed. Buffer must be
+        given back with release() once used.
+
+        :return: slot number and buffer.
+        """
+        slot, error = self.ready.get()
+        if error is not None:
+            raise error
+
+        return slot, self.slots[slot]
+
+    def release(self, slot):
+        """Gives buffer back to be refilled.
+
+        :param int slot: slot number from get().
+        """
+        self.free.put(slot)
+
+    def stop(self):
+        """Stops producer thread and waits for it to finish.
+        """
+        self.stopped.set()
+        # wake producer if waiting for a free slot
+        self.free.put(None)
+        self.thread.join()
+
+
+class CaptureWriter(object):
+    """Streams captured frames to ffmpeg as raw video, encoding a color movie
+    and a grayscale copy in one pass. Frames are read into preallocated
+    buffers that a background thread feeds to ffmpeg, so the animation loop
+    only waits if every buffer is still queued, and nothing is written to
+    disk but the movies.
+    """
+    def __init__(self, path, name, size, frame_rate, num_buffers=8):
+        """Allocates buffers and starts ffmpeg.
+
+        :param path: folder to save movies in. Made if needed.
+        :param name: name to add to movie file names, e.g. time of run.
+        :param size: width and height of frames, in pixels.
+        :param frame_rate: frame rate of movies.
+        :param int num_buffers: number of frame buffers.
+        :raises: IOError: if ffmpeg cannot be started.
+        """
+        self.path = path
+        width, height = int(size[0]), int(size[1])
+
+        if not os.path.exists(path):
+            os.makedirs(path)
+
+        #: Paths of color and grayscale movies.
+        self.files = [os.path.join(path, 'capture_video' + name + '.mpg'),
+                      os.path.join(path, 'capture_video' + name + '_gray.mpg')]
+
+        args = ['ffmpeg', '-y',
+                '-f', 'rawvideo',
+                '-pix_fmt', 'rgb24',
+                '-s', '{}x{}'.format(width, height),
+                '-framerate', str(frame_rate),
+                '-i', '-',
+                # frames are read bottom row first
+                '-vf', 'vflip',
+                '-b:v', '20M',
+                self.files[0],
+                '-vf', 'vflip,format=gray',
+                '-qscale', '0',
+                self.files[1]]
+
+        self.log_file = os.path.join(path, 'ffmpeg.log')
+        self.log = open(self.log_file, 'wb')
+
+        try:
+            self.process = subprocess.Popen(args,
+                                            stdin=subprocess.PIPE,
+                                            stdout=subprocess.DEVNULL,
+                                            stderr=self.log)
+        except OSError as e:
+            self.log.close()
+            raise IOError('Could not start ffmpeg to capture ({}). See '
+                          'installation guide.'.format(e))
+
+        self.free = queue.Queue()
+        for _ in range(num_buffers):
+            self.free.put(numpy.empty((height, width, 3), dtype=numpy.uint8))
+        self.to_write = queue.Queue()
+
+        self.num_frames = 0
+        self.error = None
+
+        self.thread = threading.Thread(target=self.feed)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def next_buffer(self):
+        """Gets a free buffer to read a frame into. Waits if all are queued.
+
+        :return: uint8 array shaped (height, width, 3).
+        """
+        return self.free.get()
+
+    def push(self, buffer):
+        """Queues a filled buffer to be encoded.
+
+        :param buffer: buffer from next_buffer().
+        """
+        self.to_write.put(buffer)
+        self.num_frames += 1
+
+    def feed(self):
+        """Writes queued frames to ffmpeg. Runs in background thread.
+        """
+        while True:
+            buffer = self.to_write.get()
+            if buffer is None:
+                return
+
+            if self.error is None:
+                try:
+                    self.process.stdin.write(buffer.data)
+                except (IOError, OSError) as e:
+                    self.error = e
+
+            self.free.put(buffer)
+
+    def close(self):
+        """Waits for queued frames to be written and for ffmpeg to finish.
+        """
+        self.to_write.put(None)
+        self.thread.join()
+
+        try:
+            self.process.stdin.close()
+        except (IOError, OSError):
+            pass
+
+        self.process.wait()
+        self.log.close()
+
+        if self.error is not None or self.process.returncode:
+            print('\nffmpeg error, see {}'.format(self.log_file))
+        else:
+            print('\n{} frames saved in: {}'.format(self.num_frames,
+                                                     self.path))
+
+
+class FrameCapture(object):
+    """Saves captured frames losslessly to a :doc:`FrameStore`, for
+    modelling with the exact pixel values shown. Frames can be downsampled
+    and reduced to one channel before storing, and are stored top row first.
+    Has the same interface as :py:class:`CaptureWriter`.
+    """
+    #: Channels that can be stored, and index of each in frame.
+    channels = {'all': None, 'red': 0, 'green': 1, 'blue': 2, 'gray': None}
+
+    def __init__(self, path, name, size, frame_rate, downsample=1,
+                 channel='all', compress=False, chunk_mb=16):
+        """Allocates buffer and starts frame store.
+
+        :param path: folder to save store in. Made if needed.
+        :param name: name to add to store folder name, e.g. time of run.
+        :param size: width and height of frames, in pixels.
+        :param frame_rate: frame rate of display.
+        :param int downsample: number of pixels in each direction to average
+         into one stored pixel. Edge pixels that do not fill a block are
+         dropped.
+        :param channel: 'all' to store rgb, 'red', 'green', or 'blue' to store
+         one gun, or 'gray' to store the mean of all three.
+        :param bool compress: whether to compress chunks.
+        :param chunk_mb: approximate size of each chunk, in megabytes.
+        :raises: ValueError: if channel or downsample is invalid.
+        """
+        width, height = int(size[0]), int(size[1])
+        downsample = int(downsample)
+
+        if channel not in self.channels:
+            raise ValueError('Capture channel must be one of {}, not '
+                             '{}.'.format(sorted(self.channels), channel))
+        if not 1 <= downsample <= min(width, height):
+            raise ValueError('Cannot downsample {}x{} frames by '
+                             '{}.'.format(width, height, downsample))
+
+        self.path = os.path.join(path, 'capture_frames' + name)
+        self.downsample = downsample
+        self.channel = channel
+
+        rows, columns = height // downsample, width // downsample
+        if channel == 'all':
+            self.frame_shape = (rows, columns, 3)
+        else:
+            self.frame_shape = (rows, columns)
+
+        num_values = int(numpy.prod(self.frame_shape))
+        chunk_frames = max(1, int(chunk_mb * 2 ** 20 // num_values))
+
+        #: Path of frame store.
+        self.files = [self.path]
+
+        self.writer = FrameWriter(self.path, num_values,
+                                  chunk_frames=chunk_frames,
+                                  compress=compress,
+                                  meta={'frame_rate': frame_rate,
+                                        'frame_shape': list(self.frame_shape),
+                                        'display_size': [width, height],
+                                        'downsample': downsample,
+                                        'channel': channel})
+
+        self.buffer = numpy.empty((height, width, 3), dtype=numpy.uint8)
+        self.num_frames = 0
+
+    def next_buffer(self):
+        """Gets buffer to read a frame into.
+
+        :return: uint8 array shaped (height, width, 3).
+        """
+        return self.buffer
+
+    def reduce(self, frame):
+        """Downsamples frame and picks channel to store.
+
+        :param frame: uint8 array shaped (height, width, 3), bottom row
+         first.
+        :return: uint8 array shaped frame_shape, top row first.
+        """
+        rows, columns = self.frame_shape[:2]
+        n = self.downsample
+
+        # read bottom row first
+        frame = frame[::-1]
+
+        index = self.channels[self.channel]
+        if index is not None:
+            frame = frame[:, :, index]
+
+        if n == 1 and self.channel != 'gray':
+            return frame
+
+        frame = frame[:rows * n, :columns * n].astype(numpy.float32)
+        frame = frame.reshape((rows, n, columns, n) + frame.shape[2:])
+        frame = frame.mean(axis=(1, 3))
+
+        if self.channel == 'gray':
+            frame = frame.mean(axis=2)
+
+        return numpy.rint(frame).astype(numpy.uint8)
+
+    def push(self, buffer):
+        """Stores a filled buffer.
+
+        :param buffer: buffer from next_buffer().
+        """
+        self.writer.write(self.reduce(buffer).ravel(), self.num_frames)
+        self.num_frames += 1
+
+    def close(self):
+        """Waits for frames to be saved.
+        """
+        self.writer.close()
+
+        print('\n{} frames saved in: {}'.format(self.num_frames, self.path))
+
+
+class NoiseEngine(object):
+    """Generates white noise frames for boards. Frames are drawn as indices
+    into a gamma corrected palette of colors, so updates are a single gather
+    into a preallocated color array. Once started, batches of upcoming frames
+    are drawn in the background into a :py:class:`PrefetchRing`.
+
+    Random numbers are counter based (Philox): each frame is drawn from the
+    seeded stream with its counter set to the frame number (as if jumped
+    ahead that many times), so any frame can be drawn on its own, without
+    drawing those before it (see seek()). One generator is repositioned for
+    every frame, so drawing allocates nothing.
+    """
+    #: Number of palette levels for each distribution.
+    levels = {'binary': 2, 'ternary': 3, 'gaussian': 256}
+    #: Standard deviation of gaussian noise, as a fraction of amplitude.
+    gaussian_sd = 1 / 3.
+
+    def __init__(self, num_values, seed, distribution='binary', mid=0, amp=1,
+                 channel=3, batch_size=32):
+        """
+        :param int num_values: number of values in each frame, e.g. checks.
+        :param seed: seed for noise generator.
+        :param string distribution: 'binary', 'ternary', or 'gaussian'.
+        :param mid: rgb color of mean of noise, or one value for all guns.
+        :param amp: rgb change from mean to extremes of noise, or one value
+         for all guns.
+        :param int channel: color channel of noise, or 3 for all channels.
+        :param int batch_size: frames drawn at a time.
+        """
+        self.num_values = num_values
+        self.distribution = distribution
+        self.bit_generator = numpy.random.Philox(seed)
+        self.random = numpy.random.Generator(self.bit_generator)
+        #: Generator state at first frame, with counter moved per frame.
+        self.state = self.bit_generator.state
+        self.palette = self.gen_palette(mid, amp, channel)
+        self.batch_size = batch_size
+
+        # only touched by whichever thread fills batches
+        self.scratch = numpy.empty((batch_size, num_values),
+                                   dtype=numpy.float32)
+
+        self.ring = None
+        self.slot = None
+        self.batch = None
+        self.position = batch_size
+        #: Frame that batch numbers are counted from, moved by seek().
+        self.first_frame = 0
+        #: Batches drawn without the ring since first batch.
+        self.num_batches = 0
+        #: Palette indices of last frame given by next_colors().
+        self.frame = None
+
+    def gen_palette(self, mid, amp, channel):
+        """Makes gamma corrected color for each noise level.
+
+        :return: array of rgb colors, one row per level.
+        """
+        values = numpy.linspace(-1, 1, self.levels[self.distribution])
+        mid = numpy.broadcast_to(numpy.asarray(mid, dtype=numpy.float64), 3)
+        amp = numpy.broadcast_to(numpy.asarray(amp, dtype=numpy.float64), 3)
+
+        # other channels off for single channel noise
+        if channel != 3:
+            palette = numpy.full((len(values), 3), -1, dtype=numpy.float64)
+            palette[:, channel] = mid[channel] + values * amp[channel]
+        else:
+            palette = mid + values[:, numpy.newaxis] * amp
+
+        palette = numpy.clip(palette, -1, 1)
+
+        if MyWindow.gamma_mon is not None:
+            palette = MyWindow.gamma_mon(palette)
+
+        return numpy.asarray(palette, dtype=numpy.float64)
+
+    def fill(self, index, out):
+        """Draws a batch of frames as palette indices, in place.
+
+        :param int index: batch number, from first frame.
+        :param out: uint8 array, shaped (batch_size, num_values).
+        """
+        self.draw_frames(self.first_frame + index * self.batch_size, out)
+
+    def draw_frames(self, first, out):
+        """Draws consecutive frames as palette indices, in place.
+
+        :param int first: frame number of first frame.
+        :param out: uint8 array, shaped (number of frames, num_values), up to
+         batch_size frames.
+        """
+        scratch = self.scratch[:len(out)]
+        counter = self.state['state']['counter']
+
+        for i in range(len(out)):
+            # own stream for each frame, so frames can be drawn in any order
+            counter[2] = first + i
+            self.bit_generator.state = self.state
+
+            if self.distribution == 'gaussian':
+                self.random.standard_normal(dtype=numpy.float32,
+                                            out=scratch[i])
+            else:
+                self.random.random(dtype=numpy.float32, out=scratch[i])
+
+        if self.distribution == 'gaussian':
+            scratch *= self.gaussian_sd
+            numpy.clip(scratch, -1, 1, out=scratch)
+            # -1 to 1 onto nearest level
+            scratch += 1
+            scratch *= (self.levels['gaussian'] - 1) / 2.
+            scratch += 0.5
+        else:
+            scratch *= self.levels[self.distribution]
+
+        numpy.copyto(out, scratch, casting='unsafe')
+
+    def start(self):
+        """Starts drawing batches in the background.
+        """
+        self.ring = PrefetchRing(self.fill, None,
+                                 (self.batch_size, self.num_values),
+                                 numpy.uint8)
+
+    def stop(self):
+        """Stops drawing batches in the background.
+        """
+        if self.ring is not None:
+            self.ring.stop()
+
+    def seek(self, index):
+        """Moves to a noise frame without drawing those before it, so it is
+        given by the next call to next_colors(). Only that frame is drawn;
+        batches carry on from the frame after it. Stops drawing ahead, so
+        later batches are drawn when needed unless started again.
+
+        :param int index: noise frame number, from 0 for first frame.
+        """
+        self.stop()
+        self.ring = None
+        self.slot = None
+
+        self.batch = numpy.empty((1, self.num_values), dtype=numpy.uint8)
+        self.draw_frames(index, self.batch)
+        self.position = 0
+
+        self.first_frame = index + 1
+        self.num_batches = 0
+
+    def next_batch(self):
+        """Moves on to next batch, from the ring if started.
+        """
+        if self.ring is not None:
+            if self.slot is not None:
+                self.ring.release(self.slot)
+            self.slot, self.batch = self.ring.get()
+
+        else:
+            if self.batch is None or len(self.batch) != self.batch_size:
+                self.batch = numpy.empty((self.batch_size, self.num_values),
+                                         dtype=numpy.uint8)
+            self.fill(self.num_batches, self.batch)
+            self.num_batches += 1
+
+        self.position = 0
+
+    def next_colors(self, out, step=1):
+        """Colors of next noise frame.
+
+        :param out: array to put colors in, shaped (num_values, 3).
+        :param int step: frames to move forward, skipping any in between.
+        :return: out
+        """
+        for _ in range(step):
+            if self.batch is None or self.position == len(self.batch):
+                self.next_batch()
+            self.frame = self.batch[self.position]
+            self.position += 1
+
+        numpy.take(self.palette, self.frame, axis=0, out=out)
+
+        return out
+
+
 class StimDefaults(object):
     """Super class to hold parameter defaults. GUI passes dictionary of all
     parameters, whether used to make stim or not.
@@ -479,6 +1227,13 @@ class StimDefaults(object):
 
     :param int num_check: The number of checks in each direction.
 
+    :param string check_type: How checks are filled. Can be 'board',
+     'random', 'noise', or 'noisy noise'.
+
+    :param string check_backend: How boards are drawn. 'elements' draws
+     each check as an element of an array, 'texture' draws the whole board as
+     one texture with a texel per check, which is much faster to update.
+
     :param float delay: The time to between the first frame and the stim
      appearing on screen. Rounds up to the nearest frame.
 
@@ -519,6 +1274,11 @@ class StimDefaults(object):
     :param float fill_seed: The seed for the random number generator for
      random fills.
 
+    :param float noise_rate: How often noisy noise boards update, in Hz.
+
+    :param string noise_dist: Distribution of noise board values. Can be
+     'binary', 'ternary', or 'gaussian'.
+
     :param float move_seed: The seed for the random number generator for
      random movement.
 
@@ -580,6 +1340,7 @@ class StimDefaults(object):
                  check_size=None,
                  num_check=64,
                  check_type='board',
+                 check_backend='elements',
                  delay=0,
                  duration=0.5,
                  location=None,
@@ -590,6 +1351,8 @@ class StimDefaults(object):
                  color_mode='intensity',
                  image_channel='all',
                  fill_seed=1,
+                 noise_rate=5,
+                 noise_dist='binary',
                  move_seed=1,
                  speed=10,
                  num_dirs=4,
@@ -639,7 +1402,10 @@ class StimDefaults(object):
         self.orientation = orientation
         self.num_check = num_check
         self.check_type = check_type
+        self.check_backend = check_backend
         self.fill_seed = fill_seed
+        self.noise_rate = noise_rate
+        self.noise_dist = noise_dist
         self.timing = timing
         self.frequency = frequency
         self.period_mod = period_mod * 2.0 * duration
@@ -764,6 +1530,11 @@ class StaticStim(StimDefaults):
         self.stim = None
         self.small_stim = None
         self.contrast_adj_rgb = None
+        self.timing_table = None
+        #: Background preparation to stop after running, if any.
+        self.ring = None
+        #: :py:class:`FrameStore.FrameWriter` of frames shown, if recording.
+        self.recorder = None
 
         self.colors = None
 
@@ -787,28 +1558,28 @@ class StaticStim(StimDefaults):
         if self.timing != 'step':
             self.fill_mode = 'uniform'
 
-        self.stim = visual.GratingStim(win=MyWindow.win,
-                                       size=self.gen_size(),
-                                       mask=self.gen_mask(),
-                                       tex=self.gen_texture(),
-                                       pos=self.location,
-                                       phase=self.phase,
-                                       ori=self.orientation,
-                                       autoLog=False,
-                                       texRes=2**10,
-                                       units='pix')
+        self.stim = MyWindow.visual.GratingStim(win=MyWindow.win,
+                                                size=self.gen_size(),
+                                                mask=self.gen_mask(),
+                                                tex=self.gen_texture(),
+                                                pos=self.location,
+                                                phase=self.phase,
+                                                ori=self.orientation,
+                                                autoLog=False,
+                                                texRes=2**10,
+                                                units='pix')
 
         self.stim.sf *= self.sf
 
         if MyWindow.small_win is not None:
-            self.small_stim = visual.GratingStim(win=MyWindow.small_win,
-                                                 size=self.stim.size,
-                                                 mask=self.stim.mask,
-                                                 tex=self.stim.tex,
-                                                 pos=self.location,
-                                                 phase=self.phase,
-                                                 ori=self.orientation,
-                                                 autoLog=False)
+            self.small_stim = MyWindow.visual.GratingStim(win=MyWindow.small_win,
+                                                          size=self.stim.size,
+                                                          mask=self.stim.mask,
+                                                          tex=self.stim.tex,
+                                                          pos=self.location,
+                                                          phase=self.phase,
+                                                          ori=self.orientation,
+                                                          autoLog=False)
 
             self.small_stim.sf *= self.sf
 
@@ -836,6 +1607,34 @@ class StaticStim(StimDefaults):
 
         return self.end_stim + self.end_delay
 
+    def reset(self):
+        """Returns stim to how it was before its first frame, so it can be
+        drawn again on the next rep without being rebuilt. Draw times,
+        textures, and trajectories are kept.
+        """
+        # phase is only stepped when animated on the fly
+        if any(self.phase_speed) and self.fill_mode != 'movie':
+            self.stim.phase = self.phase
+            if self.small_stim is not None:
+                self.small_stim.phase = self.phase
+
+    def seek(self, frame):
+        """Sets state animated on the fly to where it would be just before a
+        frame, without animating the frames before it, so animate() can draw
+        any frame. Positions and timing are looked up by frame already; phase
+        steps are counted.
+
+        :param int frame: frame number
+        """
+        if any(self.phase_speed) and self.fill_mode != 'movie':
+            steps = max(frame - int(ceil(self.start_stim)), 0)
+            phase = numpy.add(self.phase, numpy.multiply(steps,
+                                                         self.phase_speed))
+
+            self.stim.phase = phase
+            if self.small_stim is not None:
+                self.small_stim.phase = phase
+
     def animate(self, frame):
         """Method for drawing stim objects to back buffer. Checks if object
         should be drawn. Back buffer is brought to front with calls to flip()
@@ -856,19 +1655,69 @@ class StaticStim(StimDefaults):
             if self.fill_mode != 'movie':
                 self.gen_phase()
 
-            if self.small_stim is not None:
-                MyWindow.win.winHandle.switch_to()
-                globalVars.currWindow = MyWindow.win
-                GL.glBindFramebufferEXT(GL.GL_FRAMEBUFFER_EXT, MyWindow.win.frameBuffer)
+            self.draw()
+
+    def draw(self):
+        """Draws stim object(s) to the back buffer of the window(s), switching
+        contexts if the small window is also being drawn to.
+        """
+        if self.small_stim is not None:
+            MyWindow.win.winHandle.switch_to()
+            globalVars.currWindow = MyWindow.win
+            GL.glBindFramebufferEXT(GL.GL_FRAMEBUFFER_EXT, MyWindow.win.frameBuffer)
 
-            # draw to back buffer
-            self.stim.draw(MyWindow.win)
+        # draw to back buffer
+        self.stim.draw(MyWindow.win)
 
-            if self.small_stim is not None:
-                MyWindow.small_win.winHandle.switch_to()
-                globalVars.currWindow = MyWindow.small_win
-                GL.glBindFramebufferEXT(GL.GL_FRAMEBUFFER_EXT, MyWindow.small_win.frameBuffer)
-                self.small_stim.draw(MyWindow.small_win)
+        if self.small_stim is not None:
+            MyWindow.small_win.winHandle.switch_to()
+            globalVars.currWindow = MyWindow.small_win
+            GL.glBindFramebufferEXT(GL.GL_FRAMEBUFFER_EXT, MyWindow.small_win.frameBuffer)
+            self.small_stim.draw(MyWindow.small_win)
+
+    def compile_frames(self):
+        """Precomputes the state of the stim for every frame it is drawn, so
+        that the animation loop only needs to index arrays. See
+        :py:class:`FrameProgram`.
+
+        :return: :py:class:`StimFrames` instance, or None if the stim must be
+         animated on the fly
+        """
+        frames = StimFrames(self)
+
+        if self.fill_mode not in ['movie', 'image'] and self.timing != 'step':
+            frames.color = self.gen_timing_table()
+
+        if self.fill_mode != 'movie' and any(self.phase_speed):
+            # phase is incremented before each draw
+            steps = numpy.arange(1, frames.num_frames + 1)
+            frames.phase = numpy.array(self.stim.phase, dtype=numpy.float64) + \
+                numpy.outer(steps, self.phase_speed)
+
+        return frames
+
+    def draw_frame(self, frames, frame):
+        """Draws a precomputed frame. Counterpart to animate() for stims that
+        have been compiled.
+
+        :param frames: :py:class:`StimFrames` returned by compile_frames()
+        :param int frame: current frame number
+        """
+        i = frame - frames.start
+
+        if frames.pos is not None:
+            self.set_pos(*frames.pos[i])
+
+        if frames.ori is not None:
+            self.stim.ori = frames.ori[i]
+
+        if frames.color is not None:
+            self.set_tex_color(frames.color[i])
+
+        if frames.phase is not None:
+            self.stim.phase = frames.phase[i]
+
+        self.draw()
 
     def gen_rgb(self):
         """Depending on color mode, calculates necessary values. Texture
@@ -981,7 +1830,60 @@ class StaticStim(StimDefaults):
     def gen_texture(self):
         """Generates texture for stim object. Textures are 3D numpy arrays
         (size*size*4). The 3rd dimension is RGB and Alpha (transparency)
-        values.
+        values. Looked up in :py:class:`TextureCache` before generating.
+
+        :return: texture as numpy array
+        """
+        key = self.texture_key()
+        texture = TextureCache.get(key)
+
+        if texture is None:
+            texture = self.make_texture()
+            # uniform textures are quicker to make than to read
+            if self.fill_mode != 'uniform':
+                TextureCache.save(key, texture)
+
+            TextureCache.put(key, texture)
+
+        # timing changes texture colors in place, so needs own copy
+        if self.timing != 'step':
+            texture = texture.copy()
+
+        return texture
+
+    def texture_key(self):
+        """Makes key of everything that affects texture pixels.
+
+        :return: hashable tuple.
+        """
+        if self.colors is not None:
+            high, low, delta, background = self.colors
+        else:
+            high, low, delta, background = self.gen_rgb()
+
+        # floats rather than numpy scalars, so on-disk names are stable
+        key = (self.fill_mode, self.shape, tuple(self.gen_size()),
+               self.contrast_channel, float(self.alpha),
+               tuple(numpy.ravel(high).tolist()),
+               tuple(numpy.ravel(delta).tolist()),
+               tuple(numpy.ravel(background).tolist()), MyWindow.gamma_key)
+
+        if self.shape == 'annulus':
+            key += (self.outer_diameter, self.inner_diameter)
+
+        if self.fill_mode == 'image':
+            try:
+                stat = os.stat(self.image_filename)
+                source = (os.path.abspath(self.image_filename), stat.st_mtime,
+                          stat.st_size)
+            except (OSError, TypeError):
+                source = (self.image_filename,)
+            key += source + (self.image_channel,)
+
+        return key
+
+    def make_texture(self):
+        """Generates texture. Called by gen_texture() on cache misses.
 
         :return: texture as numpy array
         """
@@ -1070,33 +1972,7 @@ class StaticStim(StimDefaults):
 
             # if .iml
             else:
-                image = numpy.fromfile(self.image_filename, dtype='uint16')
-                image.byteswap(True)  # changes endianness
-                image = image.reshape(1024, 1536)
-
-                maxi = image.max()
-                if maxi <= 4095:
-                    maxi = 4095
-
-                image = image.astype(numpy.float64)
-
-                image /= maxi
-
-                if self.image_channel != 3:
-                    texture = numpy.zeros((1024, 1536, 3))
-                    texture[:, :, self.image_channel] = image
-
-                    texture *= 2
-                    texture -= 1
-
-                    # add alpha values
-                    texture = numpy.insert(texture, 3, self.alpha, axis=2)
-
-                # .iml are gray scale by default
-                else:
-                    image *= 2
-                    image -= 1
-                    texture = image
+                texture = self.load_iml()
 
             texture = numpy.rot90(texture, 2)
 
@@ -1113,20 +1989,88 @@ class StaticStim(StimDefaults):
         # print texture
         return texture
 
-    # @profile
-    def gen_timing(self, frame):
-        """Adjusts color values of stims based on desired timing in desired
-        channel(i.e. as a function of current frame over draw time).
-        Recalculated on every call to animate()
-
-        TODO: precompute values
+    def load_iml(self):
+        """Loads .iml natural image (van Hateren). File is memory mapped and
+        downsampled to fit the stim size before converting to float, so only
+        the needed pixels are ever copied.
 
-        :param int frame: current frame number
-        :return: list of rgb values as floats
+        :return: float32 RGBA texture as numpy array
+        """
+        # 12 bit big endian, not byteswapped in memory
+        image = numpy.memmap(self.image_filename, dtype='>u2', mode='r',
+                             shape=(1024, 1536))
+
+        maxi = max(image.max(), 4095)
+
+        # nearest neighbour downsample, keeping aspect ratio like thumbnail
+        width, height = self.gen_size()
+        scale = min(1.0, float(width) / 1536, float(height) / 1024)
+        rows = numpy.arange(max(1, int(round(1024 * scale)))) * 1024
+        rows //= len(rows)
+        cols = numpy.arange(max(1, int(round(1536 * scale)))) * 1536
+        cols //= len(cols)
+
+        image = image[rows][:, cols].astype(numpy.float32)
+        image *= 2.0 / maxi
+        image -= 1
+
+        texture = numpy.empty(image.shape + (4,), dtype=numpy.float32)
+
+        if self.image_channel != 3:
+            texture[:, :, 0:3] = -1
+            texture[:, :, self.image_channel] = image
+
+        # .iml are gray scale by default
+        else:
+            texture[:, :, 0:3] = image[:, :, numpy.newaxis]
+
+        texture[:, :, 3] = self.alpha
+
+        return texture
+
+    # @profile
+    def gen_timing(self, frame):
+        """Adjusts color values of stims based on desired timing in desired
+        channel(i.e. as a function of current frame over draw time).
+        Looks up the table from gen_timing_table() if it was built, otherwise
+        recalculated on every call to animate().
+
+        :param int frame: current frame number
+        """
+        i = frame - int(ceil(self.start_stim))
+
+        if self.timing_table is not None and 0 <= i < len(self.timing_table):
+            self.set_tex_color(self.timing_table[i])
+        else:
+            self.set_tex_color(self.timing_color(frame))
+
+    def gen_timing_table(self):
+        """Calculates the colors for every frame the stim is drawn in one
+        vectorized pass, so that gen_timing() becomes a lookup.
+
+        :return: array of rgb values as floats, as frames x rgb
+        """
+        frames = numpy.arange(int(ceil(self.start_stim)),
+                              int(ceil(self.end_stim)))
+
+        self.timing_table = self.timing_color(frames)
+
+        return self.timing_table
+
+    def timing_color(self, frame):
+        """Calculates the color of the stim at a given frame, based on desired
+        timing in desired channel. Gamma corrected and clipped.
+
+        :param frame: current frame number, or array of frame numbers
+        :return: array of rgb values as floats, as frames x rgb if passed an
+         array of frames
         """
         stim_frame_num = frame - self.start_stim
         time_fraction = stim_frame_num * 1.0 / self.draw_duration
-        texture = self.stim.tex
+
+        # broadcast frames against channels
+        if numpy.ndim(frame) > 0:
+            time_fraction = time_fraction[:, numpy.newaxis]
 
         if self.colors is not None:
             _, _, delta, background = self.colors
@@ -1180,21 +2124,28 @@ class StaticStim(StimDefaults):
         if MyWindow.gamma_mon is not None and self.fill_mode not in ['image']:
             color = MyWindow.gamma_mon(color, channel=self.contrast_channel)
 
-        # fill texture array
+        color = numpy.clip(color, -1, 1)
+
+        # adjust other channels
         if self.contrast_channel != 3:
             if self.contrast_opp == 'black':
-                if color[0] > 0:
-                    c = color * -1
-                else:
-                    c = color
+                # flip where red is above background
+                c = color * numpy.where(color[..., 0:1] > 0, -1, 1)
             elif self.contrast_opp == 'opposite':
                 c = color * -1
-            c = numpy.clip(c, -1, 1)
-            c[self.contrast_channel] = color[self.contrast_channel]
+            c[..., self.contrast_channel] = color[..., self.contrast_channel]
 
-            texture[:, :, 0:3] = c
-        else:
-            texture[:, :, 0:3] = color
+            return c
+
+        return color
+
+    def set_tex_color(self, color):
+        """Fills the color channels of the stim texture.
+
+        :param color: list of rgb values
+        """
+        texture = self.stim.tex
+        texture[:, :, 0:3] = color
 
         self.stim.tex = texture
 
@@ -1228,14 +2179,16 @@ class MovingStim(StaticStim):
         # non parameter instance attributes
         self.current_x = None
         self.current_y = None
-        self.frame_counter = None
         self.x_array = None
         self.y_array = None
+        #: Orientation on each frame, if oriented with direction.
+        self.ori_array = None
         self.num_frames = None
-        self.error_count = 0
 
         # to track random motion positions
-        self.log = [[], [0], []]  # angle, frame num, position
+        self.log = [[], [], []]  # angle, frame num, position
+        #: First frame of each segment, i.e. direction, for triggers.
+        self.segment_frames = []
 
     def draw_times(self):
         """Determines during which frames stim should be drawn, based on desired
@@ -1245,8 +2198,9 @@ class MovingStim(StaticStim):
         """
         self.start_stim = int(self.delay + 0.99)
 
-        # need to generate movement to get number of frames
-        self.gen_pos()
+        # all directions up front, enough to reach forced stop
+        self.gen_trajectory(self.num_dirs, max(self.force_stop -
+                                               self.start_stim, 0))
 
         self.end_stim = self.num_frames * self.num_dirs
         self.end_stim += self.start_stim
@@ -1256,8 +2210,7 @@ class MovingStim(StaticStim):
         self.draw_duration = self.end_stim - self.start_stim
 
         if self.trigger:
-            for x in range(self.num_dirs):
-                trigger_frame = self.num_frames * x + self.start_stim
+            for trigger_frame in self.segment_frames[:self.num_dirs]:
                 if trigger_frame not in MyWindow.frame_trigger_list:
                     MyWindow.frame_trigger_list.add(trigger_frame)
 
@@ -1275,31 +2228,70 @@ class MovingStim(StaticStim):
         """
         # check if within animation range
         if self.start_stim <= frame < self.end_stim:
-            # if next coordinate is calculated, moves stim, otherwise calls
-            # gen_movement() and retries
-            try:
-                x, y = self.get_next_pos()
-                self.set_pos(x, y)
+            # trajectory is indexed from first drawn frame
+            i = frame - int(ceil(self.start_stim))
+
+            self.set_pos(self.x_array[i], self.y_array[i])
+            if self.ori_array is not None:
+                self.stim.ori = self.ori_array[i]
 
-                super(MovingStim, self).animate(frame)
+            super(MovingStim, self).animate(frame)
 
-                # to raise errors to stop recursion
-                self.error_count = 0
+    def compile_frames(self):
+        """Slices position (and orientation if oriented with direction) for
+        every frame out of the trajectory, in addition to super.
+
+        :return: :py:class:`StimFrames` instance
+        """
+        frames = super(MovingStim, self).compile_frames()
 
-            except (AttributeError, IndexError, TypeError):
-                self.error_count += 1
-                if self.error_count == 2:
-                    raise
+        frames.pos = numpy.column_stack((self.x_array[:frames.num_frames],
+                                         self.y_array[:frames.num_frames]))
+        if self.ori_array is not None:
+            frames.ori = self.ori_array[:frames.num_frames]
 
-                # make new coordinate array
-                # TODO: don't generate on the fly
-                self.gen_pos()
+        return frames
 
-                # log frame number for RandomlyMovingStim
-                self.log[1].append(frame)
+    def gen_trajectory(self, num_segments=1, length=0):
+        """Generates the whole trajectory before animating, one call to
+        gen_pos() per segment (i.e. direction), into contiguous x_array and
+        y_array indexed from the first drawn frame. The first frame of each
+        segment is kept in segment_frames.
 
-                # retry
-                self.animate(frame)
+        Log is as when segments were generated while animating: angle of each
+        segment, frame it starts on (0 for the first), and stim position
+        before it, i.e. where the last segment ended.
+
+        :param int num_segments: least number of segments to generate.
+        :param int length: least number of frames to generate.
+        """
+        first = int(ceil(self.start_stim))
+        self.log = [[], [], []]
+        self.segment_frames = []
+
+        # random segments start where last one ended
+        self.current_x, self.current_y = self.get_pos()
+
+        xs, ys, oris = [], [], []
+        total = 0
+
+        while len(xs) < num_segments or total < length:
+            self.segment_frames.append(first + total)
+            self.log[2].append((self.current_x, self.current_y))
+            self.gen_pos()
+
+            xs.append(self.x_array)
+            ys.append(self.y_array)
+            oris.append(numpy.full(len(self.x_array), self.stim.ori))
+
+            total += len(self.x_array)
+            self.current_x, self.current_y = self.x_array[-1], self.y_array[-1]
+
+        self.x_array = numpy.concatenate(xs)
+        self.y_array = numpy.concatenate(ys)
+        self.ori_array = numpy.concatenate(oris) if self.ori_with_dir else None
+
+        self.log[1] = [0] + self.segment_frames[1:]
 
     def gen_pos(self):
         """
@@ -1309,9 +2301,6 @@ class MovingStim(StaticStim):
         # update current position trackers
         self.current_x, self.current_y = self.gen_start_pos(self.start_dir)
 
-        # reset frame counter
-        self.frame_counter = 0
-
         # set movement direction (opposite of origin direction)
         angle = self.start_dir + 180
         if angle >= 360:
@@ -1330,33 +2319,19 @@ class MovingStim(StaticStim):
 
         # add to log
         self.log[0].append(angle)
-        self.log[2].append(self.get_pos())
 
         # calculate variables
         travel_distance = ((self.current_x**2 + self.current_y**2) ** 0.5) * 2
         self.num_frames = int(travel_distance / self.speed + 0.99)  # round up
 
-        # generate position array
+        # generate position array, with move delay off screen
         self.x_array, self.y_array = self.gen_pos_array(self.current_x,
                                                         self.current_y,
                                                         self.num_frames,
-                                                        angle)
-
-        # add in move delay by placing stim off screen
-        if self.move_delay > 0:
-            if len(self.stim.size) > 1:
-                max_size = max(self.stim.size)
-            else:
-                max_size = self.stim.size
+                                                        angle,
+                                                        self.move_delay)
 
-            off_x = (GlobalDefaults['display_size'][0] + max_size) / 2
-            off_y = (GlobalDefaults['display_size'][1] + max_size) / 2
-
-            for i in range(self.move_delay):
-                self.x_array = scipy.append(self.x_array, off_x)
-                self.y_array = scipy.append(self.y_array, off_y)
-
-            self.num_frames += self.move_delay
+        self.num_frames += self.move_delay
 
     def gen_start_pos(self, direction):
         """Calculates starting position in x, y coordinates on the starting
@@ -1371,7 +2346,7 @@ class MovingStim(StaticStim):
 
         return start_x, start_y
 
-    def gen_pos_array(self, start_x, start_y, num_frames, angle):
+    def gen_pos_array(self, start_x, start_y, num_frames, angle, pad=0):
         """Creates 2 arrays for x, y coordinates of stims for each frame.
 
         Adapted from code By David L. Morton, used under MIT License. Source:
@@ -1381,29 +2356,42 @@ class MovingStim(StaticStim):
         :param start_y: starting y coordinate
         :param num_frames: number of frames stim will travel for
         :param angle: travel direction
+        :param int pad: number of frames to add after travel with stim off
+         screen, e.g. for move delay
         :return: the x, y coordinates of the stim for every frame as 2 arrays
         """
         dx = self.speed * scipy.sin(angle * scipy.pi / 180.0)
         dy = self.speed * scipy.cos(angle * scipy.pi / 180.0)
 
-        x = scipy.array([start_x + i * dx for i in range(num_frames)])
-        y = scipy.array([start_y + i * dy for i in range(num_frames)])
+        # padding goes in same allocation
+        x = numpy.empty(num_frames + pad)
+        y = numpy.empty(num_frames + pad)
+
+        steps = numpy.arange(num_frames)
+        numpy.multiply(steps, dx, out=x[:num_frames])
+        numpy.multiply(steps, dy, out=y[:num_frames])
+        x[:num_frames] += start_x
+        y[:num_frames] += start_y
+
+        if pad:
+            x[num_frames:], y[num_frames:] = self.off_screen_pos()
 
         return x, y
 
-    def get_next_pos(self):
-        """Returns the next coordinate from x, y_array for animate to set the
-        position of the stim for the next frame.
+    def off_screen_pos(self):
+        """Position where stim is just off screen, used for move delay.
 
         :return: x, y coordinate as tuple
         """
-        x = self.x_array[self.frame_counter]
-        y = self.y_array[self.frame_counter]
+        if len(self.stim.size) > 1:
+            max_size = max(self.stim.size)
+        else:
+            max_size = self.stim.size
 
-        # increment frame counter for next frame
-        self.frame_counter += 1
+        off_x = (GlobalDefaults['display_size'][0] + max_size) / 2
+        off_y = (GlobalDefaults['display_size'][1] + max_size) / 2
 
-        return x, y
+        return off_x, off_y
 
     def set_pos(self, x, y):
         """Position setter. Necessary for alternate position setting in subclasses.
@@ -1437,13 +2425,13 @@ class RandomlyMovingStim(MovingStim):
 
         :return: last frame number as int
         """
-        self.gen_pos()
-
         self.end_stim = super(MovingStim, self).draw_times() - self.end_delay
 
+        # all random segments up front
+        self.gen_trajectory(length=self.end_stim - self.start_stim)
+
         if self.trigger:
-            for x in range(int(self.duration / self.num_frames + 0.99)):
-                trigger_frame = self.num_frames * x + self.start_stim
+            for trigger_frame in self.segment_frames:
                 if trigger_frame not in MyWindow.frame_trigger_list:
                     MyWindow.frame_trigger_list.add(trigger_frame)
 
@@ -1454,18 +2442,11 @@ class RandomlyMovingStim(MovingStim):
         gen_pos_array with proper variables to get new array of
         position coordinates. Overrides super.
         """
-        # update current position
-        self.current_x, self.current_y = self.get_pos()
-
-        # reset frame count
-        self.frame_counter = 0
-
         # random angle between 0 and 360
         angle = self.move_random.randint(0, 360)
 
         # add to log
         self.log[0].append(angle)
-        self.log[2].append(self.get_pos())
 
         # calculate variables, round up
         self.num_frames = int(self.travel_distance / self.speed + 0.99)
@@ -1502,10 +2483,14 @@ class TableStim(MovingStim):
     coordinate, a y coordinate, and whether or not to trigger (as 0 or 1).
 
     Direction: Tab or space separated values. Each line must include a
-    movement speed (pix/sec), a duration (ms), and a direction in degrees.
+    movement speed (pix/sec), a direction in degrees, and a duration (ms).
     Optionally, direction can be replaced with '$' (dollar sign), and the
     direction will default to the global default (can also do use '-$').
     """
+    #: Modification time, table type, and parsed table of each table file
+    #: loaded, by path.
+    tables = {}
+
     def __init__(self, **kwargs):
         """Passes parameters up to super."""
         super(TableStim, self).__init__(**kwargs)
@@ -1522,8 +2507,9 @@ class TableStim(MovingStim):
 
         self.start_stim = self.delay
 
-        # need to generate movement to get number of frames
-        self.gen_pos()
+        # all directions up front, enough to reach forced stop
+        self.gen_trajectory(self.num_dirs, max(self.force_stop -
+                                               int(ceil(self.start_stim)), 0))
 
         self.end_stim = self.num_frames * self.num_dirs
         self.end_stim += self.start_stim
@@ -1545,28 +2531,26 @@ class TableStim(MovingStim):
         return self.end_stim
 
     def gen_pos(self):
-        """Overrides super method. Calls gen_pos_array() and resets frame
-        counter.
+        """Overrides super method. Calls gen_pos_array() for the next
+        direction.
         """
-        self.frame_counter = 0
-        self.x_array, self.y_array = self.gen_pos_array()
+        x, y = self.gen_pos_array()
 
         # orient shape if not an image and fill is uniform
         if self.ori_with_dir:
             self.stim.ori = self.start_dir + self.orientation
 
-        # add in move delay by placing stim off screen
-        if len(self.stim.size) > 1:
-            max_size = max(self.stim.size)
-        else:
-            max_size = self.stim.size
+        # add in move delay by placing stim off screen, in one allocation
+        self.x_array = numpy.empty(self.num_frames + self.move_delay)
+        self.y_array = numpy.empty(self.num_frames + self.move_delay)
 
-        off_x = (GlobalDefaults['display_size'][0] + max_size) / 2
-        off_y = (GlobalDefaults['display_size'][1] + max_size) / 2
+        self.x_array[:self.num_frames] = x
+        self.y_array[:self.num_frames] = y
 
-        for i in range(self.move_delay):
-            self.x_array = scipy.append(self.x_array, off_x)
-            self.y_array = scipy.append(self.y_array, off_y)
+        if self.move_delay > 0:
+            off_x, off_y = self.off_screen_pos()
+            self.x_array[self.num_frames:] = off_x
+            self.y_array[self.num_frames:] = off_y
 
         self.num_frames += self.move_delay
 
@@ -1578,152 +2562,221 @@ class TableStim(MovingStim):
             self.start_dir -= 360
 
     def gen_pos_array(self, *args):
-        """Creates 2 arrays for x, y coordinates of stims for each frame.
+        """Creates 2 arrays for x, y coordinates of stims for each frame, from
+        the parsed table.
 
         :return: the x, y coordinates of the stim for every frame as 2 arrays
         :raises: ImportError: if attempts to load from an Igor file without
          having the igor module.
         :raises: IOError: raised if file contents not properly formatted.
         """
-        table = self.table_filename
-        radii = None
-        x = None
+        table = self.load_table(self.table_filename, self.table_type)
 
-        if table is None:
+        if self.table_type == 'directions':
+            x, y, triggers = self.gen_directions(table)
+            radii = None
+        else:
+            radii = table.get('radii')
+            x = table.get('x')
+            y = table.get('y')
+            triggers = table['triggers']
+
+        # convert pix to micrometers
+        if radii is not None:
+            radii = radii * GlobalDefaults['pix_per_micron']
+        else:
+            x = x * GlobalDefaults['pix_per_micron']
+            y = y * GlobalDefaults['pix_per_micron']
+
+        self.trigger_frames = numpy.flatnonzero(triggers).tolist()
+
+        self.num_frames = len(radii) if radii is not None else len(x)
+
+        # make arrays if polar
+        if self.table_type == 'polar':
+            theta = self.start_dir * -1 - 90  # origins are different in cart
+            x, y = pol2cart(theta, radii)
+
+        return x, y
+
+    def gen_directions(self, table):
+        """Builds positions of a directions table, each segment starting
+        where the last one ended.
+
+        :param table: parsed table, from load_table().
+        :return: x and y of every frame, and whether to trigger on each.
+        """
+        dirs = numpy.empty(len(table['speeds']))
+
+        for i, token in enumerate(table['dirs']):
+            if token in ['$', '-$']:
+                if GlobalDefaults['pref_dir'] == -1:
+                    dirs[i] = 0
+                elif token == '$':
+                    dirs[i] = GlobalDefaults['pref_dir'] + 180
+                else:
+                    dirs[i] = GlobalDefaults['pref_dir']
+            else:
+                try:
+                    dirs[i] = float(token)
+                except ValueError:
+                    raise IOError('Not a direction: {}. Selected file: '
+                                  '{}.'.format(token, self.table_filename))
+
+        frame_rate = GlobalDefaults['frame_rate']
+        lengths = (frame_rate * table['durations'] + 0.99).astype(int)
+        lengths = numpy.maximum(lengths, 0)
+
+        # movement per frame of each segment
+        speeds = table['speeds'] / frame_rate
+        dx = speeds * numpy.sin(dirs * numpy.pi / 180.)
+        dy = speeds * numpy.cos(dirs * numpy.pi / 180.)
+
+        # segment starts, each at last position of previous segment
+        steps = numpy.maximum(lengths - 1, 0)
+        start_x = self.location[0] + numpy.concatenate(
+            [[0], numpy.cumsum(steps * dx)[:-1]])
+        start_y = self.location[1] + numpy.concatenate(
+            [[0], numpy.cumsum(steps * dy)[:-1]])
+
+        first = numpy.concatenate([[0], numpy.cumsum(lengths)[:-1]])
+        segment = numpy.repeat(numpy.arange(len(lengths)), lengths)
+        step = numpy.arange(lengths.sum()) - first[segment]
+
+        x = start_x[segment] + step * dx[segment]
+        y = start_y[segment] + step * dy[segment]
+
+        triggers = numpy.zeros(len(x), dtype=int)
+        triggers[first[lengths > 0]] = 1
+        triggers[-1] = 1  # trigger on last frame
+
+        return x, y, triggers
+
+    @classmethod
+    def load_table(cls, filename, table_type):
+        """Loads and parses a table file. Parsed tables are cached by path,
+        so each file is only parsed once however many directions or reps use
+        it, and parsed again if changed.
+
+        :param filename: path of table file.
+        :param table_type: 'polar', 'coordinate', or 'directions'.
+        :return: dict of parsed columns as arrays, in table units.
+        :raises: ImportError: if attempts to load from an Igor file without
+         having the igor module.
+        :raises: IOError: raised if file contents not properly formatted.
+        """
+        if filename is None:
             raise IOError('No table file selected')
 
-        if not os.path.exists(table):
-            raise IOError('No such table file: {}'.format(table))
+        if not os.path.exists(filename):
+            raise IOError('No such table file: {}'.format(filename))
+
+        path = os.path.abspath(filename)
+        tag = (os.path.getmtime(filename), table_type)
+
+        # replaces entry of file if since changed, so one per file
+        if path not in cls.tables or cls.tables[path][:2] != tag:
+            table = cls.parse_table(filename, table_type)
+
+            # shared between stims, so must not be changed
+            for column in table.values():
+                column.flags.writeable = False
+
+            cls.tables[path] = tag + (table,)
+
+        return cls.tables[path][2]
+
+    @staticmethod
+    def parse_table(filename, table_type):
+        """Parses a table file. See load_table().
+        """
+        error = IOError('File contents not a supported format. See docs for '
+                        'reference. Selected file: {}.'.format(filename))
+        columns = {'polar': 2, 'coordinate': 3, 'directions': 3}
+        ext = os.path.splitext(filename)[1]
 
         # if text file
-        if os.path.splitext(table)[1] == '.txt':
-            with open(table, 'r') as f:
-                lines = [line.strip() for line in f]
+        if ext == '.txt':
+            with open(filename, 'r') as f:
+                text = f.read()
 
-            if self.table_type == 'polar':
-                radii = [i.split()[0] for i in lines]
-                trigger_list = [i.split()[1] for i in lines]
+            if table_type not in columns:
+                raise error
 
-            elif self.table_type == 'coordinate':
-                x = [i.split()[0] for i in lines]
-                y = [i.split()[1] for i in lines]
-                try:
-                    trigger_list = [i.split()[2] for i in lines]
-                except IndexError:
-                    raise IOError('File contents not a supported format. See '
-                                  'docs for reference. Selected file: {}.'.
-                                  format(self.table_filename))
-
-            elif self.table_type == 'directions':
-
-                x = numpy.array([])
-                y = numpy.array([])
-                trigger_list = []
-
-                for line in lines:
-                    if len(x) == 0:
-                        start_x = self.location[0]
-                        start_y = self.location[1]
-                    else:
-                        start_x = x[-1]
-                        start_y = y[-1]
-
-                    speed = float(line.split()[0])
-                    dur = float(line.split()[2]) / 1000  # convert ms to sec
-                    try:
-                        dir = float(line.split()[1])
-                    except ValueError:
-                        if line.split()[1] == '$':
-                            if GlobalDefaults['pref_dir'] != -1:
-                                dir = GlobalDefaults['pref_dir'] + 180
-                            elif GlobalDefaults['pref_dir'] == -1:
-                                dir = 0
-                        elif line.split()[1] == '-$':
-                            if GlobalDefaults['pref_dir'] != -1:
-                                dir = GlobalDefaults['pref_dir']
-                            elif GlobalDefaults['pref_dir'] == -1:
-                                dir = 0
-
-                    num_frames = int(GlobalDefaults['frame_rate'] * dur + 0.99)
-                    trigger_list.append(1)
-                    trigger_list.extend([0] * (num_frames - 1))
-                    self.speed = speed * (1.0 / GlobalDefaults['frame_rate'])
-
-                    x_to_app, y_to_app = super(TableStim,
-                                               self).gen_pos_array(start_x,
-                                                                   start_y,
-                                                                   num_frames,
-                                                                   dir)
-
-                    x = numpy.append(x, x_to_app)
-                    y = numpy.append(y, y_to_app)
-
-            trigger_list[0] = 1   # trigger on first frame
-            trigger_list[-1] = 1  # trigger on last frame
+            num_columns = columns[table_type]
+
+            rows = [line.split() for line in text.splitlines()
+                    if line.strip()]
+
+            if not rows or min(len(row) for row in rows) < num_columns:
+                raise error
+
+            # extra columns after those used are ignored
+            tokens = numpy.array([row[:num_columns] for row in rows])
+
+            try:
+                if table_type == 'directions':
+                    return dict(speeds=tokens[:, 0].astype(float),
+                                dirs=tokens[:, 1],
+                                durations=tokens[:, 2].astype(float) / 1000)
+
+                values = tokens.astype(float)
+            except ValueError:
+                raise error
+
+            if table_type == 'polar':
+                table = dict(radii=values[:, 0])
+            else:
+                table = dict(x=values[:, 0], y=values[:, 1])
+
+            triggers = values[:, -1].astype(int)
 
         # if igor binary wave format or packed experiment format
-        elif os.path.splitext(table)[1] in ['.ibw', '.pxp']:
-            if has_igor:
-                if os.path.splitext(table)[1] == '.ibw':
-                    if self.table_type == 'polar':
-                        radii = binarywave.load(table)['wave']['wData']
-                    else:
-                        raise IOError('.ibw format does not support '
-                                      'coordinate table type')
-
-                elif os.path.splitext(table)[1] == '.pxp':
-                    if self.table_type == 'polar':
-                        radii = packed.load(table)[1]['root']['wave0'].wave[
-                            'wave']['wData']
-                        trigger_list = packed.load(table)[1]['root'][
-                            'wave1'].wave['wave']['wData']
-
-                    if self.table_type == 'coordinate':
-                        x = packed.load(table)[1]['root']['wave0'].wave[
-                            'wave']['wData']
-                        y = packed.load(table)[1]['root']['wave1'].wave[
-                            'wave']['wData']
-                        trigger_list = packed.load(table)[1]['root'][
-                            'wave2'].wave['wave']['wData']
-
-                    trigger_list[0] = 1   # trigger on first frame
-                    trigger_list[-1] = 1  # trigger on last frame
-
-            elif not has_igor:
+        elif ext in ['.ibw', '.pxp']:
+            if not has_igor:
                 raise ImportError('Need igor python module to load \'.ibw\' '
                                   'or \'.pxp\' formats. Install module with '
                                   '\'pip install igor\'.')
 
-        # convert strings to floats, and convert to pix to micrometers
-        if radii is not None:
-            radii = map(float, radii)
-            radii = [r * GlobalDefaults['pix_per_micron'] for r in radii]
-        elif x is not None:
-            x = map(float, x)
-            y = map(float, y)
-            x = [i * GlobalDefaults['pix_per_micron'] for i in x]
-            y = [i * GlobalDefaults['pix_per_micron'] for i in y]
-        else:
-            raise IOError('File contents not a supported format. See docs for '
-                          'reference. Selected file: {}.'.
-                          format(self.table_filename))
+            if ext == '.ibw':
+                if table_type != 'polar':
+                    raise IOError('.ibw format does not support '
+                                  'coordinate table type')
 
-        if trigger_list is not None:
-            trigger_list = map(int, trigger_list)
-            self.trigger_frames = []
+                radii = binarywave.load(filename)['wave']['wData']
+                table = dict(radii=numpy.array(radii, dtype=float))
 
-            for i in range(len(trigger_list)):
-                if trigger_list[i] == 1:
-                    self.trigger_frames.append(i)
+                # only triggers on first coordinate
+                triggers = numpy.zeros(len(radii), dtype=int)
+                triggers[0] = 1
 
-        self.num_frames = len(radii) if radii is not None else len(x)
+                table['triggers'] = triggers
+                return table
 
-        # make arrays if polar
-        if self.table_type == 'polar':
-            theta = self.start_dir * -1 - 90  # origins are different in cart
-            x, y = map(list, zip(*[pol2cart(theta, r) for r in radii]))
+            # load once, then take waves
+            root = packed.load(filename)[1]['root']
 
-        return x, y
+            def wave(name):
+                return numpy.array(root[name].wave['wave']['wData'])
+
+            if table_type == 'polar':
+                table = dict(radii=wave('wave0').astype(float))
+                triggers = wave('wave1').astype(int)
+            elif table_type == 'coordinate':
+                table = dict(x=wave('wave0').astype(float),
+                             y=wave('wave1').astype(float))
+                triggers = wave('wave2').astype(int)
+            else:
+                raise error
+
+        else:
+            raise error
+
+        triggers[0] = 1   # trigger on first frame
+        triggers[-1] = 1  # trigger on last frame
+        table['triggers'] = triggers
+
+        return table
 
 
 class ImageJumpStim(StaticStim):
@@ -1739,12 +2792,164 @@ class ImageJumpStim(StaticStim):
         self.slice_index = 0
         self.slice_list = []
         self.slice_log = []
-        self.jumpstim_list = []
+        #: One permutation seed per jump, see :py:func:`shuffle_pixels`.
+        self.shuffle_seeds = None
+        #: Batch of shuffled slices, and jump number of first.
+        self.shuffled = None
+        self.shuffled_start = None
+        #: Pairs of stim and small stim; one shown, other gets next slice.
+        self.jump_stims = []
+        #: Texture shown before first jump.
+        self.first_tex = None
+        self.next_loaded = False
+        self.num_loaded = 0
 
-    def gen_texture(self):
+    def make_stim(self):
+        """Creates psychopy stims, plus a spare to upload the next slice into
+        ahead of time, so jumps only swap stims. Starts preparing slices.
         """
-        Keeps copy of og texture
-        :return:
+        super(ImageJumpStim, self).make_stim()
+
+        spare = MyWindow.visual.GratingStim(win=MyWindow.win,
+                                            size=self.stim.size,
+                                            mask=self.stim.mask,
+                                            tex=None,
+                                            pos=self.location,
+                                            phase=self.phase,
+                                            ori=self.orientation,
+                                            autoLog=False,
+                                            texRes=2**10,
+                                            units='pix')
+        small_spare = None
+
+        if self.small_stim is not None:
+            small_spare = MyWindow.visual.GratingStim(win=MyWindow.small_win,
+                                                      size=self.stim.size,
+                                                      mask=self.stim.mask,
+                                                      tex=None,
+                                                      pos=self.location,
+                                                      phase=self.phase,
+                                                      ori=self.orientation,
+                                                      autoLog=False)
+
+        self.jump_stims = [(self.stim, self.small_stim), (spare, small_spare)]
+        self.first_tex = self.stim.tex
+
+        self.start_slices()
+
+    def start_slices(self):
+        """Starts preparing slices from the first jump, and uploads the first
+        into the spare stim.
+        """
+        self.slice_index = 0
+        self.num_loaded = 0
+        self.next_loaded = False
+
+        if self.num_jumps:
+            self.ring = PrefetchRing(self.fill_slice, self.num_jumps,
+                                     self.slice_list[0].shape,
+                                     self.orig_tex.dtype)
+            self.load_next()
+
+    def reset(self):
+        """Jumps start over from the first slice.
+        """
+        super(ImageJumpStim, self).reset()
+
+        if self.ring is not None:
+            self.ring.stop()
+
+        self.start_slices()
+
+    def fill_slice(self, index, out):
+        """Copies slice into buffer, shuffled if needed. Called from
+        :py:class:`PrefetchRing` thread. Shuffles one batch of slices per
+        ring slot at a time, starting at the slice asked for.
+
+        :param int index: jump number.
+        :param out: buffer to fill.
+        """
+        if not self.shuffle:
+            out[...] = self.slice_list[index]
+            return
+
+        if self.shuffled_start is None or \
+                not 0 <= index - self.shuffled_start < len(self.shuffled):
+            stop = min(index + PrefetchRing.num_slots, self.num_jumps)
+
+            self.shuffled = shuffle_pixels(
+                numpy.stack(self.slice_list[index:stop]),
+                self.shuffle_seeds[index:stop], self.image_channel)
+            self.shuffled_start = index
+
+        out[...] = self.shuffled[index - self.shuffled_start]
+
+    def load_next(self):
+        """Uploads next prepared slice into spare stim, from the ring if
+        started, else prepared here.
+        """
+        if self.ring is not None:
+            slot, tex = self.ring.get()
+        else:
+            tex = numpy.empty(self.slice_list[0].shape, self.orig_tex.dtype)
+            self.fill_slice(self.num_loaded, tex)
+
+        self.set_jump_tex(self.jump_stims[1], tex)
+
+        if self.ring is not None:
+            self.ring.release(slot)
+        self.next_loaded = True
+        self.num_loaded += 1
+
+    def set_jump_tex(self, stims, tex):
+        """Uploads texture into a pair of stim and small stim.
+
+        :param stims: pair from jump_stims.
+        :param tex: texture to upload.
+        """
+        stim, small_stim = stims
+        stim.setTex(tex)
+        if small_stim is not None:
+            small_stim.setTex(tex)
+
+    def seek(self, frame):
+        """Uploads the slice shown just before a frame, and the one after it
+        into the spare stim, straight from the slice list. Stops preparing
+        slices ahead; later slices are prepared when needed.
+
+        :param int frame: frame number
+        """
+        super(ImageJumpStim, self).seek(frame)
+
+        if self.ring is not None:
+            self.ring.stop()
+            self.ring = None
+
+        # jumps are on frames that are multiples of move delay
+        start = int(ceil(self.start_stim))
+        jumps = max((frame - 1) // self.move_delay -
+                    (start - 1) // self.move_delay, 0)
+        jumps = min(jumps, self.num_jumps)
+
+        if jumps:
+            tex = numpy.empty(self.slice_list[0].shape, self.orig_tex.dtype)
+            self.fill_slice(jumps - 1, tex)
+        else:
+            tex = self.first_tex
+        self.set_jump_tex(self.jump_stims[0], tex)
+
+        self.slice_index = jumps
+        self.num_loaded = jumps
+        self.next_loaded = False
+
+        if jumps < self.num_jumps:
+            self.load_next()
+
+    def gen_texture(self):
+        """Scales image to drawn size and generates slices to jump between.
+        Done in numpy at the target resolution, so never needs the window.
+
+        :return: scaled image as numpy array
         """
         mock_jump = StaticStim(image_filename=self.image_filename,
                                image_channel=['red', 'green', 'blue', 'all'][
@@ -1755,63 +2960,22 @@ class ImageJumpStim(StaticStim):
 
         tex = mock_jump.gen_texture()
 
-        MyWindow.close_win()
-        cap_win = visual.Window(units='pix', size=self.image_size)
-
-        mock_stim = visual.GratingStim(win=cap_win,
-                                       size=self.image_size,
-                                       mask=None,
-                                       tex=tex,
-                                       autoLog=False)
-        mock_stim.draw()
-        tex = cap_win._getRegionOfFrame(buffer='back')
-        cap_win.close()
-        MyWindow.make_win()
-        cap = numpy.asarray(tex.transpose(Image.FLIP_TOP_BOTTOM))
-        cap = uint8_float(cap)
+        # stretch to image size, nearest neighbour like drawing the texture
+        height, width = int(self.image_size[1]), int(self.image_size[0])
+        rows = numpy.arange(height) * tex.shape[0] // height
+        cols = numpy.arange(width) * tex.shape[1] // width
 
-        self.orig_tex = cap
+        self.orig_tex = tex[rows][:, cols, 0:3]
 
         self.gen_slice_list()
 
-        # Pushing textures is slow, but preloading textures is memory
-        # expensive. Generating shuffled textures is too slow, so preload
-        # those, but do other slices on the fly.
+        # logged, so shuffled slices can be rebuilt without replaying
+        self.shuffle_seeds = numpy.random.SeedSequence(
+            self.move_seed).generate_state(self.num_jumps)
+        self.shuffled = None
+        self.shuffled_start = None
 
-        numpy.random.seed(self.move_seed)
-        # clock = core.Clock()
-
-        if self.shuffle:
-            for i, slice in enumerate(tqdm(self.slice_list)):
-                temp_stim = visual.GratingStim(win=MyWindow.win,
-                                               size=self.gen_size(),
-                                               mask=self.gen_mask(),
-                                               tex=slice,
-                                               pos=self.location,
-                                               phase=self.phase,
-                                               ori=self.orientation,
-                                               autoLog=False,
-                                               texRes=2**10)
-
-                # want to shuffle scaled tex, so draw to back and pull, then
-                # shuffle that
-                temp_stim.draw()
-                image = MyWindow.win._getRegionOfFrame(buffer='back')
-                MyWindow.win.clearBuffer()
-                cap = numpy.asarray(image) / 255.0 * 2 - 1
-
-                if self.image_channel != 3:
-                    numpy.random.shuffle(cap.reshape(-1, cap.shape[-1])
-                                         .T[self.image_channel])
-                else:
-                    # TODO: faster randomizing
-                    numpy.random.shuffle(cap.reshape(-1, cap.shape[-1]))
-
-                # slice = cap
-                temp_stim.setTex(cap)
-                self.jumpstim_list.append(temp_stim)
-
-        return tex
+        return self.orig_tex
 
     def gen_size(self):
         """
@@ -1860,21 +3024,29 @@ class ImageJumpStim(StaticStim):
         if self.start_stim <= frame < self.end_stim:
 
             if frame % self.move_delay == 0:
-                if self.shuffle:
-                    self.stim = self.jumpstim_list[self.slice_index]
-                else:
-                    self.stim.setTex(self.slice_list[self.slice_index])
+                if not self.next_loaded:
+                    self.load_next()
 
-                    if self.small_stim is not None:
-                        self.small_stim.setTex(self.slice_list[
-                                               self.slice_index])
+                # swap in stim with next slice
+                self.jump_stims.reverse()
+                self.stim, self.small_stim = self.jump_stims[0]
+                self.next_loaded = False
 
                 self.slice_index += 1
 
+            # upload following slice on frames between jumps
+            elif not self.next_loaded and self.num_loaded < self.num_jumps:
+                self.load_next()
+
             super(ImageJumpStim, self).animate(frame)
 
         # print clock.getTime() * 1000
 
+    def compile_frames(self):
+        """Textures are swapped on the fly, so not compiled.
+        """
+        return None
+
     def gen_slice(self, *args):
         """Slices the original texture and returns slice, i.e. a smaller
         section of the original image that will be zoomed in.
@@ -1942,19 +3114,22 @@ def board_texture_class(bases, **kwargs):
             # instance attributes
             self.index = None
             self.colors = None
+            #: Board center relative to field position, for texture backend.
+            self.offset = None
+            self.tex_buffer = None
+            #: :py:class:`NoiseEngine` for noise boards.
+            self.noise = None
+            self.noise_update = 0
 
         def make_stim(self):
             """Creates instance of psychopy stim object.
             """
-            # array of coordinates for each element
-            xys = []
-            # populate xys
+            # array of coordinates for each element, rows of x within y
             low, high = self.num_check // -2, self.num_check // 2
-
-            for y in range(low, high):
-                for x in range(low, high):
-                    xys.append((self.check_size[0] * x,
-                                self.check_size[1] * y))
+            x, y = numpy.meshgrid(numpy.arange(low, high) * self.check_size[0],
+                                  numpy.arange(low, high) * self.check_size[1])
+            xys = numpy.column_stack((x.ravel(), y.ravel()))
+            self.offset = numpy.array(self.check_size) * (low + high - 1) / 2.
 
             # get colors
             self.high, self.low, _, _ = self.gen_rgb()
@@ -1984,108 +3159,254 @@ def board_texture_class(bases, **kwargs):
                 if self.check_type == 'board':
                     self.index[0::2, 0::2] = 1
                     self.index[1::2, 1::2] = 1
-                    self.index = numpy.concatenate(self.index[:])
+                    self.index = self.index.ravel()
 
                 # randomly populate for a random checkerboard
                 elif self.check_type == 'random':
-                    self.index = numpy.concatenate(self.index[:])
-                    for i in range(len(self.index)):
-                        self.index[i] = self.fill_random.randint(0, 1)
+                    self.index = self.index.ravel()
+                    self.index[:] = random_binary(self.fill_random,
+                                                  self.num_check ** 2)
 
                 # use index to assign colors for board and random
+                on = self.index.astype(bool)
                 if len(self.low.shape) == 0:
-                    self.colors[numpy.where(self.index),
-                                self.contrast_channel] = self.high
+                    self.colors[on, self.contrast_channel] = self.high
                 else:
-                    self.colors[numpy.where(self.index)] = self.high[:3]
+                    self.colors[on] = self.high[:3]
 
             elif self.check_type in ['noise', 'noisy noise']:
-                numpy.random.seed(self.fill_seed)
+                self.make_noise()
 
-                if len(self.low.shape) == 0:
-                    # self.colors[:, self.contrast_channel] = numpy.random.uniform(
-                        # low=self.low, high=self.high, size=self.num_check**2)
-                    self.colors[:, self.contrast_channel] = numpy.random.randint(
-                        low=0, high=2, size=self.num_check**2) * 2 - 1
-                else:
-                    #r = numpy.random.uniform(low=self.low[0], high=self.high[0], size=self.num_check**2)
-                    #g = numpy.random.uniform(low=self.low[1], high=self.high[1], size=self.num_check**2)
-                    #b = numpy.random.uniform(low=self.low[2], high=self.high[2], size=self.num_check**2)
-                    r = numpy.random.randint(low=0, high=2, size=self.num_check**2) * 2 - 1
-                    #g = numpy.random.randint(low=0, high=1, size=self.num_check**2) * 2 - 1
-                    #b = numpy.random.randint(low=0, high=1, size=self.num_check**2) * 2 - 1
-                    self.colors[:] = numpy.dstack([r, r, r])
-
-                # gamma correct
-                if MyWindow.gamma_mon is not None:
-                    self.colors = MyWindow.gamma_mon(self.colors)
-
-            self.stim = visual.ElementArrayStim(MyWindow.win,
-                                                xys=xys,
-                                                colors=self.colors,
-                                                nElements=self.num_check**2,
-                                                elementMask=None,
-                                                elementTex=None,
-                                                sizes=(self.check_size[0],
-                                                       self.check_size[1]),
-                                                autoLog=False)
+            if self.check_backend == 'texture':
+                self.make_texture_stims()
+                return
+
+            self.stim = MyWindow.visual.ElementArrayStim(MyWindow.win,
+                                                         xys=xys,
+                                                         colors=self.colors,
+                                                         nElements=self.num_check**2,
+                                                         elementMask=None,
+                                                         elementTex=None,
+                                                         sizes=(self.check_size[0],
+                                                                self.check_size[1]),
+                                                         autoLog=False)
 
             self.stim.size = (self.check_size[0] * self.num_check,
                               self.check_size[1] * self.num_check)
 
             if MyWindow.small_win is not None:
 
-                self.small_stim = visual.ElementArrayStim(MyWindow.small_win,
-                                                          xys=xys,
-                                                          colors=self.colors,
-                                                          nElements=self.num_check**2,
-                                                          elementMask=None,
-                                                          elementTex=None,
-                                                          sizes=(self.check_size[0],
-                                                                 self.check_size[1]),
-                                                          autoLog=False)
+                self.small_stim = MyWindow.visual.ElementArrayStim(MyWindow.small_win,
+                                                                   xys=xys,
+                                                                   colors=self.colors,
+                                                                   nElements=self.num_check**2,
+                                                                   elementMask=None,
+                                                                   elementTex=None,
+                                                                   sizes=(self.check_size[0],
+                                                                          self.check_size[1]),
+                                                                   autoLog=False)
 
                 self.small_stim.size = (self.check_size[0] * self.num_check,
                                         self.check_size[1] * self.num_check)
 
+        def make_noise(self):
+            """Creates noise engine, seeded from fill seed, and colors board
+            with its first frame.
+            """
+            # noise is around background, out to high
+            background = numpy.array(GlobalDefaults['background'],
+                                     dtype=numpy.float64)
+            if len(self.high.shape) == 0:
+                amp = numpy.zeros(3)
+                amp[self.contrast_channel] = \
+                    self.high - background[self.contrast_channel]
+                channel = self.contrast_channel
+            else:
+                amp = self.high[:3] - background
+                channel = 3
+
+            self.noise = NoiseEngine(self.num_check ** 2,
+                                     self.fill_seed,
+                                     self.noise_dist,
+                                     mid=background,
+                                     amp=amp,
+                                     channel=channel)
+
+            # draw ahead if updating
+            if self.check_type == 'noisy noise':
+                self.noise.start()
+                self.ring = self.noise.ring
+
+            self.noise.next_colors(self.colors)
+            self.noise_update = 0
+
+        def reset(self):
+            """Noise starts over from its seed, so each rep shows the same
+            noise.
+            """
+            if self.noise is not None:
+                self.noise.stop()
+                self.make_noise()
+                self.set_rgb(self.colors)
+
+        def seek(self, frame):
+            """Colors board with the noise frame shown on a frame, drawn
+            directly from its counter (see :py:meth:`NoiseEngine.seek`).
+            Noise updates after it are drawn when needed, rather than ahead.
+
+            :param int frame: frame number
+            """
+            if self.check_type != 'noisy noise':
+                return
+
+            update = max(int((frame - self.start_stim) * self.noise_rate /
+                             GlobalDefaults['frame_rate']), 0)
+
+            self.noise.seek(update)
+            self.noise.next_colors(self.colors)
+            self.noise_update = update
+            self.ring = None
+
+            self.set_rgb(self.colors)
+
+        def make_texture_stims(self):
+            """Creates stims for texture backend. Whole board is one quad,
+            with each check a texel magnified without interpolation, so color
+            changes are one small texture upload.
+
+            Psychopy needs square power of two textures, so the board is in
+            the bottom left of a padded texture (see board_tex()), and sf and
+            phase map only the texels of the board onto the quad.
+            """
+            size = numpy.array((self.check_size[0] * self.num_check,
+                                self.check_size[1] * self.num_check),
+                               dtype=numpy.float64)
+            tex = self.board_tex(self.colors)
+
+            # texture coordinates from 0 to fraction of texture used
+            used = self.num_check / float(len(tex))
+            sf = used / size
+            phase = (0.5 - used / 2., 0.5 - used / 2.)
+
+            self.stim = MyWindow.visual.GratingStim(MyWindow.win,
+                                                    tex=tex,
+                                                    size=size,
+                                                    pos=self.offset,
+                                                    sf=sf,
+                                                    phase=phase,
+                                                    mask=None,
+                                                    interpolate=False,
+                                                    autoLog=False,
+                                                    units='pix')
+
+            if MyWindow.small_win is not None:
+                self.small_stim = MyWindow.visual.GratingStim(MyWindow.small_win,
+                                                              tex=tex,
+                                                              size=size,
+                                                              pos=self.offset,
+                                                              sf=sf,
+                                                              phase=phase,
+                                                              mask=None,
+                                                              interpolate=False,
+                                                              autoLog=False)
+
+        def board_tex(self, colors):
+            """Arranges element colors into texture, one texel per check, in
+            the bottom left of a square power of two texture. Elements are in
+            rows from the bottom, like textures. Reuses the same array for
+            every update.
+
+            :param colors: array of rgb values for each element
+            :return: RGBA texture as numpy array
+            """
+            if self.tex_buffer is None:
+                side = 2 ** int(ceil(numpy.log2(self.num_check)))
+                self.tex_buffer = numpy.ones((side, side, 4),
+                                             dtype=numpy.float32)
+
+            self.tex_buffer[:self.num_check, :self.num_check, 0:3] = \
+                colors.reshape(self.num_check, self.num_check, 3)
+
+            return self.tex_buffer
+
+        def start_recording(self, path):
+            """Records each noise frame shown, as palette indices. Call after
+            draw_times().
+
+            :param path: folder to record to.
+            """
+            meta = dict(frame_shape=[self.num_check, self.num_check],
+                        check_size=list(self.check_size),
+                        distribution=self.noise_dist,
+                        fill_seed=self.fill_seed,
+                        noise_rate=self.noise_rate,
+                        frame_rate=GlobalDefaults['frame_rate'],
+                        end_frame=self.end_stim,
+                        palette=self.noise.palette.tolist())
+
+            self.recorder = FrameWriter(path,
+                                        self.num_check ** 2,
+                                        NoiseEngine.levels[self.noise_dist],
+                                        meta=meta)
+
+            # first frame is made with stim
+            self.recorder.write(self.noise.frame, self.start_stim)
+
         def gen_timing(self, frame):
-            """ElementArrayStim does not support assigning alpha values.
+            """Updates noise boards at noise rate. ElementArrayStim does not
+            support assigning alpha values, so nothing else changes.
 
             :param int frame: current frame number
             """
-            if frame % (60 // 5) != 0:
+            # boards without noise are fixed
+            if self.noise is None:
                 return
-            
-            if len(self.low.shape) == 0:
-                #self.colors[:, self.contrast_channel] = numpy.random.uniform(
-                    #low=self.low, high=self.high, size=self.num_check**2)
-                
-                self.colors[:, self.contrast_channel] = numpy.random.randint(
-                     low=0, high=2, size=self.num_check**2) * 2 - 1
-                print(self.colors[0, :])
-            else:
-                #r = numpy.random.uniform(low=self.low[0], high=self.high[0], size=self.num_check**2)
-                #g = numpy.random.uniform(low=self.low[1], high=self.high[1], size=self.num_check**2)
-                #b = numpy.random.uniform(low=self.low[2], high=self.high[2], size=self.num_check**2)
-                r = numpy.random.randint(low=0, high=2, size=self.num_check**2) * 2 - 1
-                self.colors[:] = numpy.dstack([r, r, r])
 
-            # gamma correct
-            if MyWindow.gamma_mon is not None:
-                self.colors = MyWindow.gamma_mon(self.colors)
+            update = int((frame - self.start_stim) * self.noise_rate /
+                         GlobalDefaults['frame_rate'])
+
+            if update <= self.noise_update:
+                return
+
+            self.noise.next_colors(self.colors,
+                                   step=update - self.noise_update)
+            self.noise_update = update
+
+            if self.recorder is not None:
+                self.recorder.write(self.noise.frame, frame)
 
-            self.stim.setColors(self.colors)
+            self.set_rgb(self.colors)
 
         def gen_phase(self):
             """ElementArrayStim does not support texture phase.
             """
             pass
 
+        def compile_frames(self):
+            """Noise is generated on the fly, so only compile otherwise.
+
+            :return: :py:class:`StimFrames` instance, or None
+            """
+            if self.check_type == 'noisy noise' or self.timing != 'step':
+                return None
+
+            frames = super(BoardTexture, self).compile_frames()
+            frames.phase = None
+
+            return frames
+
         def set_rgb(self, colors):
             """Colors setter.
 
             :param colors: array of rgb values for each element
             """
+            if self.check_backend == 'texture':
+                tex = self.board_tex(colors)
+                self.stim.tex = tex
+                if self.small_stim is not None:
+                    self.small_stim.tex = tex
+                return
+
             self.stim.setColors(colors)
             if self.small_stim is not None:
                 self.small_stim.setColors(colors)
@@ -2096,6 +3417,13 @@ def board_texture_class(bases, **kwargs):
             :param x: x coordinate
             :param y: y coordinate
             """
+            if self.check_backend == 'texture':
+                pos = numpy.array((x, y)) + self.offset
+                self.stim.pos = pos
+                if self.small_stim is not None:
+                    self.small_stim.pos = pos
+                return
+
             self.stim.setFieldPos((x, y))
             if self.small_stim is not None:
                 self.small_stim.setFieldPos((x, y))
@@ -2103,6 +3431,9 @@ def board_texture_class(bases, **kwargs):
         def get_pos(self):
             """Position getter.
             """
+            if self.check_backend == 'texture':
+                return self.stim.pos - self.offset
+
             return self.stim.fieldPos
 
     return BoardTexture()
@@ -2123,11 +3454,11 @@ def movie_stim_class(bases, **kwargs):
         def make_stim(self):
             """Creates instance of psychopy stim object.
             """
-            self.stim = visual.MovieStim(win=MyWindow.win,
-                                         filename=self.movie_filename,
-                                         pos=self.location,
-                                         size=self.movie_size,
-                                         loop=True)
+            self.stim = MyWindow.visual.MovieStim(win=MyWindow.win,
+                                                  filename=self.movie_filename,
+                                                  pos=self.location,
+                                                  size=self.movie_size,
+                                                  loop=True)
 
         def animate(self, frame):
             """
@@ -2143,9 +3474,49 @@ def movie_stim_class(bases, **kwargs):
 
             super(MovieStim, self).animate(frame)
 
+        def reset(self):
+            """Plays movie from the start.
+            """
+            self.stim.seek(0.0)
+            self.stim.play()
+
+        def seek(self, frame):
+            """Moves movie to the time of a frame.
+
+            :param int frame: frame number
+            """
+            self.stim.seek(max(frame - self.start_stim, 0) /
+                           GlobalDefaults['frame_rate'])
+
+        def compile_frames(self):
+            """Movies are decoded on the fly, so not compiled.
+            """
+            return None
+
     return MovieStim()
 
 
+def log_path(time_at_run):
+    """Function to get log folder of a run, making it if needed. Logs are in
+    a folder for each day, then for each time of run, i.e.
+    logs_dir/YYYY_MM_DD/HHhMMmSSs/. Every log file and noise store of a run
+    is written to this folder.
+
+    :param time_at_run: Time at which stims were run
+    :return: path of folder
+    """
+    path = config.get('StimProgram', 'logs_dir')
+
+    # day folder, then time folder
+    path = os.path.join(path, strftime('%Y_%m_%d', time_at_run),
+                        strftime('%Hh%Mm%Ss', time_at_run))
+
+    if not os.path.exists(path):
+        os.makedirs(path)
+
+    return path
+
+
 def log_stats(count_reps, reps, count_frames, num_frames, elapsed_time,
               stim_list, to_animate, time_at_run):
     """Function to write information about stims to file.
@@ -2162,22 +3533,7 @@ def log_stats(count_reps, reps, count_frames, num_frames, elapsed_time,
     current_time = time_at_run
     current_time_string = strftime('%Y_%m_%d_%H%M%S', current_time)
 
-    path = config.get('StimProgram', 'logs_dir')
-    if not os.path.exists(path):
-        os.makedirs(path)
-
-    # day folder
-    # path += strftime('%Y_%m_%d', current_time) + '\\'
-    path = os.path.join(path, strftime('%Y_%m_%d', current_time))
-    if not os.path.exists(path):
-        os.makedirs(path)
-
-    # time folder
-    # path += strftime('%Hh%Mm%Ss', current_time) + '\\'
-    path = os.path.join(path, strftime('%Hh%Mm%Ss', current_time))
-
-    if not os.path.exists(path):
-        os.makedirs(path)
+    path = log_path(current_time)
 
     # filename format: stimlog_[time]_[stimtype].txt
     file_name = 'stimlog_' + current_time_string + '_' + stim_list[
@@ -2215,21 +3571,28 @@ def log_stats(count_reps, reps, count_frames, num_frames, elapsed_time,
 
         f.write(pickle.dumps(to_write))
 
+    # global defaults as run, so frames can be rebuilt from the log
+    with open(os.path.join(path, 'globals_' + current_time_string + '.json'),
+              'w') as f:
+        json.dump(GlobalDefaults.defaults, f, indent=4,
+                  default=lambda value: numpy.asarray(value).tolist())
+
     for i in range(len(stim_list)):
-        if stim_list[i].parameters['shape'] != 'annulus':
+        if stim_list[i].parameters.get('shape') != 'annulus':
 
-            if stim_list[i].stim_type == 'RandomlyMovingStim':
+            # types as in stim_factory()
+            if stim_list[i].stim_type == 'random':
                 file_name = 'Randomlog_' + current_time_string + '.txt'
 
-            if stim_list[i].stim_type == 'MovingStim':
+            if stim_list[i].stim_type == 'moving':
                 file_name = 'Movinglog_' + current_time_string + '.txt'
 
-            if stim_list[i].stim_type == 'ImageJumpStim':
+            if stim_list[i].stim_type == 'jump':
                 file_name = 'Jumpinglog_' + current_time_string + '.txt'
 
-            if stim_list[i].stim_type in ['RandomlyMovingStim', 'MovingStim']:
+            if stim_list[i].stim_type in ['random', 'moving']:
 
-                with open((path + file_name), 'w') as f:
+                with open(os.path.join(path, file_name), 'w') as f:
 
                     if has_tabulate:
                         # nicer formatting
@@ -2286,99 +3649,73 @@ def log_stats(count_reps, reps, count_frames, num_frames, elapsed_time,
                         f.write(str(to_animate[i].log[2][j][1]))
                         f.write('\n')
 
-            if stim_list[i].stim_type in ['ImageJumpStim']:
+            if stim_list[i].stim_type == 'jump':
 
                 cap = float_uint8(to_animate[i].orig_tex)
-                save_name = path + file_name[:-3] + 'npy'
+                save_name = os.path.join(path, file_name[:-3] + 'npy')
                 numpy.save(save_name, numpy.flipud(cap))
-                # print cap.shape, cap.dtype
 
-                with open((path + file_name), 'w') as f:
+                with open(os.path.join(path, file_name), 'w') as f:
+                    f.write('image: ' + to_animate[i].image_filename)
+                    f.write('\nshuffle: ' + str(to_animate[i].shuffle))
+                    f.write('\nimage_channel: ' +
+                            str(to_animate[i].image_channel))
+                    f.write('\nimage_size: ' +
+                            str(to_animate[i].image_size))
+                    f.write('\nnum_jumps: ' + str(to_animate[i].num_jumps))
+                    f.write('\nmove_seed: ' + str(to_animate[i].move_seed))
+
+                    f.write('\nwindow_size: ' + str(GlobalDefaults[
+                                                    'display_size']))
+                    f.write('\noffset: ' + str(GlobalDefaults[
+                                               'offset']))
+                    f.write('\ntrigger_wait: ' + str(GlobalDefaults[
+                                                     'trigger_wait']))
+                    f.write('\ngamma_correction: ' + str(GlobalDefaults[
+                        'gamma_correction']))
+                    f.write('\n\n')
+
+                    slice_log = to_animate[i].slice_log
+                    headers = ['y_low', 'y_high', 'x_low', 'x_high']
+
+                    # seeds to rebuild shuffles with shuffle_pixels()
+                    if to_animate[i].shuffle:
+                        slice_log = [row + [seed] for row, seed in zip(
+                            slice_log, to_animate[i].shuffle_seeds)]
+                        headers.append('shuffle_seed')
 
                     if has_tabulate:
                         # nicer formatting
-                        f.write('image: ' + to_animate[i].image_filename)
-                        f.write('\nshuffle: ' + str(to_animate[i].shuffle))
-                        f.write('\nimage_channel: ' +
-                                str(to_animate[i].image_channel))
-                        f.write('\nimage_size: ' +
-                                str(to_animate[i].image_size))
-                        f.write('\nnum_jumps: ' + str(to_animate[i].num_jumps))
-                        f.write('\nmove_seed: ' + str(to_animate[i].move_seed))
-
-                        f.write('\nwindow_size: ' + str(GlobalDefaults[
-                                                        'display_size']))
-                        f.write('\noffset: ' + str(GlobalDefaults[
-                                                   'offset']))
-                        f.write('\ntrigger_wait: ' + str(GlobalDefaults[
-                                                         'trigger_wait']))
-                        f.write('\ngamma_correction: ' + str(GlobalDefaults[
-                            'gamma_correction']))
-                        f.write('\n\n')
-
-                        f.write(tabulate(to_animate[i].slice_log,
-                                         headers=['y_low', 'y_high', 'x_low',
-                                                  'x_high'],
+                        f.write(tabulate(slice_log,
+                                         headers=headers,
                                          tablefmt="orgtbl"))
-
                     else:
-                        raise ImportError('Could not log Jumpstim without '
-                                          'tabulate (needs to be implemented).'
-                                          )
+                        f.write(org_table(slice_log, headers))
 
     return current_time_string
 
 
-def save_movie(current_time, save_loc):
-    """
-    Saves movies to file from saved pngs
+def org_table(rows, headers):
+    """Formats a table like tabulate does in orgtbl format, for when
+    tabulate is not installed.
 
-    :param current_time: current time
-    :param save_loc: save location
+    :param rows: list of rows of values.
+    :param headers: list of column names.
+    :return: table as string.
     """
-    current_time_string = strftime('%Y_%m_%d_%H%M%S', current_time)
-    save_name = 'capture_video' + current_time_string + '.mpg'
-    save_name_gray = 'capture_video' + current_time_string + '_gray.mpg'
-
-    args = ['ffmpeg',
-            '-f', 'image2',
-            '-framerate', str(GlobalDefaults['frame_rate']),
-            '-i', os.path.join(save_loc, 'capture_%05d.png'),
-            '-b:v', '20M',
-            os.path.join(save_loc, save_name)]
-
-    # make movie using ffmpeg
-    print('ffmpeg...')
-    # print save_loc
-    # print os.path.join(save_loc, 'capture_%05d.png')
-
-    process = subprocess.Popen(args,
-                               stdout=subprocess.PIPE,
-                               stderr=subprocess.PIPE)
-    stdout, stderr = process.communicate()
-    print(stdout, stderr)
-
-    args2 = ['ffmpeg',
-             '-i', os.path.join(save_loc, save_name),
-             '-vf', 'format=gray',
-             '-qscale', '0',
-             os.path.join(save_loc, save_name_gray)]
-
-    print('\ngrayscale conversion...')
-
-    process = subprocess.Popen(args2,
-                               stdout=subprocess.PIPE,
-                               stderr=subprocess.PIPE)
-    stdout, stderr = process.communicate()
-    print(stdout, stderr)
-
-    # delete .pngs
-    # to_delete = [f for f in os.listdir(save_loc) if f.endswith('.png')]
-    # for f in to_delete:
-    #     os.remove(os.path.join(save_loc, f))
-
-    print('Saved in: {}'.format(save_loc))
-    print('\nDONE')
+    cells = [[str(value) for value in row] for row in rows]
+    widths = [max([len(header)] + [len(row[j]) for row in cells])
+              for j, header in enumerate(headers)]
+
+    def line(values):
+        return '| ' + ' | '.join(value.rjust(width) for value, width in
+                                 zip(values, widths)) + ' |'
+
+    lines = [line(headers),
+             '|' + '+'.join('-' * (width + 2) for width in widths) + '|']
+    lines += [line(row) for row in cells]
+
+    return '\n'.join(lines)
 
 
 def stim_factory(stim):
@@ -2407,19 +3744,207 @@ def stim_factory(stim):
         return stim_map[stim.stim_type](**stim.parameters)
 
 
-def animation_loop(to_animate, num_frames, current_time, save_loc):
+class StimFrames(object):
+    """Per frame state of a single stim, filled in by compile_frames(). Arrays
+    are indexed relative to the first frame on which the stim is drawn, and
+    are left as None for properties that do not change.
+
+    :param stim: The stim being compiled, after call to draw_times().
+    """
+    def __init__(self, stim):
+        """
+        Constructor.
+        """
+        self.start = int(ceil(stim.start_stim))
+        self.end = int(ceil(stim.end_stim))
+        self.num_frames = max(self.end - self.start, 0)
+
+        #: Per frame arrays.
+        self.pos = None
+        self.ori = None
+        self.phase = None
+        self.color = None
+
+
+class FrameProgram(object):
+    """Flat, array based program of what to draw on each frame, compiled from
+    the stims to animate once their draw times are known. Keeps any per
+    frame calculation of timing, phase, and position out of the animation
+    loop. Stims that cannot be compiled (i.e. noise, jumps, movies) are
+    animated as usual.
+
+    Stims are only visited while they are drawn: a schedule of start and end
+    frames adds and removes them from the set of active stims, so the cost of
+    a frame depends on the stims on screen, not on the length of the stim
+    list.
+
+    :param list to_animate: List of stims, in draw order.
+    :param int num_frames: Number of frames to animate for.
+    """
+    def __init__(self, to_animate, num_frames):
+        """
+        Compiles stims, schedule, and triggers.
+        """
+        self.stims = to_animate
+        self.num_frames = num_frames
+
+        #: First and last (exclusive) drawn frame of each stim.
+        self.intervals = numpy.zeros((len(to_animate), 2), dtype=numpy.int64)
+        #: :py:class:`StimFrames` of each stim, None if animated on the fly.
+        self.frames = []
+
+        for i, stim in enumerate(to_animate):
+            self.frames.append(stim.compile_frames())
+
+            start = max(int(ceil(stim.start_stim)), 0)
+            end = min(int(ceil(stim.end_stim)), num_frames)
+            self.intervals[i] = start, max(start, end)
+
+        #: Stims to add and remove from active stims, by frame.
+        self.schedule = {}
+
+        for i, (start, end) in enumerate(self.intervals):
+            if start == end:
+                continue
+            self.schedule.setdefault(start, ([], []))[0].append(i)
+            self.schedule.setdefault(end, ([], []))[1].append(i)
+
+        #: Indices of stims drawn on current frame, in draw order.
+        self.on = []
+        self.frame = None
+
+        #: Whether or not to trigger after each frame.
+        self.triggers = numpy.zeros(num_frames, dtype=bool)
+
+        for frame in MyWindow.frame_trigger_list:
+            if 0 <= frame < num_frames and frame == int(frame):
+                self.triggers[int(frame)] = True
+
+    @property
+    def active(self):
+        """Which stims are drawn on each frame, as stims x frames. Built on
+        request, for inspection only.
+        """
+        frames = numpy.arange(self.num_frames)
+
+        return (self.intervals[:, 0, numpy.newaxis] <= frames) & \
+            (frames < self.intervals[:, 1, numpy.newaxis])
+
+    def seek(self, frame):
+        """Sets active stims to those drawn on a frame, for when frames are
+        not drawn in order.
+
+        :param int frame: frame number
+        """
+        self.on = numpy.flatnonzero((self.intervals[:, 0] <= frame) &
+                                    (frame < self.intervals[:, 1])).tolist()
+        self.frame = frame
+
+    def advance(self, frame):
+        """Updates active stims for a frame, from the schedule if it is the
+        next frame.
+
+        :param int frame: frame number
+        """
+        if self.frame is None or frame != self.frame + 1:
+            self.seek(frame)
+            return
+
+        self.frame = frame
+
+        if frame in self.schedule:
+            starting, ending = self.schedule[frame]
+
+            for i in ending:
+                self.on.remove(i)
+            for i in starting:
+                bisect.insort(self.on, i)
+
+    def fast_forward(self, frame):
+        """Brings stims animated on the fly up to a frame, so drawing can
+        start part way through. Their state is sought directly (see
+        :py:meth:`StaticStim.seek`) rather than replayed, so this costs the
+        same wherever the frame is; compiled stims are looked up directly and
+        are skipped.
+
+        :param int frame: first frame to be drawn
+        """
+        for i, frames in enumerate(self.frames):
+            start, end = self.intervals[i]
+            if frames is None and start < frame < end:
+                self.stims[i].seek(frame)
+
+    def draw_at(self, frame):
+        """Draws any frame to the back buffer, in any order, without drawing
+        the frames before it. Slower than draw() for consecutive frames, as
+        stims animated on the fly are sought on every call.
+
+        :param int frame: frame number
+        """
+        self.seek(frame)
+
+        for i in self.on:
+            if self.frames[i] is None:
+                self.stims[i].seek(frame)
+
+        self.draw(frame)
+
+    def draw(self, frame):
+        """Draws all stims active on a frame to the back buffer.
+
+        :param int frame: current frame number
+        """
+        self.advance(frame)
+
+        for i in self.on:
+            if self.frames[i] is None:
+                self.stims[i].animate(frame)
+            else:
+                self.stims[i].draw_frame(self.frames[i], frame)
+
+
+def build_program(stim_list):
+    """Creates stims, their draw times, and the program of what to draw on
+    each frame. Needs the window to be open.
+
+    :param list stim_list: list of StimInfo classes.
+    :return: :py:class:`FrameProgram` of stims.
+    """
+    # prep stims
+    to_animate = []
+
+    for stim in stim_list:
+        to_animate.append(stim_factory(stim))
+
+    for stim in to_animate:
+        stim.make_stim()
+
+    # reset frame trigger times
+    del MyWindow.frame_trigger_list[:-1]
+
+    # gen draw times and get end time of last stim
+    num_frames = max(stim.draw_times() for stim in to_animate)
+
+    # precompute per frame state
+    return FrameProgram(to_animate, num_frames)
+
+
+def animation_loop(program, current_time, capture=None):
     """
     Function where animation logic is carried out, along with other helper tasks
 
-    :param to_animate: list of stims being animated
-    :param num_frames: number of frames to animate for
+    :param program: :py:class:`FrameProgram` of stims being animated
     :param current_time: time at call to animate
+    :param capture: :py:class:`CaptureWriter` or :py:class:`FrameCapture` to
+     pass drawn frames to instead of flipping, if capturing
     """
-    index = 0
+    to_animate = program.stims
+    num_frames = program.num_frames
+
     reps = 0
     frames = 0
 
-    if GlobalDefaults['framepack']:
+    if GlobalDefaults['framepack'] and MyWindow.backend != 'numpy':
         MyWindow.framepacker = ProjectorFramePacker(MyWindow.win)
 
     MyWindow.win.recordFrameIntervals = True
@@ -2431,29 +3956,21 @@ def animation_loop(to_animate, num_frames, current_time, save_loc):
     # for frame in range(num_frames):
     # trange for pretty, low overhead (on the order of ns), progress bar in stdout
     for frame in trange(num_frames):
-        for stim in to_animate:
-            stim.animate(frame)
+        program.draw(frame)
 
-        if not GlobalDefaults['capture']:
+        if capture is None:
             MyWindow.flip()
 
-        # save as movie?
-        elif GlobalDefaults['capture']:
-            filename = os.path.join(save_loc,
-                                    'capture_' +
-                                    str(frame + 1).zfill(5) + '.png')
-            img = MyWindow.win._getRegionOfFrame(buffer='back')
-            img.save(filename, 'PNG')
-            sys.stdout.write('\r')
-            sys.stdout.write(str(int(frame / float(num_frames) * 100) +
-                                 1) + '%')
-            sys.stdout.flush()
+        # save as movie
+        else:
+            buffer = capture.next_buffer()
+            MyWindow.read_frame(buffer)
+            capture.push(buffer)
             MyWindow.win.clearBuffer()
 
-        if frame == MyWindow.frame_trigger_list[index]:
+        if program.triggers[frame]:
             MyWindow.send_trigger()
             # print frame, 'triggered'
-            index += 1
 
         # escape key breaks if focus on window
         for key in event.getKeys(keyList=['escape']):
@@ -2524,44 +4041,77 @@ def main(stim_list, verbose=True):
     MyWindow.should_break = False
     MyWindow.running = True
 
-    # outer loop for number of reps
+    capture = None
+
     try:
+        # generate stims, once for all reps
+        program = build_program(stim_list)
+        to_animate = program.stims
+        num_frames = program.num_frames
+
+        # one movie of all reps
+        if GlobalDefaults['capture']:
+            capture_dir = os.path.abspath(config.get('StimProgram', 'capture_dir'))
+            current_time_string = strftime('%Y_%m_%d_%H%M%S', current_time)
+            save_dir = 'capture_' + current_time_string + '_' + str(to_animate[0])
+            capture_format = config.get('StimProgram', 'capture_format',
+                                        fallback='movie')
+
+            if capture_format == 'frames':
+                capture = FrameCapture(
+                    os.path.join(capture_dir, save_dir),
+                    current_time_string,
+                    MyWindow.win.size,
+                    GlobalDefaults['frame_rate'],
+                    downsample=config.getint('StimProgram',
+                                             'capture_downsample',
+                                             fallback=1),
+                    channel=config.get('StimProgram', 'capture_channel',
+                                       fallback='all'),
+                    compress=config.getboolean('StimProgram',
+                                               'capture_compress',
+                                               fallback=False))
+            else:
+                capture = CaptureWriter(os.path.join(capture_dir, save_dir),
+                                        current_time_string,
+                                        MyWindow.win.size,
+                                        GlobalDefaults['frame_rate'])
+
+        # outer loop for number of reps
         for x in range(reps):
-            # prep stims
-            to_animate = []
-
-            for stim in stim_list:
-                to_animate.append(stim_factory(stim))
-
-            # generate stims
-            for stim in to_animate:
-                stim.make_stim()
-
-            # reset frame trigger times
-            del MyWindow.frame_trigger_list[:-1]
-
-            # gen draw times and get end time of last stim
-            num_frames = max(stim.draw_times() for stim in to_animate)
-
-            # draw stims and flip window
-            if GlobalDefaults['trigger_wait'] != 0:
-                MyWindow.win.callOnFlip(MyWindow.send_trigger)
-                # print 'trigger'
-                # MyWindow.flip()
-                for y in range(GlobalDefaults['trigger_wait'] - 1):
-                    MyWindow.flip()
-
-            save_loc = None
-            if GlobalDefaults['capture']:
-                capture_dir = os.path.abspath(config.get('StimProgram', 'capture_dir'))
-                if not os.path.exists(capture_dir):
-                    os.makedirs(capture_dir)
-                current_time_string = strftime('%Y_%m_%d_%H%M%S', current_time)
-                save_dir = 'capture_' + current_time_string + '_' + str(to_animate[0])
-                save_loc = os.path.join(capture_dir, save_dir)
-                os.makedirs(save_loc)
-
-            rep, elapsed_time, frames, dropped = animation_loop(to_animate, num_frames, current_time, save_loc)
+            try:
+                # back to first frame
+                if x > 0:
+                    for stim in to_animate:
+                        stim.reset()
+
+                # record noise frames for offline analysis
+                if GlobalDefaults['record_noise']:
+                    path = log_path(current_time)
+                    for i, stim in enumerate(to_animate):
+                        if stim.fill_mode == 'checkerboard' and \
+                                stim.check_type in ['noise', 'noisy noise']:
+                            stim.start_recording(os.path.join(
+                                path, 'noise_{}_rep_{}'.format(i, x)))
+
+                # draw stims and flip window
+                if GlobalDefaults['trigger_wait'] != 0:
+                    MyWindow.win.callOnFlip(MyWindow.send_trigger)
+                    # print 'trigger'
+                    # MyWindow.flip()
+                    for y in range(GlobalDefaults['trigger_wait'] - 1):
+                        MyWindow.flip()
+
+                rep, elapsed_time, frames, dropped = animation_loop(program, current_time, capture)
+            finally:
+                # stop preparing textures in background, finish recordings,
+                # even if the rep failed part way
+                for stim in to_animate:
+                    if stim.ring is not None:
+                        stim.ring.stop()
+                    if stim.recorder is not None:
+                        stim.recorder.close()
+                        stim.recorder = None
 
             count_elapsed_time += elapsed_time
             count_reps += rep
@@ -2572,6 +4122,8 @@ def main(stim_list, verbose=True):
 
     except Exception as e:
         traceback.print_exc()
+        if capture is not None:
+            capture.close()
         return str(e), 'error', None, None
 
     # one last flip to clear window if still open
@@ -2612,8 +4164,11 @@ def main(stim_list, verbose=True):
             format((count_reps * (num_frames) + count_frames) /
                    count_elapsed_time), end=' ')
         print("{} frame(s) missed.".format(dropped))
-        print("Elapsed time: {0:.3f} seconds.\n". \
+        print("Elapsed time: {0:.3f} seconds.". \
             format(count_elapsed_time))
+        print("Texture cache: {hits} hits ({disk_hits} from disk), {misses} "
+              "misses, {evictions} evictions.\n".
+              format(**TextureCache.stats()))
 
     time_stamp = None
 
@@ -2624,9 +4179,9 @@ def main(stim_list, verbose=True):
 
     fps = (count_reps * num_frames + count_frames) / count_elapsed_time
 
-    # save movie
-    if GlobalDefaults['capture']:
-        save_movie(current_time, save_loc)
+    # finish movie
+    if capture is not None:
+        capture.close()
 
     MyWindow.running = False
 
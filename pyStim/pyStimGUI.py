@@ -18,6 +18,7 @@ import os
 # TODO: stop using pickle, use json instead to save dicts
 import pickle
 import subprocess
+import threading
 import traceback
 from ast import literal_eval
 from collections import OrderedDict
@@ -25,12 +26,14 @@ from copy import deepcopy
 from pathlib import Path
 
 import configparser
+import numpy
 import wx
 import wx.grid
 import wx.lib.agw.multidirdialog as mdd
 from PIL import Image
 
 import pyStim
+import ReverseCorrelation
 from GammaCorrection import GammaValues
 
 global has_lcr
@@ -658,7 +661,8 @@ class InputPanel(wx.Panel):
         # instead of at window instantiation
         global_params = self.parameters.get_global_params()
 
-        if param in ['log', 'protocol_reps', 'pref_dir', 'capture']:
+        if param in ['log', 'protocol_reps', 'pref_dir', 'capture',
+                     'record_noise']:
             pyStim.GlobalDefaults[param] = global_params[param]
 
         elif param == 'trigger_wait':
@@ -1878,6 +1882,12 @@ class MyMenuBar(wx.MenuBar):
                                                    'video',
                                                    kind=wx.ITEM_CHECK)
 
+        self.options_record_noise = options_menu.Append(wx.ID_ANY,
+                                                        'record noise',
+                                                        'Save noise board '
+                                                        'frames to log folder',
+                                                        kind=wx.ITEM_CHECK)
+
         self.options_mirror = options_menu.Append(wx.ID_ANY, 'mirror',
                                                    'Make small mirror window',
                                                    kind=wx.ITEM_CHECK)
@@ -1912,6 +1922,10 @@ class MyMenuBar(wx.MenuBar):
         tools_rec_map = options_tools.Append(wx.ID_ANY,
                                              'Map receptive field',
                                              'Generate receptive field map')
+        tools_noise_sta = options_tools.Append(wx.ID_ANY,
+                                               'Noise STA',
+                                               'Spike triggered average of '
+                                               'recorded noise')
 
         options_menu.Append(wx.ID_ANY, 'tools', options_tools)
 
@@ -1999,6 +2013,7 @@ class MyMenuBar(wx.MenuBar):
                 view_stims: self.on_view_stims,
                 self.options_log: self.on_options_log,
                 self.options_capture: self.on_options_capture,
+                self.options_record_noise: self.on_options_record_noise,
                 self.options_mirror: self.on_options_mirror,
                 mirror_number_one: self.on_mirror_number_one,
                 mirror_number_two: self.on_mirror_number_two,
@@ -2006,6 +2021,7 @@ class MyMenuBar(wx.MenuBar):
                 self.options_override: self.on_options_override,
                 self.options_framepack: self.on_options_framepack,
                 tools_rec_map: self.on_options_tools_rec_map,
+                tools_noise_sta: self.on_options_tools_noise_sta,
             }
         }
 
@@ -2149,6 +2165,18 @@ class MyMenuBar(wx.MenuBar):
         self.frame.parameters.set_param_value('global', 'capture', val)
         pyStim.GlobalDefaults['capture'] = val
 
+    def on_options_record_noise(self, event):
+        """
+        Handles toggling recording of noise frames
+
+        :param event:
+        :return:
+        """
+        val = self.options_record_noise.IsChecked()
+
+        self.frame.parameters.set_param_value('global', 'record_noise', val)
+        pyStim.GlobalDefaults['record_noise'] = val
+
     def on_options_mirror(self, event):
         """
         Handles toggling capturing
@@ -2325,6 +2353,114 @@ class MyMenuBar(wx.MenuBar):
         rec_field.save(path)
         return
 
+    def on_options_tools_noise_sta(self, event):
+        """
+        Handles request for spike triggered average of noise recorded with
+        record noise option. Averaging runs in a separate thread.
+
+        :param event:
+        :return:
+        """
+        log_dir = Path(self.frame.stim_params['logs_dir'])
+
+        dir_dialog = wx.DirDialog(self.frame,
+                                  message='Select log folder of run',
+                                  defaultPath=str(log_dir),
+                                  style=wx.DD_DIR_MUST_EXIST)
+
+        # to exit out of dialog on cancel
+        if dir_dialog.ShowModal() == wx.ID_CANCEL:
+            return
+
+        log_folder = dir_dialog.GetPath()
+
+        stims = ReverseCorrelation.noise_stims(log_folder)
+
+        if not stims:
+            print('No recorded noise in {}.'.format(log_folder))
+            return
+
+        stim = stims[0]
+
+        # ask which stim if more than one recorded noise
+        if len(stims) > 1:
+            stim_dialog = wx.SingleChoiceDialog(self.frame,
+                                                message='Select noise stim',
+                                                caption='Noise STA',
+                                                choices=[str(i)
+                                                         for i in stims])
+
+            if stim_dialog.ShowModal() == wx.ID_CANCEL:
+                return
+
+            stim = stims[stim_dialog.GetSelection()]
+
+        # spike times in seconds, one per line, with rep in first column if
+        # more than one rep
+        spike_dialog = wx.FileDialog(self.frame,
+                                     message='Select spike times file',
+                                     wildcard='*.txt',
+                                     style=wx.FD_OPEN | wx.FD_FILE_MUST_EXIST)
+
+        # to exit out of dialog on cancel button
+        if spike_dialog.ShowModal() == wx.ID_CANCEL:
+            return
+
+        spikes = numpy.loadtxt(spike_dialog.GetPath(), ndmin=2)
+
+        if spikes.shape[1] == 1:
+            spike_times = [spikes[:, 0]]
+        else:
+            reps = spikes[:, 0].astype(int)
+            spike_times = [spikes[reps == rep, 1]
+                           for rep in range(reps.max() + 1)]
+
+        lags_dialog = wx.TextEntryDialog(self.frame,
+                                         message='Noise frames to average',
+                                         value='10')
+
+        if lags_dialog.ShowModal() == wx.ID_CANCEL:
+            return
+
+        num_lags = int(lags_dialog.GetValue())
+
+        def average():
+            try:
+                sta = ReverseCorrelation.map_log(log_folder, spike_times,
+                                                 stim=stim,
+                                                 num_lags=num_lags)
+            except Exception as e:
+                traceback.print_exc()
+                print('Something went wrong: {}'.format(e))
+                return
+
+            wx.CallAfter(self.show_sta, sta)
+
+        thread = threading.Thread(target=average)
+        thread.daemon = True
+        thread.start()
+
+    def show_sta(self, sta):
+        """
+        Shows spike triggered average, and offers to save it.
+
+        :param sta: average, shaped (lags, rows, columns).
+        """
+        sta_image = Image.fromarray(ReverseCorrelation.sta_image(sta))
+        sta_image.show()
+
+        # popup save dialog
+        save_dialog = wx.FileDialog(self.frame,
+                                    message='Save spike triggered average?',
+                                    wildcard='.npy',
+                                    style=wx.FD_SAVE | wx.FD_OVERWRITE_PROMPT)
+
+        # to exit out of popup on cancel button
+        if save_dialog.ShowModal() == wx.ID_CANCEL:
+            return
+
+        numpy.save(save_dialog.GetPath(), sta)
+
     def prompt_wave_details(self):
         """
         Dialog to prompt for details about the heka file.
@@ -0,0 +1,94 @@
+"""
+Tests for offline export.
+"""
+
+import os
+import sys
+
+sys.path.append(os.path.abspath('pyStim'))
+
+import pickle
+
+import pytest
+from mock import patch
+
+import ExportVideo
+
+
+class TestExport(object):
+
+    @pytest.mark.parametrize('num_frames', [0, 5, 601])
+    def test_chunk_range(self, num_frames):
+        frames = []
+        for chunk in range(8):
+            start, end = ExportVideo.chunk_range(chunk, 8, num_frames)
+            frames += list(range(start, end))
+
+        assert frames == list(range(num_frames))
+
+    def test_load_stims(self, tmpdir):
+        saved = [{'move_type': 'MovingStim', 'speed': 10,
+                  'grid_dict': {'speed': [1, 2]}},
+                 {'move_type': 'table', 'speed': 20}]
+
+        path = str(tmpdir.join('stims.txt'))
+        with open(path, 'wb') as f:
+            pickle.dump(saved, f)
+
+        stim_list = ExportVideo.load_stims(path)
+
+        assert [stim.stim_type for stim in stim_list] == ['moving', 'table']
+        assert stim_list[0].parameters == {'speed': 10}
+        assert [stim.number for stim in stim_list] == [0, 1]
+
+    @patch('ExportVideo.subprocess.check_call')
+    @patch('ExportVideo.render_chunk')
+    def test_export(self, render_chunk, check_call, tmpdir):
+        def render(stim_list, defaults, chunk, num_chunks, path, backend):
+            if chunk == 2:
+                return None, 0
+            return [path + '.mpg', path + '_gray.mpg'], 10
+
+        render_chunk.side_effect = render
+
+        joined = []
+        check_call.side_effect = lambda args, **kwargs: joined.append(
+            open(args[args.index('-i') + 1]).read())
+
+        outputs = ExportVideo.export(['stim'], str(tmpdir), '_test',
+                                     workers=1, num_chunks=3,
+                                     headless=False)
+
+        assert render_chunk.call_count == 3
+        assert [call[0][2:4] for call in render_chunk.call_args_list] == [
+            (0, 3), (1, 3), (2, 3)]
+
+        # empty chunk left out, parts in order
+        assert outputs[1].endswith('capture_video_test_gray.mpg')
+        assert joined[1].splitlines() == [
+            "file '{}'".format(tmpdir.join('part_000_gray.mpg')),
+            "file '{}'".format(tmpdir.join('part_001_gray.mpg'))]
+        assert not tmpdir.join('capture_video_test_gray.mpg.txt').exists()
+
+    @patch('ExportVideo.subprocess.check_call')
+    @patch('ExportVideo.render_chunk')
+    @patch('ExportVideo.ProcessPoolExecutor')
+    def test_headless(self, executor, render_chunk, check_call, tmpdir):
+        pool = executor.return_value.__enter__.return_value
+        pool.map.return_value = [(['a.mpg', 'a_gray.mpg'], 10)]
+
+        with patch.dict(os.environ):
+            ExportVideo.export(['stim'], str(tmpdir), workers=1,
+                               headless=True)
+
+            assert os.environ['PYGLET_HEADLESS'] == 'True'
+
+        # pyglet already imported here, so rendered in a fresh process
+        assert executor.call_args[1]['max_workers'] == 1
+        assert pool.map.call_args[0][0] is render_chunk
+        assert not render_chunk.called
+
+    @patch('ExportVideo.subprocess.check_call', side_effect=OSError('none'))
+    def test_no_ffmpeg(self, check_call, tmpdir):
+        with pytest.raises(IOError):
+            ExportVideo.concat_movies(['a.mpg'], str(tmpdir.join('b.mpg')))
@@ -0,0 +1,85 @@
+"""
+Tests for frame store.
+"""
+
+import os
+import sys
+
+sys.path.append(os.path.abspath('pyStim'))
+
+import numpy as np
+import pytest
+
+from FrameStore import FrameWriter, FrameReader
+
+
+def write_store(path, frames, levels, chunk_frames, **kwargs):
+    writer = FrameWriter(str(path), frames.shape[1], levels=levels,
+                         chunk_frames=chunk_frames, num_buffers=2,
+                         meta={'frame_rate': 60}, **kwargs)
+
+    for i, frame in enumerate(frames):
+        writer.write(frame, i * 12)
+
+    writer.close()
+
+    return FrameReader(str(path))
+
+
+class TestFrameStore(object):
+
+    @pytest.mark.parametrize('levels', [2, 3])
+    def test_round_trip(self, tmpdir, levels):
+        frames = np.random.RandomState(0).randint(0, levels, (23, 37))
+        frames = frames.astype(np.uint8)
+
+        reader = write_store(tmpdir, frames, levels, chunk_frames=5)
+
+        assert len(reader) == 23
+        assert reader.num_chunks == 5
+        assert reader.packed == (levels == 2)
+
+        stored = np.concatenate([chunk for _, chunk in reader.chunks()])
+        np.testing.assert_array_equal(stored, frames)
+
+        starts = [start for start, _ in reader.chunks()]
+        assert starts == [0, 5, 10, 15, 20]
+
+        np.testing.assert_array_equal(reader[7], frames[7])
+        np.testing.assert_array_equal(reader[-1], frames[-1])
+        with pytest.raises(IndexError):
+            reader[23]
+
+    def test_times(self, tmpdir):
+        frames = np.zeros((4, 8), dtype=np.uint8)
+
+        reader = write_store(tmpdir, frames, 2, chunk_frames=4)
+
+        assert reader.num_chunks == 1
+        np.testing.assert_array_equal(reader.index, [0, 12, 24, 36])
+        np.testing.assert_allclose(reader.times(), [0, 0.2, 0.4, 0.6])
+        np.testing.assert_allclose(reader.times(120), [0, 0.1, 0.2, 0.3])
+
+    @pytest.mark.parametrize('levels', [2, 256])
+    def test_compressed(self, tmpdir, levels):
+        frames = np.random.RandomState(0).randint(0, levels, (11, 12))
+        frames = frames.astype(np.uint8)
+
+        writer = FrameWriter(str(tmpdir), 12, levels=levels, chunk_frames=4,
+                             compress=True, meta={'frame_shape': [3, 4]})
+        for i, frame in enumerate(frames):
+            writer.write(frame, i)
+        writer.close()
+
+        assert sorted(os.listdir(str(tmpdir)))[:3] == [
+            'frames_00000.npz', 'frames_00001.npz', 'frames_00002.npz']
+
+        reader = FrameReader(str(tmpdir))
+
+        assert reader.compressed
+        np.testing.assert_array_equal(reader[9], frames[9])
+        np.testing.assert_array_equal(reader.image(5),
+                                      frames[5].reshape(3, 4))
+
+        stored = np.concatenate([chunk for _, chunk in reader.chunks()])
+        np.testing.assert_array_equal(stored, frames)
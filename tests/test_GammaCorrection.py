@@ -0,0 +1,78 @@
+"""
+Tests for gamma correction.
+"""
+
+import os
+import sys
+
+sys.path.append(os.path.abspath('pyStim'))
+
+import numpy as np
+import pytest
+from scipy import interpolate
+
+from GammaCorrection import GammaValues
+
+
+def make_gun(power):
+    """Makes spline, slope, intercept tuple for a gun with a power law
+    luminance response.
+    """
+    measured_at = np.linspace(-1, 1, 11)
+    measured = ((measured_at + 1) / 2) ** power
+    spline = interpolate.InterpolatedUnivariateSpline(measured, measured_at)
+
+    return spline, 1.0, 0.0
+
+
+class TestLookupTable(object):
+
+    def setup_method(self):
+        self.gamma = GammaValues(make_gun(2.2), make_gun(2.0), make_gun(1.8))
+
+    def test_texture_matches_splines(self):
+        tex = np.random.RandomState(0).uniform(-1, 1, (64, 32, 4))
+        tex = tex.astype(np.float32)
+
+        expected = np.clip(self.gamma(tex), -1, 1)
+
+        self.gamma.make_lut(2 ** 16)
+        corrected = self.gamma(tex)
+
+        assert corrected.dtype == np.float32
+        np.testing.assert_allclose(corrected[..., :3], expected[..., :3],
+                                   atol=1e-3)
+        np.testing.assert_array_equal(corrected[..., 3], tex[..., 3])
+
+    def test_in_place_threaded(self):
+        tex = np.random.RandomState(1).uniform(-1, 1, (64, 32, 4))
+        tex = tex.astype(np.float32)
+
+        self.gamma.make_lut(256)
+        expected = self.gamma(tex)
+
+        out = self.gamma.apply_lut(tex, out=tex, threads=4)
+
+        assert out is tex
+        np.testing.assert_array_equal(tex, expected)
+
+    def test_single_channel(self):
+        expected = self.gamma(0.3, channel=1)
+
+        self.gamma.make_lut(2 ** 16)
+
+        np.testing.assert_allclose(self.gamma(0.3, channel=1), expected,
+                                   atol=1e-3)
+        np.testing.assert_array_equal(self.gamma(np.array([2.0, -2.0]),
+                                                 channel=0),
+                                      np.array([self.gamma(1.0, channel=0),
+                                                -1.0]))
+
+    def test_not_rgb(self):
+        self.gamma.make_lut(256)
+
+        with pytest.raises(ValueError):
+            self.gamma.apply_lut(np.zeros((4, 5)))
+
+        with pytest.raises(ValueError):
+            self.gamma.apply_lut(0.3)
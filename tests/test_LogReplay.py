@@ -0,0 +1,137 @@
+"""
+Tests for rebuilding frames from logs.
+"""
+
+import os
+import sys
+
+sys.path.append(os.path.abspath('pyStim'))
+
+from time import localtime
+
+import numpy as np
+import pytest
+from mock import patch, Mock
+
+import pyStim
+import LogReplay
+
+
+class TestLogReplay(object):
+
+    def setup_method(self):
+        pyStim.GlobalDefaults['display_size'] = [40, 30]
+        pyStim.GlobalDefaults['background'] = [-1, -1, -1]
+        pyStim.GlobalDefaults['frame_rate'] = 60
+
+        # noise updating every 3 frames, and a drifting grating beside it
+        self.stim_list = [
+            pyStim.StimInfo('static', dict(shape='rectangle',
+                                           fill_mode='checkerboard',
+                                           check_type='noisy noise',
+                                           num_check=4, check_size=[4, 4],
+                                           location=[-10, 0], noise_rate=20,
+                                           color_mode='rgb',
+                                           contrast_channel='all',
+                                           color=[1, 1, 1], duration=1), 0),
+            pyStim.StimInfo('static', dict(shape='rectangle', fill_mode='sine',
+                                           size=[10, 10], location=[10, 0],
+                                           sf=0.1, phase_speed=[6, 0],
+                                           color_mode='rgb',
+                                           contrast_channel='all',
+                                           color=[1, 1, 1], delay=0.25,
+                                           duration=0.5), 1)]
+
+    def teardown_method(self):
+        pyStim.GlobalDefaults['display_size'] = [400, 400]
+        pyStim.GlobalDefaults['background'] = [0., 0., 0.]
+        del pyStim.MyWindow.frame_trigger_list[:-1]
+        LogReplay.replays.clear()
+
+    def draw_in_order(self):
+        """Frames as drawn by the animation loop.
+        """
+        pyStim.MyWindow.backend = 'numpy'
+        pyStim.MyWindow.make_win()
+
+        try:
+            program = pyStim.build_program(self.stim_list)
+            frames = []
+
+            for frame in range(program.num_frames):
+                program.draw(frame)
+                buffer = np.empty((30, 40, 3), dtype=np.uint8)
+                pyStim.MyWindow.read_frame(buffer)
+                frames.append(buffer[::-1])
+                pyStim.MyWindow.win.clearBuffer()
+
+            for stim in program.stims:
+                if stim.ring is not None:
+                    stim.ring.stop()
+
+        finally:
+            pyStim.MyWindow.close_win()
+            pyStim.MyWindow.backend = 'psychopy'
+            pyStim.MyWindow.visual = pyStim.visual
+
+        return frames
+
+    def test_render_frame(self, tmpdir):
+        expected = self.draw_in_order()
+        assert len(expected) == 60
+
+        with patch('pyStim.log_path', return_value=str(tmpdir)):
+            pyStim.log_stats(1, 1, 0, 60, 1., self.stim_list, [], localtime())
+
+        # rebuilt with logged global defaults, not current ones
+        pyStim.GlobalDefaults['display_size'] = [400, 400]
+
+        order = np.random.default_rng(0).permutation(60)
+        for n in order:
+            frame = LogReplay.render_frame(str(tmpdir), n)
+            np.testing.assert_array_equal(frame, expected[n])
+
+        assert len(LogReplay.replays) == 1
+        assert pyStim.GlobalDefaults['display_size'] == [400, 400]
+        assert pyStim.MyWindow.backend == 'psychopy'
+
+        # noise and grating both change between frames
+        assert not np.array_equal(expected[20], expected[23])
+        assert not np.array_equal(expected[20][:, 20:], expected[21][:, 20:])
+
+        with pytest.raises(IndexError):
+            LogReplay.render_frame(str(tmpdir), 60)
+
+    def test_no_log(self, tmpdir):
+        with pytest.raises(IOError):
+            LogReplay.render_frame(str(tmpdir), 0)
+
+    def test_live_window_kept(self, tmpdir):
+        with patch('pyStim.log_path', return_value=str(tmpdir)):
+            pyStim.log_stats(1, 1, 0, 60, 1., self.stim_list, [], localtime())
+
+        gamma_mon, labjack = Mock(), Mock()
+        saved = (pyStim.MyWindow.gamma_mon, pyStim.MyWindow.gamma_key,
+                 pyStim.MyWindow.d)
+        pyStim.MyWindow.gamma_mon = gamma_mon
+        pyStim.MyWindow.gamma_key = ('live', 0, 0)
+        pyStim.MyWindow.d = labjack
+
+        try:
+            with patch('pyStim.has_u3', True), \
+                    patch('pyStim.u3', create=True) as u3:
+                LogReplay.render_frame(str(tmpdir), 0)
+
+            assert not u3.U3.called
+            assert pyStim.MyWindow.gamma_mon is gamma_mon
+            assert pyStim.MyWindow.gamma_key == ('live', 0, 0)
+            assert pyStim.MyWindow.d is labjack
+
+            # live gamma correction not used for the logged run
+            assert not gamma_mon.called
+            assert LogReplay.replays[os.path.abspath(str(tmpdir))] \
+                .gamma_mon is None
+
+        finally:
+            (pyStim.MyWindow.gamma_mon, pyStim.MyWindow.gamma_key,
+             pyStim.MyWindow.d) = saved
@@ -0,0 +1,267 @@
+"""
+Tests for reverse correlation.
+"""
+
+import os
+import sys
+
+sys.path.append(os.path.abspath('pyStim'))
+
+import numpy as np
+import pytest
+from mock import patch
+
+import pyStim
+import ReverseCorrelation
+from FrameStore import FrameReader, FrameWriter
+
+
+def write_sweep(path, frames, frames_per_update=6, levels=2):
+    """Writes noise frames to a store, one update every few display frames
+    at 60 Hz.
+    """
+    writer = FrameWriter(str(path), frames.shape[1], levels=levels,
+                         chunk_frames=16,
+                         meta={'frame_rate': 60,
+                               'frame_shape': [4, 4],
+                               'end_frame': len(frames) * frames_per_update})
+
+    for i, frame in enumerate(frames):
+        writer.write(frame, i * frames_per_update)
+
+    writer.close()
+
+    return str(path)
+
+
+def brute_force(frames, shown, num_lags, levels=2):
+    """Averages frames preceding each spike one spike at a time.
+    """
+    contrast = np.linspace(-1, 1, levels)[frames]
+    sta = np.zeros((num_lags, frames.shape[1]))
+
+    for k in shown:
+        for lag in range(num_lags):
+            if k - lag >= 0:
+                sta[lag] += contrast[k - lag]
+
+    return sta.reshape(num_lags, 4, 4) / len(shown)
+
+
+class TestSpikeTriggeredAverage(object):
+
+    def setup_method(self):
+        random = np.random.RandomState(0)
+        self.frames = random.randint(0, 2, (100, 16)).astype(np.uint8)
+
+        # cell fires 2 updates after check 5 turns on, mid way through update
+        self.shown = np.flatnonzero(self.frames[:, 5]) + 2
+        self.shown = self.shown[self.shown < 100]
+        self.spikes = (self.shown * 6 + 3) / 60.
+
+    def test_recovers_check(self, tmpdir):
+        path = write_sweep(tmpdir, self.frames)
+
+        sta = ReverseCorrelation.spike_triggered_average([(path,
+                                                           self.spikes)],
+                                                         num_lags=4)
+
+        assert sta.shape == (4, 4, 4)
+        assert sta[2, 1, 1] == 1
+        assert np.abs(np.delete(sta[2].ravel(), 5)).max() < 0.5
+
+        np.testing.assert_allclose(sta, brute_force(self.frames, self.shown,
+                                                    4))
+
+    def test_latency(self, tmpdir):
+        path = write_sweep(tmpdir, self.frames)
+
+        sta = ReverseCorrelation.spike_triggered_average(
+            [(path, self.spikes + 0.1)], num_lags=4, latency=0.1)
+
+        assert sta[2, 1, 1] == 1
+
+    def test_out_of_range(self, tmpdir):
+        path = write_sweep(tmpdir, self.frames)
+
+        spikes = np.concatenate([[-1], self.spikes, [100]])
+
+        sta = ReverseCorrelation.spike_triggered_average([(path, spikes)],
+                                                         num_lags=4)
+
+        np.testing.assert_allclose(sta, brute_force(self.frames, self.shown,
+                                                    4))
+
+    def test_ternary(self, tmpdir):
+        frames = np.random.RandomState(1).randint(0, 3, (50, 16))
+        frames = frames.astype(np.uint8)
+        shown = np.array([3, 3, 17, 40, 49])
+
+        path = write_sweep(tmpdir, frames, levels=3)
+
+        sta = ReverseCorrelation.spike_triggered_average(
+            [(path, shown * 6 / 60.)], num_lags=5)
+
+        np.testing.assert_allclose(sta, brute_force(frames, shown, 5,
+                                                    levels=3))
+
+    def test_sweeps(self, tmpdir):
+        first = write_sweep(tmpdir.join('noise_0_rep_0'), self.frames)
+        second = write_sweep(tmpdir.join('noise_0_rep_1'), self.frames[::-1])
+        write_sweep(tmpdir.join('noise_1_rep_0'), self.frames)
+
+        assert ReverseCorrelation.noise_stores(str(tmpdir), stim=0) == [
+            first, second]
+
+        spikes = [self.spikes, self.spikes[:10]]
+
+        assert ReverseCorrelation.noise_stims(str(tmpdir)) == [0, 1]
+
+        sta = ReverseCorrelation.map_log(str(tmpdir), spikes, stim=0,
+                                         num_lags=3, workers=2)
+
+        expected = (brute_force(self.frames, self.shown, 3) *
+                    len(self.shown) +
+                    brute_force(self.frames[::-1], self.shown[:10], 3) * 10)
+        expected /= len(self.shown) + 10
+
+        np.testing.assert_allclose(sta, expected)
+
+        with pytest.raises(ValueError):
+            ReverseCorrelation.map_log(str(tmpdir), spikes[:1], stim=0)
+
+        # which stim is ambiguous
+        with pytest.raises(ValueError):
+            ReverseCorrelation.map_log(str(tmpdir), spikes)
+
+    def test_only_stim(self, tmpdir):
+        write_sweep(tmpdir.join('noise_3_rep_0'), self.frames)
+
+        sta = ReverseCorrelation.map_log(str(tmpdir), [self.spikes],
+                                         num_lags=4)
+
+        np.testing.assert_allclose(sta, brute_force(self.frames, self.shown,
+                                                    4))
+
+    def test_skips_chunks(self, tmpdir):
+        path = write_sweep(tmpdir, self.frames)
+
+        # only spikes during frames 40 to 50; chunks hold 16 frames
+        spikes = self.spikes[(self.shown >= 40) & (self.shown < 50)]
+
+        with patch('FrameStore.FrameReader.chunk',
+                   side_effect=FrameReader(path).chunk) as chunk:
+            ReverseCorrelation.spike_triggered_average([(path, spikes)],
+                                                       num_lags=4)
+
+        assert sorted(call[0][0] for call in chunk.call_args_list) == [2, 3]
+
+    def test_sta_image(self):
+        sta = np.zeros((3, 4, 4))
+        sta[1, 0, 0] = -0.5
+        sta[2, 3, 3] = 1
+
+        image = ReverseCorrelation.sta_image(sta, scale=2)
+
+        assert image.shape == (8, 24)
+        assert image[0, 0] == 128
+        # bottom row of board at bottom of image
+        assert image[-1, 8] == 64
+        assert image[0, -1] == 255
+
+
+def write_jump_log(path, stim):
+    """Logs a run of a jump stim with log_stats, into a log folder in path.
+
+    :return: path of Jumpinglog file.
+    """
+    log_dir = path.mkdir('log')
+    stim_list = [pyStim.StimInfo('jump', dict(shape='rectangle'), 0)]
+
+    with patch('pyStim.log_path', return_value=str(log_dir)):
+        pyStim.log_stats(1, 1, 0, 30, 1., stim_list, [stim],
+                         pyStim.localtime())
+
+    log_files = ReverseCorrelation.jump_logs([str(log_dir)])
+    assert len(log_files) == 1
+
+    return log_files[0]
+
+
+class TestJumpMap(object):
+
+    def setup_method(self):
+        pyStim.GlobalDefaults['display_size'] = [20, 10]
+        pyStim.GlobalDefaults['background'] = [0., 0., 0.]
+
+    def teardown_method(self):
+        pyStim.GlobalDefaults['display_size'] = [400, 400]
+
+    def make_stim(self, tmpdir, **kwargs):
+        from PIL import Image
+
+        pixels = np.random.RandomState(0).randint(0, 256, (30, 40, 3))
+        filename = str(tmpdir.join('test.png'))
+        Image.fromarray(pixels.astype(np.uint8)).save(filename)
+
+        stim = pyStim.ImageJumpStim(image_filename=filename,
+                                    image_size=[80, 60],
+                                    num_jumps=7,
+                                    move_seed=2,
+                                    **kwargs)
+        stim.gen_texture()
+
+        return stim
+
+    def shown(self, stim):
+        """Windows as shown, in uint8.
+        """
+        windows = np.empty((7, 10, 20, 3))
+        for i in range(7):
+            stim.fill_slice(i, windows[i])
+
+        return pyStim.float_uint8(windows)
+
+    @pytest.mark.parametrize('shuffle', [False, True])
+    def test_windows(self, tmpdir, shuffle):
+        stim = self.make_stim(tmpdir, shuffle=shuffle)
+        log = ReverseCorrelation.read_jump_log(write_jump_log(tmpdir, stim))
+
+        np.testing.assert_array_equal(log['slices'], stim.slice_log)
+        assert (log['seeds'] is not None) == shuffle
+
+        windows = ReverseCorrelation.jump_windows(log, np.arange(7))
+
+        np.testing.assert_array_equal(windows, self.shown(stim))
+
+    def test_map(self, tmpdir):
+        stim = self.make_stim(tmpdir, shuffle=True)
+        log_file = write_jump_log(tmpdir, stim)
+
+        responses = np.array([0, 3, 1, 0, 2, 5, 1])
+
+        rec_field = ReverseCorrelation.map_jumps([log_file, log_file],
+                                                 [responses, responses],
+                                                 batch_size=3)
+
+        contrast = self.shown(stim) / 127.5 - 1
+        expected = np.tensordot(responses, contrast, axes=1)
+        expected /= responses.sum()
+
+        assert rec_field.shape == (10, 20, 3)
+        np.testing.assert_allclose(rec_field, expected[::-1])
+
+        assert ReverseCorrelation.jump_logs([str(tmpdir.join('log'))]) == \
+            [log_file]
+
+        with pytest.raises(ValueError):
+            ReverseCorrelation.map_jumps([log_file], [responses[:3]])
+
+    def test_no_pystim_import(self):
+        import subprocess
+
+        # analysis must not need psychopy, a display, or config.ini
+        code = ('import sys; import ReverseCorrelation; '
+                'sys.exit("pyStim" in sys.modules)')
+        assert subprocess.call([sys.executable, '-c', code],
+                               cwd=os.path.abspath('pyStim')) == 0
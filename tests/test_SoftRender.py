@@ -0,0 +1,199 @@
+"""
+Tests for software renderer.
+"""
+
+import os
+import sys
+
+sys.path.append(os.path.abspath('pyStim'))
+
+import numpy as np
+import pytest
+
+import pyStim
+import SoftRender
+
+
+def solid(color, size=(1, 1)):
+    """Rgba texture of one color.
+    """
+    tex = np.ones(size + (4,), dtype=np.float32)
+    tex[:, :, :3] = color
+
+    return tex
+
+
+class TestSoftRender(object):
+
+    def setup_method(self):
+        self.win = SoftRender.Window(size=(8, 6), color=[-1, -1, -1])
+
+    def test_rectangle(self):
+        stim = SoftRender.GratingStim(self.win, tex=solid(1), size=(4, 2),
+                                      pos=(1, 0))
+        stim.draw()
+
+        expected = np.zeros((6, 8), dtype=bool)
+        expected[2:4, 3:7] = True
+
+        np.testing.assert_array_equal(self.win.buffer[:, :, 0] == 1,
+                                      expected)
+
+        # read back bottom row first, like glReadPixels
+        frame = self.win.read_frame(np.empty((6, 8, 3), dtype=np.uint8))
+        assert frame[2, 3, 0] == 255
+        assert frame[0, 0, 0] == 0
+
+        self.win.flip()
+        assert (self.win.buffer == -1).all()
+        assert self.win.num_flips == 1
+
+    def test_texture_layout(self):
+        # bottom row of texture drawn at bottom
+        tex = np.stack([solid(0.5, (1, 2)), solid(-0.5, (1, 2))])[:, 0]
+        stim = SoftRender.GratingStim(self.win, tex=tex, size=(2, 2))
+        stim.draw()
+
+        assert self.win.buffer[2, 3, 0] == 0.5
+        assert self.win.buffer[3, 3, 0] == -0.5
+
+        # turned clockwise, bottom row on left
+        self.win.clearBuffer()
+        stim.ori = 90
+        stim.draw()
+
+        assert self.win.buffer[2, 3, 0] == 0.5
+        assert self.win.buffer[2, 4, 0] == -0.5
+
+        # half a cycle along texture rows swaps them
+        self.win.clearBuffer()
+        stim.ori = 0
+        stim.phase = (0, 0.5)
+        stim.draw()
+
+        assert self.win.buffer[2, 3, 0] == -0.5
+
+    def test_sf(self):
+        # two cycles of a 2 texel grating across 4 pixels, centered, so
+        # starting half way through a texel
+        tex = np.stack([solid(1, (2, 1)), solid(-0.5, (2, 1))], axis=1)
+        stim = SoftRender.GratingStim(self.win, tex=tex[:, :, 0],
+                                      size=(4, 4))
+        stim.sf *= 2
+        stim.draw()
+
+        np.testing.assert_array_equal(self.win.buffer[1, 2:6, 0],
+                                      [-0.5, 1, -0.5, 1])
+
+    def test_circle_and_alpha(self):
+        win = SoftRender.Window(size=(40, 40), color=[0, 0, 0])
+
+        stim = SoftRender.GratingStim(win, tex=solid(1), size=(20, 20),
+                                      mask='circle', opacity=0.5)
+        stim.draw()
+
+        drawn = win.buffer[:, :, 0] > 0
+        assert abs(drawn.sum() - np.pi * 10 ** 2) < 10
+        assert not drawn[10, 10]
+        np.testing.assert_allclose(win.buffer[20, 20], 0.5)
+
+        # transparent texels leave frame as is
+        tex = solid(-1, (2, 2))
+        tex[:, :, 3] = -1
+        SoftRender.GratingStim(win, tex=tex, size=(20, 20)).draw()
+        np.testing.assert_allclose(win.buffer[20, 20], 0.5)
+
+        with pytest.raises(ValueError):
+            SoftRender.GratingStim(win, mask='gauss')
+
+    def test_elements(self):
+        x, y = np.meshgrid(np.arange(-1, 1) * 2, np.arange(-1, 1) * 2)
+        xys = np.column_stack((x.ravel(), y.ravel()))
+        colors = [[1, 1, 1], [0, 0, 0], [0.5, 0.5, 0.5], [-0.5, -0.5, -0.5]]
+
+        stim = SoftRender.ElementArrayStim(self.win, xys=xys, colors=colors,
+                                           nElements=4, sizes=(2, 2))
+        stim.setFieldPos((1, 1))
+        stim.draw()
+
+        # elements in rows from the bottom
+        np.testing.assert_array_equal(self.win.buffer[1:5:2, 2:6:2, 0],
+                                      [[1, 0], [0.5, -0.5]])
+        assert self.win.buffer[0, 0, 0] == -1
+
+        with pytest.raises(ValueError):
+            SoftRender.ElementArrayStim(self.win, xys=[[0, 0], [1.5, 0]],
+                                        sizes=1)
+
+
+class TestSoftBackend(object):
+
+    def setup_method(self):
+        pyStim.GlobalDefaults['display_size'] = [40, 30]
+        pyStim.GlobalDefaults['background'] = [-1, -1, -1]
+        pyStim.MyWindow.backend = 'numpy'
+        pyStim.MyWindow.make_win()
+
+    def teardown_method(self):
+        pyStim.MyWindow.close_win()
+        pyStim.MyWindow.backend = 'psychopy'
+        pyStim.MyWindow.visual = pyStim.visual
+        pyStim.GlobalDefaults['display_size'] = [400, 400]
+        pyStim.GlobalDefaults['background'] = [0., 0., 0.]
+        del pyStim.MyWindow.frame_trigger_list[:-1]
+
+    def render(self, params, frame=0):
+        program = pyStim.build_program([pyStim.StimInfo(params.pop('type'),
+                                                        params, 0)])
+        program.draw(frame)
+
+        frame = np.empty((30, 40, 3), dtype=np.uint8)
+        pyStim.MyWindow.read_frame(frame)
+        pyStim.MyWindow.win.clearBuffer()
+
+        return frame
+
+    def test_static(self):
+        frame = self.render(dict(type='static', shape='rectangle',
+                                 fill_mode='uniform', size=[10, 6],
+                                 location=[-5, 0], color_mode='rgb',
+                                 contrast_channel='all', color=[1, -1, 1],
+                                 duration=1))
+
+        assert isinstance(pyStim.MyWindow.win, SoftRender.Window)
+
+        on = frame[:, :, 0] == 255
+        assert on.sum() == 60
+        assert on[12:18, 10:20].all()
+        np.testing.assert_array_equal(frame[15, 15], [255, 0, 255])
+
+    def test_board(self):
+        frame = self.render(dict(type='static', shape='rectangle',
+                                 fill_mode='checkerboard',
+                                 check_type='board', num_check=4,
+                                 check_size=[5, 5], color_mode='rgb',
+                                 contrast_channel='all', color=[1, 1, 1],
+                                 duration=1))
+
+        # checks alternate along rows and columns, from 2.5 pixels below
+        # and left of center like elements
+        board = frame[2:22, 7:27, 0]
+        on = board[::5, ::5] == 255
+        np.testing.assert_array_equal(on, [[1, 0, 1, 0], [0, 1, 0, 1]] * 2)
+        assert (board.reshape(4, 5, 4, 5) == board[::5, ::5][:, None, :,
+                                                             None]).all()
+        assert (frame[22:, :, 0] == 0).all()
+        assert (frame[:, 27:, 0] == 0).all()
+
+    def test_board_texture_backend(self):
+        # not a power of two, so texture is padded
+        params = dict(type='static', shape='rectangle',
+                      fill_mode='checkerboard', check_type='random',
+                      num_check=6, check_size=[3, 4], color_mode='rgb',
+                      contrast_channel='all', color=[1, 1, 1], duration=1)
+
+        elements = self.render(dict(params))
+        texture = self.render(dict(params, check_backend='texture'))
+
+        np.testing.assert_array_equal(texture, elements)
+        assert (elements[:, :, 0] == 255).sum() > 0
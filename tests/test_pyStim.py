@@ -8,6 +8,7 @@ import sys
 sys.path.append(os.path.abspath('pyStim'))
 
 import pickle
+from random import Random
 
 import numpy as np
 import psychopy
@@ -15,6 +16,7 @@ import pytest
 from mock import Mock, patch
 
 import pyStim
+from FrameStore import FrameReader
 
 try:
     import u3
@@ -573,6 +575,100 @@ class TestGenTexture(object):
         np.testing.assert_array_equal(tex,
                                       np.array([1.0, 1.0, -1.0, -1.0, 1.0]))
 
+    def test_iml(self, tmpdir):
+        image = np.arange(1024 * 1536, dtype=np.uint32) % 8191
+        filename = str(tmpdir.join('test.iml'))
+        image.astype('>u2').tofile(filename)
+        image = image.reshape(1024, 1536) / 8190. * 2 - 1
+
+        stim = pyStim.StaticStim(fill_mode='image',
+                                 image_filename=filename,
+                                 image_size=[384, 384],
+                                 image_channel='green',
+                                 alpha=0.5)
+        tex = stim.load_iml()
+
+        assert tex.dtype == np.float32
+        assert tex.shape == (256, 384, 4)
+        np.testing.assert_allclose(tex[:, :, 1], image[::4, ::4], atol=1e-6)
+        np.testing.assert_array_equal(tex[:, :, 0], -1)
+        np.testing.assert_array_equal(tex[:, :, 3], 0.5)
+
+
+class TestTextureCache(object):
+
+    def setup_method(self):
+        pyStim.GlobalDefaults['background'] = [0., 0., 0.]
+        pyStim.TextureCache.clear()
+
+    def teardown_method(self):
+        pyStim.TextureCache.max_bytes = pyStim.config.getint(
+            'StimProgram', 'texture_cache_mb', fallback=256) * 2 ** 20
+        pyStim.TextureCache.clear()
+
+    def make_stim(self, **kwargs):
+        return pyStim.StaticStim(fill_mode='sine',
+                                 shape='rectangle',
+                                 size=[16, 16],
+                                 color_mode='intensity',
+                                 **kwargs)
+
+    def test_identical_stims_share(self):
+        tex = self.make_stim(intensity=1).gen_texture()
+        shared = self.make_stim(intensity=1).gen_texture()
+        other = self.make_stim(intensity=0.5).gen_texture()
+
+        assert shared is tex
+        assert not tex.flags.writeable
+        assert not np.array_equal(other, tex)
+        assert pyStim.TextureCache.stats()['hits'] == 1
+        assert pyStim.TextureCache.stats()['misses'] == 2
+
+    def test_timing_gets_copy(self):
+        tex = self.make_stim(intensity=1).gen_texture()
+        timed = self.make_stim(intensity=1, timing='sine').gen_texture()
+
+        assert timed is not tex
+        assert timed.flags.writeable
+        np.testing.assert_array_equal(timed, tex)
+
+    def test_lru_eviction(self):
+        pyStim.TextureCache.max_bytes = 2 * 16 * 16 * 4 * 4
+
+        first = self.make_stim(intensity=1).gen_texture()
+        self.make_stim(intensity=0.5).gen_texture()
+        # touch first so second is least recently used
+        self.make_stim(intensity=1).gen_texture()
+        self.make_stim(intensity=0.25).gen_texture()
+
+        stats = pyStim.TextureCache.stats()
+        assert stats['evictions'] == 1
+        assert stats['textures'] == 2
+        assert stats['bytes'] <= pyStim.TextureCache.max_bytes
+        assert self.make_stim(intensity=1).gen_texture() is first
+
+    def test_disk_cache(self, tmpdir):
+        disk_dir = pyStim.TextureCache.disk_dir
+        pyStim.TextureCache.disk_dir = str(tmpdir)
+
+        try:
+            tex = self.make_stim(intensity=1).gen_texture()
+            pyStim.TextureCache.clear()
+            loaded = self.make_stim(intensity=1).gen_texture()
+        finally:
+            pyStim.TextureCache.disk_dir = disk_dir
+
+        assert isinstance(loaded, np.memmap)
+        np.testing.assert_array_equal(loaded, tex)
+
+        # a disk hit is a hit, not a miss
+        stats = pyStim.TextureCache.stats()
+        assert (stats['hits'], stats['misses'], stats['disk_hits']) == \
+            (1, 0, 1)
+
+        # no temporary files left
+        assert [f.ext for f in tmpdir.listdir()] == ['.npy']
+
 
 class TestGenTiming(object):
 
@@ -1438,6 +1534,33 @@ class TestGenTiming(object):
         np.testing.assert_array_equal(stim.stim.tex,
                                       np.array([[[1.0, -1.0, -1.0, 1.0]]]))
 
+    def test_table_matches_per_frame(self):
+        pyStim.GlobalDefaults['background'] = [0., 0., 0.]
+        pyStim.GlobalDefaults['frame_rate'] = 60
+
+        for timing in ['sine', 'square', 'sawtooth', 'linear']:
+            stim = pyStim.StaticStim(fill_mode='uniform',
+                                     shape='rectangle',
+                                     size=[4, 4],
+                                     contrast_channel='red',
+                                     color_mode='intensity',
+                                     intensity=0.5,
+                                     intensity_dir='both',
+                                     contrast_opp='black',
+                                     alpha=1,
+                                     timing=timing,
+                                     period_mod=3,
+                                     duration=1)
+
+            stim.draw_times()
+            table = stim.gen_timing_table()
+
+            assert table.shape == (60, 3)
+
+            for frame in [0, 7, 15, 31, 59]:
+                np.testing.assert_almost_equal(table[frame],
+                                               stim.timing_color(frame))
+
     def test_small_stim(self):
         stim = pyStim.StaticStim()
         stim.draw_times()
@@ -1471,6 +1594,954 @@ class TestGenPhase(object):
                                       np.array([1., 2.]))
 
 
+class TestCaptureWriter(object):
+
+    @patch('pyStim.subprocess.Popen')
+    def test_frames_piped(self, popen, tmpdir):
+        written = []
+        popen.return_value.stdin.write.side_effect = \
+            lambda data: written.append(bytes(data))
+        popen.return_value.returncode = 0
+
+        capture = pyStim.CaptureWriter(str(tmpdir.join('capture')), '_test',
+                                       (4, 2), 60, num_buffers=2)
+
+        frames = np.random.RandomState(0).randint(0, 256, (5, 2, 4, 3))
+        for frame in frames:
+            buffer = capture.next_buffer()
+            buffer[...] = frame
+            capture.push(buffer)
+
+        capture.close()
+
+        # one ffmpeg for both movies, fed raw frames in order
+        assert popen.call_count == 1
+        args = popen.call_args[0][0]
+        assert args[args.index('-s') + 1] == '4x2'
+        assert args[args.index('-pix_fmt') + 1] == 'rgb24'
+        assert args[-1].endswith('capture_video_test_gray.mpg')
+        assert capture.files[0] in args
+
+        assert b''.join(written) == frames.astype(np.uint8).tobytes()
+        assert capture.num_frames == 5
+        assert popen.return_value.stdin.close.called
+        assert popen.return_value.wait.called
+
+    @patch('pyStim.subprocess.Popen', side_effect=OSError('not found'))
+    def test_no_ffmpeg(self, popen, tmpdir):
+        with pytest.raises(IOError):
+            pyStim.CaptureWriter(str(tmpdir), '_test', (4, 2), 60)
+
+
+class TestFrameCapture(object):
+
+    def setup_method(self):
+        # bottom row first, as read from window
+        self.frames = np.random.RandomState(0).randint(0, 256, (5, 6, 8, 3))
+        self.frames = self.frames.astype(np.uint8)
+
+    def capture(self, tmpdir, **kwargs):
+        capture = pyStim.FrameCapture(str(tmpdir), '_test', (8, 6), 60,
+                                      **kwargs)
+
+        for frame in self.frames:
+            buffer = capture.next_buffer()
+            buffer[...] = frame
+            capture.push(buffer)
+
+        capture.close()
+
+        return FrameReader(capture.files[0])
+
+    def test_lossless(self, tmpdir):
+        # 3 frames per chunk
+        reader = self.capture(tmpdir, chunk_mb=2 ** -11)
+
+        assert len(reader) == 5
+        assert reader.num_chunks == 2
+        np.testing.assert_array_equal(reader.index, np.arange(5))
+
+        for i in [3, 0, 4]:
+            np.testing.assert_array_equal(reader.image(i),
+                                          self.frames[i, ::-1])
+
+    def test_reduced(self, tmpdir):
+        reader = self.capture(tmpdir, downsample=4, channel='gray',
+                              compress=True)
+
+        assert reader.frame_shape == (1, 2)
+        assert reader.compressed
+
+        # bottom 2 rows dropped, as they do not fill a block
+        block = self.frames[2, 2:6, 4:8].astype(np.float64)
+        assert reader.image(2)[0, 1] == np.rint(block.mean())
+
+    def test_channel(self, tmpdir):
+        reader = self.capture(tmpdir, channel='green')
+
+        np.testing.assert_array_equal(reader.image(1),
+                                      self.frames[1, ::-1, :, 1])
+
+        with pytest.raises(ValueError):
+            pyStim.FrameCapture(str(tmpdir), '', (8, 6), 60, channel='alpha')
+
+        with pytest.raises(ValueError):
+            pyStim.FrameCapture(str(tmpdir), '', (8, 6), 60, downsample=7)
+
+
+class TestPrefetchRing(object):
+
+    def test_order(self):
+        def fill(index, out):
+            out[:] = index
+
+        ring = pyStim.PrefetchRing(fill, 10, (3,), num_slots=2)
+
+        for i in range(10):
+            slot, buf = ring.get()
+            np.testing.assert_array_equal(buf, [i, i, i])
+            ring.release(slot)
+
+        ring.stop()
+
+        assert len(ring.slots) == 2
+        assert not ring.thread.is_alive()
+
+    def test_error(self):
+        def fill(index, out):
+            if index == 1:
+                raise ValueError('bad slice')
+
+        ring = pyStim.PrefetchRing(fill, 10, (3,))
+        ring.release(ring.get()[0])
+
+        with pytest.raises(ValueError):
+            ring.get()
+
+        ring.stop()
+
+    def test_stop_while_waiting(self):
+        ring = pyStim.PrefetchRing(lambda index, out: None, 10, (3,),
+                                   num_slots=2)
+        ring.get()
+        ring.stop()
+
+        assert not ring.thread.is_alive()
+
+
+class TestImageJump(object):
+
+    def setup_method(self):
+        pyStim.GlobalDefaults['display_size'] = [20, 10]
+        pyStim.GlobalDefaults['background'] = [0., 0., 0.]
+
+    def teardown_method(self):
+        pyStim.GlobalDefaults['display_size'] = [400, 400]
+
+    def make_stim(self, tmpdir, **kwargs):
+        from PIL import Image
+
+        pixels = np.random.RandomState(0).randint(0, 256, (30, 40, 3))
+        filename = str(tmpdir.join('test.png'))
+        Image.fromarray(pixels.astype(np.uint8)).save(filename)
+
+        return pyStim.ImageJumpStim(image_filename=filename,
+                                    image_size=[80, 60],
+                                    num_jumps=3,
+                                    move_seed=2,
+                                    **kwargs)
+
+    @patch('pyStim.MyWindow.close_win')
+    def test_slices(self, close_win, tmpdir):
+        stim = self.make_stim(tmpdir)
+        tex = stim.gen_texture()
+
+        assert not close_win.called
+        assert tex.shape == (60, 80, 3)
+        assert len(stim.slice_list) == 3
+
+        for (y_low, y_high, x_low, x_high), s in zip(stim.slice_log,
+                                                      stim.slice_list):
+            assert s.shape == (10, 20, 3)
+            np.testing.assert_array_equal(s, tex[y_low:y_high, x_low:x_high])
+
+    def test_shuffle(self, tmpdir):
+        stim = self.make_stim(tmpdir, shuffle=True, image_channel='green')
+        tex = stim.gen_texture()
+
+        for i, (y_low, y_high, x_low, x_high) in enumerate(stim.slice_log):
+            s = np.empty((10, 20, 3))
+            stim.fill_slice(i, s)
+            orig = tex[y_low:y_high, x_low:x_high]
+            np.testing.assert_array_equal(s[:, :, [0, 2]], orig[:, :, [0, 2]])
+            np.testing.assert_array_equal(np.sort(s[:, :, 1], axis=None),
+                                          np.sort(orig[:, :, 1], axis=None))
+            assert not np.array_equal(s, orig)
+
+    def test_rebuild_from_seeds(self, tmpdir):
+        stim = self.make_stim(tmpdir, shuffle=True)
+        tex = stim.gen_texture()
+
+        shuffled = np.empty((3, 10, 20, 3))
+        for i in range(3):
+            stim.fill_slice(i, shuffled[i])
+
+        # rebuilt offline from logged coordinates and seeds, in one batch
+        slices = np.array([tex[y_low:y_high, x_low:x_high]
+                           for y_low, y_high, x_low, x_high in stim.slice_log])
+        rebuilt = pyStim.shuffle_pixels(slices, stim.shuffle_seeds)
+
+        np.testing.assert_array_equal(rebuilt, shuffled)
+        assert len(set(stim.shuffle_seeds)) == 3
+
+    def test_shuffle_batches(self, tmpdir):
+        stim = self.make_stim(tmpdir, shuffle=True)
+        stim.num_jumps = 7
+        tex = stim.gen_texture()
+
+        slices = np.array([tex[y_low:y_high, x_low:x_high]
+                           for y_low, y_high, x_low, x_high in stim.slice_log])
+        expected = pyStim.shuffle_pixels(slices, stim.shuffle_seeds)
+
+        shuffled = np.empty((7, 10, 20, 3))
+        with patch('pyStim.shuffle_pixels',
+                   wraps=pyStim.shuffle_pixels) as shuffle:
+            for i in range(7):
+                stim.fill_slice(i, shuffled[i])
+
+        # one batch per ring slots
+        assert shuffle.call_count == 3
+        np.testing.assert_array_equal(shuffled, expected)
+
+        # seeking back starts a new batch
+        stim.fill_slice(2, shuffled[0])
+        np.testing.assert_array_equal(shuffled[0], expected[2])
+
+    def test_log(self, tmpdir):
+        stim = self.make_stim(tmpdir, shuffle=True)
+        stim.gen_texture()
+        stim_list = [pyStim.StimInfo('jump', dict(shape='rectangle'), 0)]
+
+        log_dir = tmpdir.mkdir('log')
+        with patch('pyStim.log_path', return_value=str(log_dir)):
+            time_string = pyStim.log_stats(1, 1, 0, 30, 1., stim_list, [stim],
+                                           pyStim.localtime())
+
+        # image and slice log inside log folder
+        image = np.load(str(log_dir.join('Jumpinglog_' + time_string +
+                                         '.npy')))
+        assert image.shape == (60, 80, 3)
+
+        with open(str(log_dir.join('Jumpinglog_' + time_string +
+                                   '.txt'))) as f:
+            rows = [line.strip().strip('|').split('|') for line in f
+                    if line.startswith('|') and not line.startswith('|-')]
+
+        headers = [header.strip() for header in rows[0]]
+        table = np.array(rows[1:], dtype=np.int64)
+
+        assert headers[-1] == 'shuffle_seed'
+        np.testing.assert_array_equal(table[:, :4], stim.slice_log)
+        np.testing.assert_array_equal(table[:, 4], stim.shuffle_seeds)
+
+    @patch('pyStim.visual.GratingStim')
+    def test_reset(self, grating_stim, tmpdir):
+        pyStim.GlobalDefaults['frame_rate'] = 60
+        grating_stim.side_effect = lambda **kwargs: Mock(sf=1.)
+
+        stim = self.make_stim(tmpdir, move_delay=0.1)
+        stim.make_stim()
+        stim.draw_times()
+
+        def run():
+            shown = []
+            for frame in range(stim.start_stim, stim.end_stim):
+                stim.animate(frame)
+                shown.append(stim.stim.setTex.call_args[0][0].copy())
+            stim.ring.stop()
+            return np.array(shown)
+
+        first = run()
+        stim.reset()
+        second = run()
+
+        assert stim.slice_index == 3
+        np.testing.assert_array_equal(first, second)
+        np.testing.assert_array_equal(first[::6], stim.slice_list)
+
+
+class TestCompileFrames(object):
+
+    def test_timing_colors(self):
+        pyStim.GlobalDefaults['background'] = [0., 0., 0.]
+        pyStim.GlobalDefaults['frame_rate'] = 60
+
+        stim = pyStim.StaticStim(fill_mode='uniform',
+                                 shape='rectangle',
+                                 size=[4, 4],
+                                 contrast_channel='all',
+                                 color_mode='intensity',
+                                 intensity=1,
+                                 intensity_dir='both',
+                                 alpha=1,
+                                 timing='sine',
+                                 duration=1)
+
+        stim.draw_times()
+        stim.stim = Mock()
+        stim.stim.tex = stim.gen_texture()
+
+        frames = stim.compile_frames()
+
+        assert frames.num_frames == 60
+        assert frames.pos is None
+        assert frames.phase is None
+        np.testing.assert_almost_equal(frames.color[15],
+                                       np.array([1.0, 1.0, 1.0]))
+
+        stim.draw = Mock()
+        stim.draw_frame(frames, 45)
+        np.testing.assert_almost_equal(stim.stim.tex,
+                                       np.array([[[-1.0, -1.0, -1.0, 1.0]]]))
+        assert stim.draw.called
+
+    def test_phase(self):
+        pyStim.GlobalDefaults['frame_rate'] = 60
+
+        stim = pyStim.StaticStim(phase_speed=[60, 120],
+                                 duration=1)
+        stim.draw_times()
+        stim.stim = Mock()
+        stim.stim.phase = np.array([0., 0.])
+
+        frames = stim.compile_frames()
+
+        np.testing.assert_array_equal(frames.phase[0], np.array([1., 2.]))
+        np.testing.assert_array_equal(frames.phase[2], np.array([3., 6.]))
+
+    def test_program_triggers(self):
+        pyStim.GlobalDefaults['frame_rate'] = 60
+        del pyStim.MyWindow.frame_trigger_list[:-1]
+
+        stim = pyStim.StaticStim(delay=0.5,
+                                 duration=1,
+                                 trigger=True)
+        stim.stim = Mock()
+        num_frames = stim.draw_times()
+
+        program = pyStim.FrameProgram([stim], num_frames)
+
+        np.testing.assert_array_equal(np.flatnonzero(program.triggers),
+                                      np.array([30]))
+        np.testing.assert_array_equal(np.flatnonzero(program.active[0]),
+                                      np.arange(30, 90))
+
+        del pyStim.MyWindow.frame_trigger_list[:-1]
+
+    def test_program_schedule(self):
+        # flashes one after another, plus one stim drawn throughout
+        stims = []
+        for start, end in [(0, 100)] + [(i * 5, i * 5 + 5)
+                                        for i in range(20)]:
+            stim = Mock(start_stim=start, end_stim=end)
+            stim.compile_frames.return_value = None
+            stims.append(stim)
+
+        program = pyStim.FrameProgram(stims, 100)
+
+        drawn = []
+        for frame in range(100):
+            program.draw(frame)
+            drawn.append(list(program.on))
+
+        assert drawn[0] == [0, 1]
+        assert drawn[7] == [0, 2]
+        assert drawn[99] == [0, 20]
+        # only active stims are visited
+        assert stims[3].animate.call_count == 5
+        assert stims[0].animate.call_count == 100
+
+        # out of order frames are looked up
+        program.draw(12)
+        assert program.on == [0, 3]
+        program.draw(13)
+        assert program.on == [0, 3]
+        program.draw(15)
+        assert program.on == [0, 4]
+
+    def test_fast_forward(self):
+        stims = []
+        for start, end in [(10, 50), (0, 30), (60, 70)]:
+            stim = Mock(start_stim=start, end_stim=end)
+            stims.append(stim)
+
+        # compiled stims are looked up, others sought, not replayed
+        stims[1].compile_frames.return_value = pyStim.StimFrames(stims[1])
+        stims[0].compile_frames.return_value = None
+        stims[2].compile_frames.return_value = None
+
+        program = pyStim.FrameProgram(stims, 70)
+        program.fast_forward(40)
+
+        stims[0].seek.assert_called_once_with(40)
+        assert not stims[0].animate.called
+        assert not stims[1].seek.called
+        assert not stims[2].seek.called
+
+        program.draw(40)
+        assert program.on == [0]
+
+    def test_draw_at(self):
+        stims = []
+        for start, end in [(0, 50), (20, 30)]:
+            stim = Mock(start_stim=start, end_stim=end)
+            stims.append(stim)
+
+        stims[0].compile_frames.return_value = None
+        stims[1].compile_frames.return_value = pyStim.StimFrames(stims[1])
+
+        program = pyStim.FrameProgram(stims, 50)
+
+        for frame in [25, 3, 25]:
+            program.draw_at(frame)
+
+        assert [call[0][0] for call in stims[0].seek.call_args_list] == \
+            [25, 3, 25]
+        assert [call[0][0] for call in stims[0].animate.call_args_list] == \
+            [25, 3, 25]
+        assert stims[1].draw_frame.call_count == 2
+
+
+class TestTrajectory(object):
+
+    def setup_method(self):
+        pyStim.GlobalDefaults['frame_rate'] = 60
+        del pyStim.MyWindow.frame_trigger_list[:-1]
+
+    def teardown_method(self):
+        del pyStim.MyWindow.frame_trigger_list[:-1]
+
+    def make_stim(self, stim_class, **kwargs):
+        stim = stim_class(speed=600, **kwargs)
+        stim.stim = Mock()
+        stim.stim.size = np.array([50., 100.])
+        stim.stim.ori = 0
+        stim.stim.pos = np.array([0., 0.])
+        stim.small_stim = None
+
+        return stim
+
+    def test_directions(self):
+        stim = self.make_stim(pyStim.MovingStim,
+                              num_dirs=4,
+                              start_radius=100,
+                              delay=0.5,
+                              ori_with_dir=True,
+                              trigger=True)
+        stim.draw_times()
+
+        assert stim.num_frames == 20
+        assert stim.end_stim == 110
+        assert len(stim.x_array) == 80
+        assert stim.log[0] == [180, 270, 0, 90]
+        assert stim.segment_frames == [30, 50, 70, 90]
+        # logged as in older versions: first segment at frame 0, and stim
+        # position before each segment
+        assert stim.log[1] == [0, 50, 70, 90]
+        np.testing.assert_allclose(stim.log[2],
+                                   [[0, 0], [0, -90], [-90, 0], [0, 90]],
+                                   atol=1e-9)
+        assert list(pyStim.MyWindow.frame_trigger_list)[:-1] == [30, 50, 70,
+                                                                 90]
+
+        # each direction crosses through the center
+        np.testing.assert_allclose(stim.y_array[[0, 19]], [100, -90])
+        np.testing.assert_allclose(stim.x_array[[20, 39]], [100, -90],
+                                   atol=1e-9)
+        np.testing.assert_array_equal(stim.ori_array[[0, 19, 20, 79]],
+                                      [0, 0, 90, 270])
+
+        # nothing generated while animating
+        stim.gen_pos = Mock(side_effect=AssertionError)
+        stim.draw = Mock()
+
+        for frame in range(stim.start_stim, stim.end_stim):
+            stim.animate(frame)
+
+        assert stim.draw.call_count == 80
+        stim.stim.setPos.assert_called_with((stim.x_array[-1],
+                                             stim.y_array[-1]))
+        assert stim.stim.ori == 270
+
+    def test_move_delay(self):
+        pyStim.GlobalDefaults['display_size'] = [400, 400]
+
+        stim = self.make_stim(pyStim.MovingStim,
+                              num_dirs=2,
+                              start_radius=100,
+                              start_dir=45,
+                              move_delay=0.5)
+        stim.draw_times()
+
+        assert stim.num_frames == 50
+        assert stim.end_stim == 100
+
+        # same as stepping one frame at a time
+        dx = 10 * np.sin(np.pi * 225 / 180.)
+        expected = [stim.x_array[0] + i * dx for i in range(20)]
+        np.testing.assert_array_equal(stim.x_array[:20], expected)
+
+        np.testing.assert_array_equal(stim.x_array[20:50], 250)
+        np.testing.assert_array_equal(stim.y_array[20:50], 250)
+        np.testing.assert_array_equal(stim.x_array[70:], 250)
+
+    def test_random_segments(self):
+        stim = self.make_stim(pyStim.RandomlyMovingStim,
+                              duration=1,
+                              travel_distance=100,
+                              move_seed=3,
+                              trigger=True)
+        stim.draw_times()
+
+        assert stim.num_frames == 10
+        assert len(stim.x_array) == 60
+        assert stim.log[1] == [0, 10, 20, 30, 40, 50]
+        assert stim.segment_frames == stim.log[1]
+        assert len(stim.log[0]) == 6
+
+        # each segment starts where the last one ended
+        starts = np.column_stack((stim.x_array, stim.y_array))[::10]
+        ends = np.column_stack((stim.x_array, stim.y_array))[9::10]
+        np.testing.assert_array_equal(starts[1:], ends[:-1])
+        np.testing.assert_array_equal(starts, stim.log[2])
+
+        frames = stim.compile_frames()
+
+        np.testing.assert_array_equal(frames.pos[:, 0], stim.x_array)
+        np.testing.assert_array_equal(frames.pos[:, 1], stim.y_array)
+        assert frames.ori is None
+
+
+class TestTableStim(object):
+
+    def setup_method(self):
+        pyStim.GlobalDefaults['frame_rate'] = 60
+        pyStim.GlobalDefaults['pix_per_micron'] = 1
+        pyStim.GlobalDefaults['pref_dir'] = -1
+        pyStim.TableStim.tables.clear()
+        del pyStim.MyWindow.frame_trigger_list[:-1]
+
+    def teardown_method(self):
+        del pyStim.MyWindow.frame_trigger_list[:-1]
+
+    def make_stim(self, tmpdir, lines, **kwargs):
+        filename = str(tmpdir.join('table.txt'))
+        with open(filename, 'w') as f:
+            f.write('\n'.join(lines) + '\n')
+
+        stim = pyStim.TableStim(table_filename=filename, **kwargs)
+        stim.stim = Mock()
+        stim.stim.size = np.array([50., 100.])
+        stim.stim.ori = 0
+        stim.stim.pos = np.array([0., 0.])
+
+        return stim
+
+    def test_polar(self, tmpdir):
+        stim = self.make_stim(tmpdir, ['10 0', '20 0', '30 1', '40 0'],
+                              table_type='polar',
+                              num_dirs=4,
+                              start_dir=0)
+
+        with patch.object(pyStim.TableStim, 'parse_table',
+                          wraps=pyStim.TableStim.parse_table) as parse:
+            stim.draw_times()
+
+        # parsed once for all directions
+        assert parse.call_count == 1
+
+        assert stim.num_frames == 4
+        assert len(stim.x_array) == 16
+        assert stim.trigger_frames == [0, 2, 3]
+
+        # first direction along -y, next rotated by 90 degrees
+        np.testing.assert_allclose(stim.y_array[:4], [-10, -20, -30, -40],
+                                   atol=1e-9)
+        np.testing.assert_allclose(stim.x_array[4:8], [-10, -20, -30, -40],
+                                   atol=1e-9)
+        np.testing.assert_allclose(stim.x_array[:4], 0, atol=1e-9)
+
+    def test_coordinate(self, tmpdir):
+        stim = self.make_stim(tmpdir, ['1 2 0', '3 4 0', '5 6 0'],
+                              table_type='coordinate',
+                              num_dirs=1,
+                              move_delay=0.05)
+        stim.draw_times()
+
+        assert stim.trigger_frames == [0, 2]
+        np.testing.assert_array_equal(stim.x_array[:3], [1, 3, 5])
+        np.testing.assert_array_equal(stim.y_array[:3], [2, 4, 6])
+        assert len(stim.x_array) == 6
+
+    def test_directions(self, tmpdir):
+        pyStim.GlobalDefaults['pref_dir'] = 270
+
+        stim = self.make_stim(tmpdir, ['600 90 50', '1200 -$ 50'],
+                              table_type='directions',
+                              num_dirs=1,
+                              location=[0, 0])
+        stim.draw_times()
+
+        # 3 frames right, then 3 frames back left at double speed
+        np.testing.assert_allclose(stim.x_array,
+                                   [0, 10, 20, 20, 0, -20], atol=1e-9)
+        np.testing.assert_allclose(stim.y_array, 0, atol=1e-9)
+        assert stim.trigger_frames == [0, 3, 5]
+
+    def test_extra_columns(self, tmpdir):
+        stim = self.make_stim(tmpdir, ['1 2 0 note', '3 4 1', '5 6 0 7 8'],
+                              table_type='coordinate',
+                              num_dirs=1)
+        stim.draw_times()
+
+        assert stim.trigger_frames == [0, 1, 2]
+        np.testing.assert_array_equal(stim.x_array[:3], [1, 3, 5])
+        np.testing.assert_array_equal(stim.y_array[:3], [2, 4, 6])
+
+    def test_cache(self, tmpdir):
+        stim = self.make_stim(tmpdir, ['10 0', '20 0'], table_type='polar')
+        stim.draw_times()
+
+        # edited file replaces its entry
+        stim = self.make_stim(tmpdir, ['10 0', '20 0', '30 0'],
+                              table_type='polar')
+        os.utime(stim.table_filename, (0, 0))
+        stim.draw_times()
+
+        assert list(pyStim.TableStim.tables) == [
+            os.path.abspath(stim.table_filename)]
+        assert stim.num_frames == 3
+
+    def test_bad_table(self, tmpdir):
+        stim = self.make_stim(tmpdir, ['10 0', '20'],
+                              table_type='polar')
+
+        with pytest.raises(IOError):
+            stim.draw_times()
+
+        stim = self.make_stim(tmpdir, ['1 2', '3 4'],
+                              table_type='coordinate')
+
+        with pytest.raises(IOError):
+            stim.draw_times()
+
+
+class TestBoardTexture(object):
+
+    def test_random_binary(self):
+        for size in [0, 1, 100, 4096]:
+            loop_random, bulk_random = Random(3), Random(3)
+            expected = [loop_random.randint(0, 1) for _ in range(size)]
+
+            np.testing.assert_array_equal(
+                pyStim.random_binary(bulk_random, size), expected)
+            # left in same state
+            assert bulk_random.random() == loop_random.random()
+
+    @patch('pyStim.visual.ElementArrayStim')
+    def test_xys(self, element_stim):
+        pyStim.GlobalDefaults['background'] = [0., 0., 0.]
+
+        stim = pyStim.board_texture_class(pyStim.StaticStim,
+                                          fill_mode='checkerboard',
+                                          check_type='random',
+                                          num_check=4,
+                                          check_size=[10, 20],
+                                          fill_seed=2)
+        stim.make_stim()
+
+        xys = element_stim.call_args[1]['xys']
+        assert xys[1].tolist() == [-10, -40]
+        assert xys[4].tolist() == [-20, -20]
+        assert len(xys) == 16
+
+        fill_random = Random(2)
+        np.testing.assert_array_equal(
+            stim.index, [fill_random.randint(0, 1) for _ in range(16)])
+
+    @patch('pyStim.visual.ElementArrayStim')
+    def test_timed_board(self, element_stim):
+        pyStim.GlobalDefaults['background'] = [0., 0., 0.]
+        pyStim.GlobalDefaults['frame_rate'] = 60
+
+        stim = pyStim.board_texture_class(pyStim.StaticStim,
+                                          fill_mode='checkerboard',
+                                          check_type='board',
+                                          num_check=4,
+                                          timing='sine',
+                                          duration=0.5)
+        stim.make_stim()
+        stim.draw_times()
+
+        assert stim.compile_frames() is None
+        for frame in range(stim.start_stim, stim.end_stim):
+            stim.animate(frame)
+
+        assert element_stim.return_value.draw.call_count == 30
+
+    @patch('pyStim.visual.GratingStim')
+    @patch('pyStim.visual.ElementArrayStim')
+    def test_texture_backend(self, element_stim, grating_stim):
+        pyStim.GlobalDefaults['background'] = [0., 0., 0.]
+
+        kwargs = dict(fill_mode='checkerboard',
+                      check_type='random',
+                      num_check=5,
+                      check_size=[10, 20],
+                      contrast_channel='green')
+
+        elements = pyStim.board_texture_class(pyStim.StaticStim, **kwargs)
+        elements.make_stim()
+        xys = element_stim.call_args[1]['xys']
+        colors = element_stim.call_args[1]['colors']
+
+        board = pyStim.board_texture_class(pyStim.StaticStim,
+                                           check_backend='texture',
+                                           **kwargs)
+        board.make_stim()
+        tex = grating_stim.call_args[1]['tex']
+        pos = grating_stim.call_args[1]['pos']
+        size = grating_stim.call_args[1]['size']
+
+        assert not grating_stim.call_args[1]['interpolate']
+        # padded to square power of two, board in bottom left
+        assert tex.shape == (8, 8, 4)
+        np.testing.assert_array_equal(tex[:5, :5, 0:3].reshape(-1, 3), colors)
+
+        # only texels of board mapped across quad, as psychopy lays them out
+        cycles = grating_stim.call_args[1]['sf'] * size
+        phase = np.array(grating_stim.call_args[1]['phase'])
+        np.testing.assert_allclose(-cycles / 2 - phase + 0.5, [0, 0])
+        np.testing.assert_allclose(cycles / 2 - phase + 0.5, [5 / 8.] * 2)
+
+        # texel centers line up with element centers
+        texel_x = pos[0] - size[0] / 2. + (np.arange(5) + 0.5) * 10
+        texel_y = pos[1] - size[1] / 2. + (np.arange(5) + 0.5) * 20
+        np.testing.assert_array_equal(texel_x, np.unique(xys[:, 0]))
+        np.testing.assert_array_equal(texel_y, np.unique(xys[:, 1]))
+
+
+class TestNoiseEngine(object):
+
+    def test_palette(self):
+        engine = pyStim.NoiseEngine(100, 1, 'ternary',
+                                    mid=[0., 0., 0.],
+                                    amp=[0., 0.5, 0.],
+                                    channel=1)
+
+        np.testing.assert_array_equal(engine.palette,
+                                      [[-1, -0.5, -1], [-1, 0, -1],
+                                       [-1, 0.5, -1]])
+
+        colors = engine.next_colors(np.empty((100, 3)))
+        assert set(colors[:, 1]) == {-0.5, 0, 0.5}
+
+    def test_ring_matches_sync(self):
+        for distribution in ['binary', 'ternary', 'gaussian']:
+            sync = pyStim.NoiseEngine(50, 7, distribution, batch_size=4)
+            ring = pyStim.NoiseEngine(50, 7, distribution, batch_size=4)
+            ring.start()
+
+            out = np.empty((50, 3))
+            expected = [sync.next_colors(out).copy() for _ in range(10)]
+            # stepping skips frames rather than changing them
+            got = [ring.next_colors(out).copy()]
+            got += [ring.next_colors(out, step=3).copy() for _ in range(3)]
+            ring.stop()
+
+            np.testing.assert_array_equal(got, expected[0::3])
+
+    def test_seek(self):
+        for distribution in ['binary', 'gaussian']:
+            sync = pyStim.NoiseEngine(50, 7, distribution, batch_size=4)
+            out = np.empty((50, 3))
+            expected = [sync.next_colors(out).copy() for _ in range(12)]
+
+            # any frame on its own, then on from there
+            engine = pyStim.NoiseEngine(50, 7, distribution, batch_size=4)
+            engine.start()
+            for index in [9, 2, 5]:
+                engine.seek(index)
+                got = [engine.next_colors(out).copy() for _ in range(3)]
+                np.testing.assert_array_equal(got,
+                                              expected[index:index + 3])
+
+            assert engine.ring is None
+
+            # drawing ahead again from there
+            engine.seek(4)
+            engine.start()
+            got = [engine.next_colors(out).copy() for _ in range(8)]
+            engine.stop()
+            np.testing.assert_array_equal(got, expected[4:12])
+
+    def test_streams(self):
+        engine = pyStim.NoiseEngine(50, 7, 'ternary', batch_size=4)
+        batch = np.empty((4, 50), dtype=np.uint8)
+        engine.fill(2, batch)
+
+        # frame n is drawn from the seeded stream jumped n times
+        for i in range(4):
+            random = np.random.Generator(np.random.Philox(7).jumped(8 + i))
+            expected = random.random(50, dtype=np.float32) * 3
+            np.testing.assert_array_equal(batch[i], expected.astype(np.uint8))
+
+    def test_gaussian(self):
+        engine = pyStim.NoiseEngine(10000, 1, 'gaussian', channel=3)
+        colors = engine.next_colors(np.empty((10000, 3)))
+
+        assert abs(colors[:, 0].std() - 1 / 3.) < 0.01
+        np.testing.assert_array_equal(colors[:, 0], colors[:, 2])
+
+    @patch('pyStim.visual.ElementArrayStim')
+    def test_noise_rate(self, element_stim):
+        pyStim.GlobalDefaults['background'] = [0., 0., 0.]
+        pyStim.GlobalDefaults['frame_rate'] = 60
+
+        stim = pyStim.board_texture_class(pyStim.StaticStim,
+                                          fill_mode='checkerboard',
+                                          check_type='noisy noise',
+                                          num_check=8,
+                                          noise_rate=10,
+                                          duration=1)
+        stim.make_stim()
+        stim.draw_times()
+
+        updates = []
+        for frame in range(stim.start_stim, stim.end_stim):
+            before = stim.colors.copy()
+            stim.gen_timing(frame)
+            updates.append(not np.array_equal(before, stim.colors))
+
+        stim.ring.stop()
+
+        assert np.flatnonzero(updates).tolist() == list(range(6, 60, 6))
+        assert element_stim.return_value.setColors.call_count == 9
+
+    @patch('pyStim.visual.ElementArrayStim')
+    def test_reset(self, element_stim):
+        pyStim.GlobalDefaults['background'] = [0., 0., 0.]
+        pyStim.GlobalDefaults['frame_rate'] = 60
+
+        stim = pyStim.board_texture_class(pyStim.StaticStim,
+                                          fill_mode='checkerboard',
+                                          check_type='noisy noise',
+                                          num_check=8,
+                                          noise_rate=10,
+                                          duration=1)
+        stim.make_stim()
+        stim.draw_times()
+
+        def run():
+            shown = [stim.colors.copy()]
+            for frame in range(stim.start_stim, stim.end_stim):
+                stim.gen_timing(frame)
+                shown.append(stim.colors.copy())
+            stim.ring.stop()
+            return np.array(shown)
+
+        first = run()
+        stim.reset()
+        second = run()
+
+        # same noise every rep
+        np.testing.assert_array_equal(first, second)
+        assert not np.array_equal(first[0], first[-1])
+
+    @patch('pyStim.visual.ElementArrayStim')
+    def test_board_seek(self, element_stim):
+        pyStim.GlobalDefaults['background'] = [0., 0., 0.]
+        pyStim.GlobalDefaults['frame_rate'] = 60
+
+        stim = pyStim.board_texture_class(pyStim.StaticStim,
+                                          fill_mode='checkerboard',
+                                          check_type='noisy noise',
+                                          num_check=8,
+                                          noise_rate=10,
+                                          delay=1 / 6.,
+                                          duration=1)
+        stim.make_stim()
+        stim.draw_times()
+
+        shown = {}
+        for frame in range(stim.start_stim, stim.end_stim):
+            stim.gen_timing(frame)
+            shown[frame] = stim.colors.copy()
+        stim.ring.stop()
+
+        stim.reset()
+        for frame in [50, 10, 17, 35]:
+            stim.seek(frame)
+            stim.gen_timing(frame)
+            np.testing.assert_array_equal(stim.colors, shown[frame])
+
+        # carries on from there
+        stim.gen_timing(41)
+        np.testing.assert_array_equal(stim.colors, shown[41])
+
+    @patch('pyStim.visual.ElementArrayStim')
+    def test_record(self, element_stim, tmpdir):
+        pyStim.GlobalDefaults['background'] = [0., 0., 0.]
+        pyStim.GlobalDefaults['frame_rate'] = 60
+
+        stim = pyStim.board_texture_class(pyStim.StaticStim,
+                                          fill_mode='checkerboard',
+                                          check_type='noisy noise',
+                                          num_check=8,
+                                          noise_rate=10,
+                                          duration=1)
+        stim.make_stim()
+        stim.draw_times()
+        stim.start_recording(str(tmpdir))
+
+        shown = [stim.noise.frame.copy()]
+        for frame in range(stim.start_stim, stim.end_stim):
+            stim.gen_timing(frame)
+            if not np.array_equal(shown[-1], stim.noise.frame):
+                shown.append(stim.noise.frame.copy())
+
+        stim.ring.stop()
+        stim.recorder.close()
+
+        reader = FrameReader(str(tmpdir))
+
+        assert reader.packed
+        assert reader.index.tolist() == list(range(0, 60, 6))
+        np.testing.assert_array_equal(next(reader.chunks())[1], shown)
+
+
+class TestMain(object):
+
+    @patch('pyStim.animation_loop', side_effect=RuntimeError('failed'))
+    @patch('pyStim.build_program')
+    def test_cleanup_on_error(self, build_program, animation_loop):
+        stim = Mock(fill_mode='uniform')
+        build_program.return_value = Mock(stims=[stim], num_frames=10)
+        ring, recorder = stim.ring, stim.recorder
+
+        pyStim.GlobalDefaults['trigger_wait'] = 0
+        try:
+            result = pyStim.main([Mock()], verbose=False)
+        finally:
+            pyStim.GlobalDefaults['trigger_wait'] = 6
+
+        assert result[:2] == ('failed', 'error')
+        # background work stopped and recording saved despite error
+        ring.stop.assert_called_once_with()
+        recorder.close.assert_called_once_with()
+        assert stim.recorder is None
+
+
 @pytest.mark.xfail
 class TestSetRGB(object):
 